@@ -0,0 +1,366 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extensions import TransactionRollbackError
+
+import tracing
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+HEALTHCHECK_INTERVAL = float(os.environ.get('DB_HEALTHCHECK_INTERVAL', '30'))
+# Реплика для чтения (необязательно): см. read_connection
+REPLICA_DSN = os.environ.get('DATABASE_URL_READONLY', '')
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', '30'))
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', '10'))
+
+T = TypeVar('T')
+
+
+class PoolExhausted(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_ACQUIRE_TIMEOUT'''
+
+
+class ConnectionPool:
+    '''
+    Пул соединений с Postgres на уровне модуля: живёт между тёплыми вызовами
+    функции, поэтому в установившемся режиме запрос не платит за TCP+TLS+auth.
+    Перед выдачей соединения, простаивавшего дольше HEALTHCHECK_INTERVAL,
+    выполняется SELECT 1; сломанные соединения закрываются и пересоздаются.
+    '''
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE, connect_timeout: Optional[int] = None):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self._idle: List[Tuple[Any, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._in_use = 0
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'reconnects': 0, 'discarded': 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _connect(self):
+        options: Dict[str, Any] = {}
+        if self.connect_timeout:
+            options['connect_timeout'] = self.connect_timeout
+        return psycopg2.connect(
+            self.dsn,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+            **options,
+        )
+
+    def _is_alive(self, conn, idle_since: float) -> bool:
+        '''Проверка соединения перед выдачей из пула'''
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < HEALTHCHECK_INTERVAL:
+            return True
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn) -> None:
+        self._count('discarded')
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _take_idle(self) -> Tuple[Optional[Any], bool]:
+        '''Берёт самое свежее живое соединение; второй элемент - были ли мёртвые'''
+        found_dead = False
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None, found_dead
+                conn, idle_since = self._idle.pop()
+            if self._is_alive(conn, idle_since):
+                return conn, found_dead
+            found_dead = True
+            self._discard(conn)
+
+    def acquire(self, autocommit: bool = False):
+        if not self._slots.acquire(timeout=POOL_ACQUIRE_TIMEOUT):
+            raise PoolExhausted(f'Пул соединений исчерпан ({self.max_size})')
+        try:
+            conn, found_dead = self._take_idle()
+            if conn is not None:
+                self._count('hits')
+            else:
+                self._count('reconnects' if found_dead else 'misses')
+                conn = self._connect()
+            conn.autocommit = autocommit
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def release(self, conn) -> None:
+        try:
+            if conn.closed:
+                self._discard(conn)
+            else:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, autocommit: bool = False) -> Iterator[Any]:
+        with tracing.phase('connect'):
+            conn = self.acquire(autocommit)
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed and not autocommit:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), in_use=self._in_use, max_size=self.max_size)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: Optional[str] = None, connect_timeout: Optional[int] = None) -> ConnectionPool:
+    """Пул для DSN (по умолчанию DATABASE_URL), создаётся один раз на воркер"""
+    dsn = dsn or os.environ.get('DATABASE_URL')
+    if not dsn:
+        raise RuntimeError('DATABASE_URL не найден в переменных окружения')
+    pool = _pools.get(dsn)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(dsn, ConnectionPool(dsn, connect_timeout=connect_timeout))
+    return pool
+
+
+def connection(autocommit: bool = False, dsn: Optional[str] = None):
+    """Соединение из пула: with db.connection() as conn: ..."""
+    return get_pool(dsn).connection(autocommit)
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Счётчики попаданий/промахов по всем пулам воркера"""
+    return {pool.dsn.rsplit('@', 1)[-1]: pool.stats() for pool in list(_pools.values())}
+
+
+class ReplicaFailed(Exception):
+    '''Чтение на реплике оборвалось; его можно повторить на основной базе'''
+
+
+# Отставание реплики в секундах; 0, если всё полученное уже применено или это не реплика
+REPLICA_LAG = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+
+class ReplicaRouter:
+    '''
+    Решает, идёт ли чтение на реплику. Раз в REPLICA_CHECK_INTERVAL на выданном
+    соединении проверяется отставание; реплика, отстающая больше
+    REPLICA_MAX_LAG_SECONDS, не используется до следующей проверки. Реплика,
+    к которой не удалось подключиться или на которой оборвался запрос,
+    выключается на REPLICA_RETRY_SECONDS - всё это время чтения идут в основную базу.
+    '''
+
+    def __init__(self, dsn: str, max_lag: float = REPLICA_MAX_LAG_SECONDS,
+                 check_interval: float = REPLICA_CHECK_INTERVAL, retry_seconds: float = REPLICA_RETRY_SECONDS,
+                 sticky_seconds: float = READ_YOUR_WRITES_SECONDS):
+        self.dsn = dsn
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_seconds = retry_seconds
+        self.sticky_seconds = sticky_seconds
+        self.lag = 0.0
+        self._checked_at = float('-inf')
+        self._down_until = float('-inf')
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            'replica': 0, 'primary_sticky': 0, 'primary_lag': 0, 'primary_down': 0, 'primary_busy': 0,
+            'replica_failures': 0
+        }
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def route(self, last_write_at: Optional[float]) -> str:
+        """'replica' или причина, по которой чтение идёт в основную базу"""
+        if last_write_at is not None and time.time() - last_write_at < self.sticky_seconds:
+            # Пользователь только что писал: реплика может ещё не получить его лид
+            return 'primary_sticky'
+        now = time.monotonic()
+        with self._lock:
+            if now < self._down_until:
+                return 'primary_down'
+            if self.lag > self.max_lag and now - self._checked_at < self.check_interval:
+                return 'primary_lag'
+        return 'replica'
+
+    def check_due(self) -> bool:
+        """Пора ли проверить отставание; проверяет один поток, остальные верят прошлому замеру"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return False
+            self._checked_at = now
+            return True
+
+    def record_lag(self, lag: float) -> bool:
+        with self._lock:
+            self.lag = lag
+        return lag <= self.max_lag
+
+    def mark_down(self) -> None:
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_seconds
+            self._stats['replica_failures'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, lag_seconds=round(self.lag, 3), down=time.monotonic() < self._down_until)
+
+
+_router: Optional[ReplicaRouter] = None
+
+
+def get_router() -> Optional[ReplicaRouter]:
+    """Маршрутизатор чтений или None, если DATABASE_URL_READONLY не задан"""
+    global _router
+    if _router is None and REPLICA_DSN:
+        with _pools_lock:
+            if _router is None:
+                _router = ReplicaRouter(REPLICA_DSN)
+    return _router
+
+
+def _acquire_replica(router: ReplicaRouter, autocommit: bool) -> Tuple[Optional[Any], str]:
+    """(соединение с репликой, 'replica') или (None, причина чтения из основной базы)"""
+    pool = get_pool(router.dsn, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+    try:
+        with tracing.phase('connect'):
+            conn = pool.acquire(autocommit)
+    except PoolExhausted:
+        # Реплика занята, но исправна - это чтение обслужит основная база
+        return None, 'primary_busy'
+    except psycopg2.Error:
+        router.mark_down()
+        return None, 'primary_down'
+    if not router.check_due():
+        return conn, 'replica'
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(REPLICA_LAG)
+            lag = float(cursor.fetchone()[0])
+        conn.autocommit = autocommit
+    except psycopg2.Error:
+        pool.release(conn)
+        router.mark_down()
+        return None, 'primary_down'
+    if not router.record_lag(lag):
+        pool.release(conn)
+        return None, 'primary_lag'
+    return conn, 'replica'
+
+
+@contextmanager
+def read_connection(autocommit: bool = True, last_write_at: Optional[float] = None) -> Iterator[Any]:
+    """
+    Соединение для чтения: реплика из DATABASE_URL_READONLY, если она задана,
+    доступна и не отстаёт, иначе основная база. last_write_at (unix-время
+    последней записи пользователя) моложе READ_YOUR_WRITES_SECONDS тоже
+    отправляет чтение в основную базу. Обрыв на реплике - ReplicaFailed (см. read).
+    """
+    router = get_router()
+    conn = None
+    if router is not None:
+        reason = router.route(last_write_at)
+        if reason == 'replica':
+            conn, reason = _acquire_replica(router, autocommit)
+        router.count(reason)
+    if conn is None:
+        with connection(autocommit) as primary:
+            yield primary
+        return
+
+    pool = get_pool(router.dsn)
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        router.mark_down()
+        raise ReplicaFailed(str(e)) from e
+    except TransactionRollbackError as e:
+        # Запрос отменён из-за конфликта с применением WAL - реплика исправна
+        raise ReplicaFailed(str(e)) from e
+    except Exception:
+        if not conn.closed and not autocommit:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        pool.release(conn)
+
+
+def read(fn: Callable[[Any], T], autocommit: bool = True, last_write_at: Optional[float] = None) -> T:
+    """fn(conn) через read_connection; оборвавшееся на реплике чтение повторяется на основной базе"""
+    try:
+        with read_connection(autocommit, last_write_at) as conn:
+            return fn(conn)
+    except ReplicaFailed:
+        with connection(autocommit) as conn:
+            return fn(conn)
+
+
+def read_stats() -> Optional[Dict[str, Any]]:
+    """Куда шли чтения воркера: реплика или основная база (и почему)"""
+    router = get_router()
+    return router.stats() if router is not None else None
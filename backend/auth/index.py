@@ -1,10 +1,23 @@
-import json
-import hashlib
 import os
-from typing import Dict, Any, Optional
-import psycopg2
+from typing import Dict, Any
+from psycopg2 import errors
 from psycopg2.extras import RealDictCursor
 
+import db
+import passwords
+import runtime
+import throttle
+import tokens
+import tracing
+
+service = runtime.Service(
+    allow_headers=('Content-Type', 'X-User-Id', 'X-Auth-Token'),
+    error_fields={'success': False},
+    messages={'invalid_json': 'Неверный JSON', 'internal': 'Внутренняя ошибка сервера'}
+)
+
+login_throttle = throttle.LoginThrottle()
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Система аутентификации - регистрация и вход пользователей
@@ -12,212 +25,153 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           context - объект с атрибутами request_id, function_name
     Returns: HTTP response dict с токеном или ошибкой
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    # Handle CORS OPTIONS request
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    return service(event, context)
+
+@service.route('POST')
+def handle_auth(request: runtime.Request) -> Dict[str, Any]:
+    body_data = request.json()
+        
+    action = body_data.get('action')  # 'register' или 'login'
+    username = body_data.get('username', '').strip()
+    password = body_data.get('password', '')
+    email = body_data.get('email', '').strip()
     
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+    if not username or not password:
+        return service.error(400, 'Логин и пароль обязательны')
     
-    try:
-        body_str = event.get('body', '{}')
-        if isinstance(body_str, str):
-            body_data = json.loads(body_str)
-        else:
-            body_data = body_str
-            
-        action = body_data.get('action')  # 'register' или 'login'
-        username = body_data.get('username', '').strip()
-        password = body_data.get('password', '')
-        email = body_data.get('email', '').strip()
-        
-        if not username or not password:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': False, 'error': 'Логин и пароль обязательны'}),
-                'isBase64Encoded': False
-            }
+    # Подключение к базе данных
+    if not os.environ.get('DATABASE_URL'):
+        raise Exception('DATABASE_URL не найден в переменных окружения')
+    if not os.environ.get('TOKEN_KEYS'):
+        raise Exception('TOKEN_KEYS не найден в переменных окружения')
         
-        # Подключение к базе данных
-        DATABASE_URL = os.environ.get('DATABASE_URL')
-        if not DATABASE_URL:
-            raise Exception('DATABASE_URL не найден в переменных окружения')
-            
-        conn = psycopg2.connect(DATABASE_URL)
-        conn.autocommit = True
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        if action == 'register':
-            return handle_register(cursor, username, password, email, context)
-        elif action == 'login':
-            return handle_login(cursor, username, password, context)
-        else:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': False, 'error': 'Неизвестное действие'}),
-                'isBase64Encoded': False
-            }
-            
-    except json.JSONDecodeError:
-        return {
-            'statusCode': 400,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': False, 'error': 'Неверный JSON'}),
-            'isBase64Encoded': False
-        }
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': False, 'error': 'Внутренняя ошибка сервера', 'details': str(e)}),
-            'isBase64Encoded': False
-        }
+    if action not in ('register', 'login'):
+        return service.error(400, 'Неизвестное действие')
+    
+    # Перебор паролей отбивается до поиска пользователя и хеширования:
+    # сначала лимит в памяти воркера, затем общий счётчик в БД
+    throttled = action == 'login' and throttle.LOGIN_THROTTLE_ENABLED
+    if throttled:
+        throttle_keys = login_throttle.keys(username, request.source_ip)
+        retry_after = login_throttle.allow_local(throttle_keys)
+        if retry_after:
+            return too_many_attempts(retry_after)
+    
+    with db.connection(autocommit=True) as conn:
+        if throttled:
+            with tracing.phase('query'):
+                retry_after = login_throttle.record_shared(conn, throttle_keys)
+            if retry_after:
+                return too_many_attempts(retry_after)
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if action == 'register':
+                return handle_register(cursor, username, password, email, request.context)
+            return handle_login(cursor, username, password, request.context)
+
+def too_many_attempts(retry_after: int) -> Dict[str, Any]:
+    return service.respond(429, dict(
+        service.error_fields, error='Слишком много попыток входа, попробуйте позже', retry_after=retry_after
+    ), {'Retry-After': str(retry_after)})
+
+# Имена UNIQUE-ограничений таблицы users -> сообщение для пользователя
+UNIQUE_VIOLATION_ERRORS = {
+    'users_username_key': 'Пользователь с таким логином уже существует',
+    'users_email_key': 'Пользователь с таким email уже существует',
+}
 
 def hash_password(password: str) -> str:
-    """Хеширование пароля"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Хеширование пароля (scrypt/PBKDF2 с солью, см. passwords.py)"""
+    return passwords.hash_password(password)
 
-def generate_token(user_id: int, username: str) -> str:
-    """Генерация простого токена для сессии"""
-    import time
-    timestamp = str(int(time.time()))
-    token_string = f"{user_id}:{username}:{timestamp}"
-    return hashlib.md5(token_string.encode()).hexdigest()
+def generate_token(user_id: int) -> str:
+    """Подписанный токен сессии (проверяется без БД, см. tokens.py)"""
+    return tokens.issue_token(user_id)
 
 def handle_register(cursor, username: str, password: str, email: str, context) -> Dict[str, Any]:
     """Обработка регистрации"""
     try:
-        # Экранируем строки для SQL (защита от инъекций)
-        username_escaped = username.replace("'", "''")
-        email_escaped = email.replace("'", "''") if email else None
-        
-        # Проверяем, существует ли пользователь
-        cursor.execute(f"SELECT id FROM t_p80273517_video_feedback_app.users WHERE username = '{username_escaped}'")
-        if cursor.fetchone():
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': False, 'error': 'Пользователь с таким логином уже существует'}),
-                'isBase64Encoded': False
-            }
-        
-        if email:
-            cursor.execute(f"SELECT id FROM t_p80273517_video_feedback_app.users WHERE email = '{email_escaped}'")
-            if cursor.fetchone():
-                return {
-                    'statusCode': 400,
-                    'headers': {'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': False, 'error': 'Пользователь с таким email уже существует'}),
-                    'isBase64Encoded': False
-                }
-        
-        # Создаем нового пользователя
-        password_hash = hash_password(password)
-        email_part = f"'{email_escaped}'" if email_escaped else 'NULL'
-        cursor.execute(
-            f"INSERT INTO t_p80273517_video_feedback_app.users (username, email, password_hash) VALUES ('{username_escaped}', {email_part}, '{password_hash}') RETURNING id"
-        )
-        user_id = cursor.fetchone()['id']
+        # Один параметризованный INSERT: уникальность логина и email проверяют
+        # UNIQUE-ограничения таблицы, поэтому гонки между проверкой и вставкой нет
+        with tracing.phase('hash'):
+            password_hash = hash_password(password)
+        try:
+            with tracing.phase('query'):
+                cursor.execute('''
+                    INSERT INTO t_p80273517_video_feedback_app.users (username, email, password_hash)
+                    VALUES (%s, %s, %s)
+                    RETURNING id
+                ''', (username, email or None, password_hash))
+                user_id = cursor.fetchone()['id']
+        except errors.UniqueViolation as e:
+            return service.error(400, UNIQUE_VIOLATION_ERRORS.get(
+                e.diag.constraint_name, 'Пользователь уже существует'
+            ))
         
         # Генерируем токен
-        token = generate_token(user_id, username)
+        token = generate_token(user_id)
         
-        return {
-            'statusCode': 201,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'message': 'Регистрация успешна',
-                'user': {
-                    'id': user_id,
-                    'username': username,
-                    'email': email
-                },
-                'token': token
-            }),
-            'isBase64Encoded': False
-        }
+        return service.respond(201, {
+            'success': True,
+            'message': 'Регистрация успешна',
+            'user': {
+                'id': user_id,
+                'username': username,
+                'email': email
+            },
+            'token': token
+        })
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': False, 'error': 'Ошибка регистрации', 'details': str(e)}),
-            'isBase64Encoded': False
-        }
+        return service.error(500, 'Ошибка регистрации', details=str(e))
 
 def handle_login(cursor, username: str, password: str, context) -> Dict[str, Any]:
     """Обработка входа"""
     try:
-        # Экранируем строки для SQL (защита от инъекций)
-        username_escaped = username.replace("'", "''")
-        
         # Ищем пользователя
-        cursor.execute(
-            f"SELECT id, username, email, password_hash FROM t_p80273517_video_feedback_app.users WHERE username = '{username_escaped}'"
-        )
-        user = cursor.fetchone()
+        with tracing.phase('query'):
+            cursor.execute(
+                "SELECT id, username, email, password_hash FROM t_p80273517_video_feedback_app.users WHERE username = %s",
+                (username,)
+            )
+            user = cursor.fetchone()
         
         if not user:
-            return {
-                'statusCode': 401,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': False, 'error': 'Неверный логин или пароль'}),
-                'isBase64Encoded': False
-            }
+            # Тот же KDF, что и для неверного пароля: по времени ответа не
+            # видно, существует ли логин
+            with tracing.phase('hash'):
+                passwords.verify_password(password, passwords.DUMMY_HASH)
+            return service.error(401, 'Неверный логин или пароль')
         
-        # Проверяем пароль
-        password_hash = hash_password(password)
-        if password_hash != user['password_hash']:
-            return {
-                'statusCode': 401,
-                'headers': {'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': False, 'error': 'Неверный логин или пароль'}),
-                'isBase64Encoded': False
-            }
+        # Проверяем пароль (старые хеши sha256 тоже понимаются)
+        with tracing.phase('hash'):
+            valid = passwords.verify_password(password, user['password_hash'])
+        if not valid:
+            return service.error(401, 'Неверный логин или пароль')
+        
+        # Хеш старого формата или параметров пересчитываем текущими;
+        # условие на старый хеш - чтобы не затереть параллельную смену пароля
+        if passwords.needs_rehash(user['password_hash']):
+            with tracing.phase('hash'):
+                new_hash = hash_password(password)
+            with tracing.phase('query'):
+                cursor.execute(
+                    "UPDATE t_p80273517_video_feedback_app.users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                    (new_hash, user['id'], user['password_hash'])
+                )
         
         # Генерируем токен
-        token = generate_token(user['id'], user['username'])
+        token = generate_token(user['id'])
         
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'message': 'Вход выполнен успешно',
-                'user': {
-                    'id': user['id'],
-                    'username': user['username'],
-                    'email': user['email']
-                },
-                'token': token
-            }),
-            'isBase64Encoded': False
-        }
+        return service.respond(200, {
+            'success': True,
+            'message': 'Вход выполнен успешно',
+            'user': {
+                'id': user['id'],
+                'username': user['username'],
+                'email': user['email']
+            },
+            'token': token
+        })
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'success': False, 'error': 'Ошибка входа', 'details': str(e)}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        return service.error(500, 'Ошибка входа', details=str(e))
\ No newline at end of file
@@ -0,0 +1,120 @@
+'''
+Ограничение частоты попыток входа по логину и по IP.
+
+Первая линия - token bucket в памяти воркера: лишние попытки отбиваются без
+обращения к БД. Прошедшие попытки учитываются в общей таблице
+login_throttle (одна строка на ключ, окно фиксированной длины), поэтому
+лимит держится и на несколько тёплых воркеров. Если общий счётчик
+превышен, ключ запоминается в воркере до конца окна, и следующие попытки
+тоже не доходят до БД.
+'''
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+LOGIN_THROTTLE_ENABLED = os.environ.get('LOGIN_THROTTLE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LOGIN_WINDOW_SECONDS = int(os.environ.get('LOGIN_WINDOW_SECONDS', '60'))
+LOGIN_USER_LIMIT = int(os.environ.get('LOGIN_USER_LIMIT', '10'))
+LOGIN_IP_LIMIT = int(os.environ.get('LOGIN_IP_LIMIT', '30'))
+# Сколько ключей помнит воркер; старые вытесняются
+LOCAL_MAX_KEYS = 10000
+# Доля запросов, которые попутно чистят устаревшие строки login_throttle
+CLEANUP_PROBABILITY = 0.01
+
+RECORD_ATTEMPTS = '''
+    INSERT INTO t_p80273517_video_feedback_app.login_throttle AS t (key, window_id, attempts)
+    SELECT key, %s, 1 FROM unnest(%s::text[]) AS key
+    ON CONFLICT (key) DO UPDATE
+    SET attempts = CASE WHEN t.window_id = EXCLUDED.window_id THEN t.attempts + 1 ELSE 1 END,
+        window_id = EXCLUDED.window_id
+    RETURNING key, attempts
+'''
+
+CLEANUP = '''
+    DELETE FROM t_p80273517_video_feedback_app.login_throttle
+    WHERE key IN (
+        SELECT key FROM t_p80273517_video_feedback_app.login_throttle WHERE window_id < %s LIMIT 1000
+    )
+'''
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+
+class LoginThrottle:
+    def __init__(self, user_limit: int = LOGIN_USER_LIMIT, ip_limit: int = LOGIN_IP_LIMIT,
+                 window_seconds: int = LOGIN_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.limits = {'u': user_limit, 'ip': ip_limit}
+        self._buckets: 'OrderedDict[str, _Bucket]' = OrderedDict()
+        self._blocked: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def keys(self, username: str, ip: Optional[str]) -> List[str]:
+        keys = ['u:' + username.strip().lower()[:100]]
+        if ip:
+            keys.append('ip:' + ip)
+        return keys
+
+    def _limit(self, key: str) -> int:
+        return self.limits[key.split(':', 1)[0]]
+
+    def allow_local(self, keys: List[str]) -> Optional[int]:
+        """Списывает по токену с каждого ключа; при отказе - секунды до повтора"""
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                until = self._blocked.get(key)
+                if until is not None:
+                    if until > now:
+                        return max(int(until - now) + 1, 1)
+                    del self._blocked[key]
+            buckets = []
+            for key in keys:
+                capacity = self._limit(key)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket(capacity, now)
+                    if len(self._buckets) > LOCAL_MAX_KEYS:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(key)
+                    rate = capacity / self.window_seconds
+                    bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+                    bucket.updated = now
+                if bucket.tokens < 1:
+                    return max(int((1 - bucket.tokens) / (capacity / self.window_seconds)) + 1, 1)
+                buckets.append(bucket)
+            for bucket in buckets:
+                bucket.tokens -= 1
+        return None
+
+    def record_shared(self, conn, keys: List[str]) -> Optional[int]:
+        """Учитывает попытку в login_throttle; при превышении - секунды до конца окна"""
+        now = time.time()
+        window_id = int(now // self.window_seconds)
+        with conn.cursor() as cursor:
+            cursor.execute(RECORD_ATTEMPTS, (window_id, keys))
+            attempts: Dict[str, int] = dict(cursor.fetchall())
+            if random.random() < CLEANUP_PROBABILITY:
+                cursor.execute(CLEANUP, (window_id - 1,))
+
+        exceeded = [key for key, count in attempts.items() if count > self._limit(key)]
+        if not exceeded:
+            return None
+        retry_after = (window_id + 1) * self.window_seconds - now
+        until = time.monotonic() + retry_after
+        with self._lock:
+            for key in exceeded:
+                self._blocked[key] = until
+                if len(self._blocked) > LOCAL_MAX_KEYS:
+                    self._blocked.popitem(last=False)
+        return max(int(retry_after) + 1, 1)
@@ -0,0 +1,187 @@
+'''
+Хеширование паролей: scrypt или PBKDF2 с солью, параметры записаны в самом хеше.
+
+    scrypt$n=16384,r=8,p=1$<соль base64>$<хеш base64>
+    pbkdf2_sha256$310000$<соль base64>$<хеш base64>
+    <64 hex-символа> - старый формат, один sha256 без соли
+
+verify_password понимает все три формата. После успешного входа
+needs_rehash говорит, что хеш старого формата или с другими параметрами -
+тогда его стоит пересчитать текущими (массовый сброс паролей не нужен).
+
+Одновременно считается не больше PASSWORD_HASH_CONCURRENCY хешей на воркер,
+чтобы всплеск входов не растягивал время каждого. Параметры под бюджет
+времени на вход подбирает калибровка на целевой машине:
+
+    python passwords.py calibrate --budget-ms 150 --concurrency 2
+'''
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+SCRYPT_AVAILABLE = hasattr(hashlib, 'scrypt')
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt' if SCRYPT_AVAILABLE else 'pbkdf2_sha256')
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', '16384'))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '310000'))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', str(os.cpu_count() or 1)))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_CONCURRENCY)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password: bytes, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem с запасом: scrypt требует 128 * r * n байт на поток
+    return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=256 * r * n * p + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def _pbkdf2(password: bytes, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password, salt, iterations, dklen=KEY_BYTES)
+
+
+def _parse_scrypt_params(text: str) -> Dict[str, int]:
+    params = dict(item.split('=', 1) for item in text.split(','))
+    return {'n': int(params['n']), 'r': int(params['r']), 'p': int(params['p'])}
+
+
+def _current_params() -> str:
+    if PASSWORD_HASHER == 'scrypt':
+        return f'scrypt${"n=%d,r=%d,p=%d" % (SCRYPT_N, SCRYPT_R, SCRYPT_P)}'
+    return f'pbkdf2_sha256${PBKDF2_ITERATIONS}'
+
+
+def hash_password(password: str) -> str:
+    """Хеш текущим алгоритмом с новой солью в закодированном формате"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    with _slots:
+        if PASSWORD_HASHER == 'scrypt':
+            digest = _scrypt(password.encode('utf-8'), salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        else:
+            digest = _pbkdf2(password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+    return f'{_current_params()}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+# Хеш случайного пароля текущими параметрами: проверка против него для
+# несуществующего логина занимает столько же, сколько для существующего
+DUMMY_HASH = hash_password(secrets.token_urlsafe(16))
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """Сравнение за постоянное время; неизвестный или битый формат - False"""
+    secret = password.encode('utf-8')
+    try:
+        if '$' not in encoded:
+            expected = hashlib.sha256(secret).hexdigest()
+            return hmac.compare_digest(expected, encoded)
+        algorithm, params, salt_text, digest_text = encoded.split('$')
+        salt, digest = _b64decode(salt_text), _b64decode(digest_text)
+        with _slots:
+            if algorithm == 'scrypt':
+                actual = _scrypt(secret, salt, **_parse_scrypt_params(params))
+            elif algorithm == 'pbkdf2_sha256':
+                actual = _pbkdf2(secret, salt, int(params))
+            else:
+                return False
+    except (ValueError, KeyError):
+        return False
+    return hmac.compare_digest(actual, digest)
+
+
+def needs_rehash(encoded: str) -> bool:
+    """Хеш не в текущем формате или не с текущими параметрами"""
+    return not encoded.startswith(_current_params() + '$')
+
+
+def _measure(hash_once: Callable[[], None], concurrency: int, rounds: int) -> float:
+    """Медиана времени одного хеша (мс), когда одновременно считаются concurrency хешей"""
+    samples: List[float] = []
+
+    def timed() -> None:
+        started = time.perf_counter()
+        hash_once()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(rounds):
+            list(pool.map(lambda _: timed(), range(concurrency)))
+    return statistics.median(samples)
+
+
+def calibrate_scrypt(budget_ms: float, concurrency: int, max_memory_mb: int, r: int = 8,
+                     rounds: int = 3) -> Tuple[Optional[int], List[Tuple[int, float]]]:
+    """Наибольшее n = 2^k, которое укладывается в бюджет и в память на concurrency хешей"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    best = None
+    measured = []
+    for log_n in range(10, 21):
+        n = 2 ** log_n
+        if 128 * r * n * concurrency > max_memory_mb * 1024 * 1024:
+            break
+        latency = _measure(lambda: _scrypt(b'calibrate', salt, n, r, 1), concurrency, rounds)
+        measured.append((n, latency))
+        if latency > budget_ms:
+            break
+        best = n
+    return best, measured
+
+
+def calibrate_pbkdf2(budget_ms: float, concurrency: int, rounds: int = 3) -> Tuple[int, float]:
+    """Число итераций PBKDF2 под бюджет: время растёт линейно, меряем 100k и масштабируем"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    probe = 100_000
+    latency = _measure(lambda: _pbkdf2(b'calibrate', salt, probe), concurrency, rounds)
+    iterations = int(probe * budget_ms / latency) // 1000 * 1000
+    return max(iterations, 1000), latency
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['calibrate'])
+    parser.add_argument('--budget-ms', type=float, default=150, help='время хеширования на один вход')
+    parser.add_argument('--concurrency', type=int, default=PASSWORD_HASH_CONCURRENCY,
+                        help='сколько входов одновременно считается на воркере')
+    parser.add_argument('--max-memory-mb', type=int, default=128, help='память воркера под scrypt')
+    parser.add_argument('--algorithm', choices=['scrypt', 'pbkdf2_sha256'], default=PASSWORD_HASHER)
+    args = parser.parse_args()
+
+    print(f'# бюджет {args.budget_ms} мс на вход при {args.concurrency} одновременных входах')
+    if args.algorithm == 'scrypt':
+        if not SCRYPT_AVAILABLE:
+            raise SystemExit('hashlib.scrypt недоступен (OpenSSL без scrypt) - используйте --algorithm pbkdf2_sha256')
+        best, measured = calibrate_scrypt(args.budget_ms, args.concurrency, args.max_memory_mb)
+        for n, latency in measured:
+            print(f'# scrypt n={n} r=8 p=1: {latency:.1f} мс, {128 * 8 * n / 1024 / 1024:.0f} МБ')
+        if best is None:
+            raise SystemExit('даже n=1024 не укладывается в бюджет')
+        print('PASSWORD_HASHER=scrypt')
+        print(f'PASSWORD_SCRYPT_N={best}')
+        print('PASSWORD_SCRYPT_R=8')
+        print('PASSWORD_SCRYPT_P=1')
+    else:
+        iterations, latency = calibrate_pbkdf2(args.budget_ms, args.concurrency)
+        print(f'# pbkdf2_sha256 100000 итераций: {latency:.1f} мс')
+        print('PASSWORD_HASHER=pbkdf2_sha256')
+        print(f'PASSWORD_PBKDF2_ITERATIONS={iterations}')
+    print(f'PASSWORD_HASH_CONCURRENCY={args.concurrency}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+TOKEN_TTL_SECONDS = int(os.environ.get('TOKEN_TTL_SECONDS', str(30 * 24 * 3600)))
+# X-User-Id без подписи выбирает клиент - принимается только там, где это
+# включено явно (локальный стенд, старые клиенты на время перехода)
+ALLOW_USER_ID_HEADER = os.environ.get('AUTH_ALLOW_USER_ID_HEADER', 'false').lower() in ('1', 'true', 'yes')
+CLOCK_SKEW_SECONDS = 60
+# Токен для <video src> попадает в логи и историю браузера - живёт недолго
+# и открывает только одно видео
+VIDEO_TOKEN_TTL_SECONDS = int(os.environ.get('VIDEO_TOKEN_TTL_SECONDS', '3600'))
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _load_keys(spec: str) -> Dict[str, bytes]:
+    """
+    TOKEN_KEYS="kid2:secret2,kid1:secret1" - первый ключ подписывает,
+    остальные только проверяют (ротация без разлогинивания).
+    """
+    keys: Dict[str, bytes] = {}
+    for item in spec.split(','):
+        kid, sep, secret = item.strip().partition(':')
+        if sep and kid and secret:
+            keys[kid] = secret.encode('utf-8')
+    return keys
+
+
+_KEYS = _load_keys(os.environ.get('TOKEN_KEYS', ''))
+_SIGNING_KID = next(iter(_KEYS), None)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _sign(key: bytes, message: str) -> str:
+    return _b64encode(hmac.new(key, message.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, ttl: int = TOKEN_TTL_SECONDS, now: Optional[int] = None,
+                scope: Optional[str] = None) -> str:
+    """
+    Токен вида <kid>.<payload>.<hmac-sha256> с user id, временем выдачи и
+    истечения. С scope токен годится только для этого ресурса и только в query.
+    """
+    if _SIGNING_KID is None:
+        raise RuntimeError('TOKEN_KEYS не найден в переменных окружения')
+    issued_at = int(time.time()) if now is None else now
+    claims: Dict[str, Any] = {'uid': user_id, 'iat': issued_at, 'exp': issued_at + ttl}
+    if scope is not None:
+        claims['scope'] = scope
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    message = f'{_SIGNING_KID}.{payload}'
+    return f'{message}.{_sign(_KEYS[_SIGNING_KID], message)}'
+
+
+def verify_token(token: str, now: Optional[int] = None) -> Dict[str, Any]:
+    """Проверка подписи и срока в процессе, без обращения к БД; возвращает payload"""
+    # Токен из заголовка или query - любая строка; подпись считается только по ASCII
+    if not token.isascii():
+        raise InvalidToken('Malformed token')
+    parts = token.split('.')
+    if len(parts) != 3:
+        raise InvalidToken('Malformed token')
+    kid, payload, signature = parts
+    key = _KEYS.get(kid)
+    if key is None:
+        raise InvalidToken('Unknown key')
+    if not hmac.compare_digest(_sign(key, f'{kid}.{payload}'), signature):
+        raise InvalidToken('Bad signature')
+    try:
+        claims = json.loads(_b64decode(payload))
+        user_id, issued_at, expires_at = int(claims['uid']), int(claims['iat']), int(claims['exp'])
+        scope = claims.get('scope')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidToken('Malformed payload')
+    if scope is not None and not isinstance(scope, str):
+        raise InvalidToken('Malformed payload')
+    current = int(time.time()) if now is None else now
+    if expires_at < current or issued_at > current + CLOCK_SKEW_SECONDS:
+        raise InvalidToken('Token expired')
+    return {'uid': user_id, 'iat': issued_at, 'exp': expires_at, 'scope': scope}
+
+
+def video_scope(video_id: int) -> str:
+    return f'video:{video_id}'
+
+
+def _header(headers: Dict[str, Any], name: str) -> Optional[str]:
+    value = headers.get(name)
+    if value is None:
+        value = headers.get(name.lower())
+    return value
+
+
+def authenticate(headers: Dict[str, Any], query_params: Optional[Dict[str, Any]] = None,
+                 scope: Optional[str] = None) -> Optional[int]:
+    """
+    user id из X-Auth-Token, иначе из X-User-Id при AUTH_ALLOW_USER_ID_HEADER.
+    Где заголовки не передать (<video src>), в query_params ищется ?token= -
+    только короткий токен, выданный на этот scope: сессионный токен в URL
+    осел бы в логах, а ?user_id= открывал бы чужие видео.
+    Неверный токен - InvalidToken, отсутствие данных - None.
+    """
+    token = _header(headers, 'X-Auth-Token')
+    if token:
+        claims = verify_token(token)
+        if claims['scope'] is not None:
+            raise InvalidToken('Scoped token is not a session token')
+        return claims['uid']
+    token = (query_params or {}).get('token')
+    if token:
+        claims = verify_token(token)
+        if scope is None or claims['scope'] != scope:
+            raise InvalidToken('Token scope mismatch')
+        return claims['uid']
+    if ALLOW_USER_ID_HEADER:
+        user_id = _header(headers, 'X-User-Id')
+        if user_id:
+            try:
+                return int(user_id)
+            except ValueError:
+                raise InvalidToken('Malformed user id')
+    return None
@@ -0,0 +1,118 @@
+'''
+Отправка накопленных без сети лидов: по одному POST на лид против одного пакета.
+
+    DATABASE_URL=postgresql://localhost/leads_bench \
+        python backend/bench/bench_batch_save.py --leads 5 10 20 --video-kb 256
+
+Изображает "шторм переподключений": --clients потоков одновременно
+выгружают очередь из N лидов - сначала отдельными запросами save-lead, потом
+одним пакетом {"leads": [...]}. Для каждого N печатается строка JSON:
+лиды в секунду и число commit'ов в БД (pg_stat_database) на лид для обоих
+способов. Созданные лиды удаляются в конце.
+'''
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'save-lead'))
+# Стенд ходит с X-User-Id вместо подписанного токена
+os.environ.setdefault('AUTH_ALLOW_USER_ID_HEADER', 'true')
+# Пул читается при импорте db: соединений хватает на всех клиентов по умолчанию
+os.environ.setdefault('DB_POOL_MAX_SIZE', '16')
+
+import db  # noqa: E402
+from index import handler  # noqa: E402
+
+BENCH_USER_ID = -4244
+
+
+class Context:
+    request_id = 'bench'
+    function_name = 'save-lead'
+
+
+def post(body: dict) -> dict:
+    event = {'httpMethod': 'POST', 'headers': {'X-User-Id': str(BENCH_USER_ID)}, 'body': json.dumps(body)}
+    response = handler(event, Context())
+    assert response['statusCode'] == 200, response
+    return json.loads(response['body'])
+
+
+def queue(client: int, count: int, video: str, run: str) -> list:
+    # Разное содержимое у каждого лида: дедупликация видео не должна влиять на замер
+    return [{
+        'videoBase64': base64.b64encode(f'{run}-{client}-{n}'.ljust(48).encode('ascii')).decode('ascii') + video,
+        'comments': f'offline {n}',
+        'idempotency_key': f'bench-{run}-{client}-{n}',
+    } for n in range(count)]
+
+
+def commits() -> int:
+    with db.connection(autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()')
+            return cursor.fetchone()[0]
+
+
+def storm(clients: int, count: int, video: str, run: str, batched: bool) -> dict:
+    def client(n: int) -> None:
+        items = queue(n, count, video, run)
+        if batched:
+            assert post({'leads': items})['failed'] == 0
+        else:
+            for item in items:
+                post(item)
+
+    before = commits()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total = clients * count
+    return {
+        'leads_per_s': round(total / elapsed, 1),
+        'commits_per_lead': round((commits() - before - 1) / total, 2)
+    }
+
+
+def cleanup() -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (BENCH_USER_ID,))
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_lead_stats WHERE user_id = %s',
+                           (BENCH_USER_ID,))
+        conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--video-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    # Кратно 3 байтам - base64 без '=' можно дописывать к префиксу
+    video = base64.b64encode(os.urandom(args.video_kb * 1024 // 3 * 3)).decode('ascii')
+    run = str(int(time.time()))
+    cleanup()
+    try:
+        for count in args.leads:
+            print(json.dumps({
+                'leads': count,
+                'clients': args.clients,
+                'single': storm(args.clients, count, video, f'{run}-s{count}', batched=False),
+                'batch': storm(args.clients, count, video, f'{run}-b{count}', batched=True),
+            }))
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''
+Сжатие JSON-списка лидов: сколько байт экономится и сколько это стоит CPU.
+
+    python backend/bench/bench_compression.py --sizes 10 50 200
+
+БД не нужна: страницы собираются из синтетических лидов той же формы, что
+отдаёт get-leads (lead_rows.lead_dict), и сжимаются так же, как в
+runtime.Service (gzip/brotli + base64 для isBase64Encoded). Для каждого
+размера страницы и кодировки печатается строка JSON: исходный и итоговый
+размер, доля экономии и медианное время сжатия.
+'''
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'get-leads'))
+
+import runtime  # noqa: E402
+
+COMMENTS = [
+    'Клиент интересуется доставкой, перезвонить после обеда',
+    'Нужна консультация по тарифу, оставил номер телефона',
+    'Повторное обращение, видео с объекта, просит смету',
+    'Не дозвонились, отправили сообщение в мессенджер',
+]
+
+
+def make_page(count: int, rng: random.Random) -> str:
+    started = datetime(2024, 5, 1, 9, 0)
+    leads = []
+    for n in range(count):
+        created = started + timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+        leads.append({
+            'id': 100000 + n,
+            'filename': f'lead-video-{int(created.timestamp() * 1000)}.mp4',
+            'original_filename': f'video-{created:%d.%m.%Y}.mp4',
+            'file_size': rng.randint(2_000_000, 60_000_000),
+            'duration': rng.randint(5, 180),
+            'comments': rng.choice(COMMENTS),
+            'created_at': created.isoformat(),
+            'latitude': round(rng.uniform(55.5, 56.0), 6),
+            'longitude': round(rng.uniform(37.3, 38.0), 6),
+            'width': 1280,
+            'height': 720,
+            'video_codec': rng.choice(['avc1', 'vp8', 'vp9']),
+        })
+    return runtime.dumps({'leads': leads, 'count': count, 'total': count * 3, 'next_cursor': 'WyIyMDI0LTA1LTAxIiwxXQ'})
+
+
+def encoders():
+    yield 'gzip-1', lambda data: gzip.compress(data, compresslevel=1, mtime=0)
+    yield 'gzip-6', lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    yield 'gzip-9', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if runtime.brotli is not None:
+        for quality in (1, 5, 11):
+            yield f'br-{quality}', lambda data, q=quality: runtime.brotli.compress(data, quality=q)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if runtime.brotli is None:
+        print('brotli не установлен - только gzip', file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    for count in args.sizes:
+        body = make_page(count, rng)
+        raw = body.encode('utf-8')
+        for name, encode in encoders():
+            samples = []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                encoded = base64.b64encode(encode(raw))
+                samples.append((time.perf_counter() - started) * 1000)
+            print(json.dumps({
+                'leads': count,
+                'encoding': name,
+                'json_bytes': len(raw),
+                'sent_bytes': len(encoded),
+                'saved': round(1 - len(encoded) / len(raw), 3),
+                'compress_p50_ms': round(statistics.median(samples), 3)
+            }))
+
+
+if __name__ == '__main__':
+    main()
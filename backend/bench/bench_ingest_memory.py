@@ -0,0 +1,91 @@
+'''
+Пиковая память на одну загрузку save-lead: старый путь (split + b64decode)
+против потокового декодирования ingest.decode_base64 в blob-хранилище.
+
+    python backend/bench/bench_ingest_memory.py --sizes-mb 10 50 100
+
+Каждый замер идёт в отдельном процессе. Пик памяти (tracemalloc) считается
+от момента, когда тело запроса уже лежит в памяти (его держит рантайм
+функции), и выводится в долях размера видео. RSS процесса здесь не годится:
+его пик уже задран сборкой тестового тела запроса.
+'''
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SAVE_LEAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'save-lead')
+
+
+def legacy_path(body: str) -> int:
+    body_data = json.loads(body)
+    video_base64 = body_data.get('videoBase64', '')
+    if video_base64.startswith('data:'):
+        video_base64 = video_base64.split(',')[1]
+    video_bytes = base64.b64decode(video_base64)
+    return len(video_bytes)
+
+
+def streaming_path(body: str) -> int:
+    sys.path.insert(0, SAVE_LEAD_DIR)
+    import ingest
+    import storage
+
+    store = storage.LocalBlobStore(tempfile.mkdtemp(prefix='bench-blobs-'))
+    body_data, spans = ingest.split_json_body(body)
+    begin, stop = ingest.value_span(body_data['videoBase64'], spans)
+    video = ingest.decode_base64(body, limit=len(body), begin=begin, stop=stop)
+    try:
+        store.put_file(video.file, video.sha256, video.size)
+    finally:
+        video.file.close()
+    return video.size
+
+
+def worker(mode: str, size_mb: int) -> None:
+    video = os.urandom(size_mb * 1024 * 1024)
+    body = json.dumps({
+        'videoBase64': 'data:video/webm;base64,' + base64.b64encode(video).decode('ascii'),
+        'filename': 'bench.webm',
+        'comments': 'bench'
+    })
+    video_size = len(video)
+    del video
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    decoded = (legacy_path if mode == 'legacy' else streaming_path)(body)
+    elapsed = time.perf_counter() - started
+    growth = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert decoded == video_size
+    print(json.dumps({
+        'mode': mode,
+        'video_mb': size_mb,
+        'peak_mb': round(growth / 1024 / 1024, 1),
+        'peak_x': round(growth / video_size, 2),
+        'seconds': round(elapsed, 3)
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'SIZE_MB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], int(args.worker[1]))
+        return
+    for size_mb in args.sizes_mb:
+        for mode in ('legacy', 'streaming'):
+            subprocess.run([sys.executable, __file__, '--worker', mode, str(size_mb)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+'''
+Перебор паролей против auth2: нагрузка на БД и вход обычных пользователей.
+
+    DATABASE_URL=postgresql://localhost/leads_bench TOKEN_KEYS=bench:secret \
+        python backend/bench/bench_login_attack.py --workers 4 --threads 8 --seconds 20
+
+--workers процессов изображают тёплые воркеры функции (у каждого свой
+token bucket), в каждом --threads потоков шлют неверные пароли к нескольким
+логинам с нескольких IP. Параллельно обычные пользователи (по очереди,
+каждый со своего IP) входят раз в --legit-interval секунд. Раз в секунду
+печатается строка JSON с числом транзакций в БД (pg_stat_database), в конце -
+ответы атакующим и p50/p95 входа обычных пользователей до и во время атаки. --no-throttle выключает
+ограничение для сравнения. Созданные пользователи удаляются в конце.
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'auth2'))
+
+PREFIX = 'attack_'
+VICTIMS = [f'{PREFIX}victim{n}' for n in range(20)]
+ATTACKER_IPS = [f'203.0.113.{n}' for n in range(1, 51)]
+LEGIT_USERS = [f'{PREFIX}legit{n}' for n in range(30)]
+LEGIT_PASSWORD = 'correct horse battery staple'
+
+
+class Context:
+    request_id = 'bench'
+    function_name = 'auth2'
+
+
+def login_event(username: str, password: str, ip: str):
+    return {
+        'httpMethod': 'POST',
+        'headers': {'X-Forwarded-For': ip},
+        'body': json.dumps({'action': 'login', 'username': username, 'password': password})
+    }
+
+
+def attacker(seconds: float, threads: int, results) -> None:
+    """Один "воркер": свой процесс, свой token bucket, threads атакующих потоков"""
+    from index import handler
+
+    counts: Counter = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run() -> None:
+        rng = random.Random()
+        local: Counter = Counter()
+        while time.monotonic() < deadline:
+            event = login_event(rng.choice(VICTIMS), f'guess{rng.randint(0, 10 ** 6)}', rng.choice(ATTACKER_IPS))
+            local[handler(event, Context())['statusCode']] += 1
+        with lock:
+            counts.update(local)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(dict(counts))
+
+
+def db_transactions() -> int:
+    import db
+    with db.connection(autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()')
+            return cursor.fetchone()[0]
+
+
+def setup() -> None:
+    import db
+    from index import hash_password
+    cleanup()
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            for username in VICTIMS + LEGIT_USERS:
+                password = LEGIT_PASSWORD if username in LEGIT_USERS else os.urandom(8).hex()
+                cursor.execute('''
+                    INSERT INTO t_p80273517_video_feedback_app.users (username, password_hash) VALUES (%s, %s)
+                ''', (username, hash_password(password)))
+        conn.commit()
+
+
+def cleanup() -> None:
+    import db
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.users WHERE username LIKE %s', (PREFIX + '%',))
+            cursor.execute('''
+                DELETE FROM t_p80273517_video_feedback_app.login_throttle
+                WHERE key LIKE %s OR key LIKE 'ip:203.0.113.%%' OR key LIKE 'ip:198.51.100.%%'
+            ''', ('u:' + PREFIX + '%',))
+        conn.commit()
+
+
+def legit_logins(seconds: float, interval: float) -> list:
+    from index import handler
+    samples = []
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        index = n % len(LEGIT_USERS)
+        started = time.perf_counter()
+        response = handler(login_event(LEGIT_USERS[index], LEGIT_PASSWORD, f'198.51.100.{index + 1}'), Context())
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+        time.sleep(interval)
+    return samples
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[int(len(ordered) * 0.95) - 1], 3),
+        'count': len(ordered)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--baseline-seconds', type=float, default=5)
+    parser.add_argument('--legit-interval', type=float, default=0.5)
+    parser.add_argument('--no-throttle', action='store_true')
+    args = parser.parse_args()
+    if args.no_throttle:
+        os.environ['LOGIN_THROTTLE_ENABLED'] = 'false'
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.threads + 2))
+
+    setup()
+    try:
+        baseline = legit_logins(args.baseline_seconds, args.legit_interval)
+
+        # spawn: у каждого процесса свой пул соединений и свой token bucket
+        spawn = multiprocessing.get_context('spawn')
+        results = spawn.Queue()
+        workers = [spawn.Process(target=attacker, args=(args.seconds, args.threads, results))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+
+        legit: list = []
+        legit_thread = threading.Thread(target=lambda: legit.extend(legit_logins(args.seconds, args.legit_interval)))
+        legit_thread.start()
+        previous = db_transactions()
+        for second in range(int(args.seconds)):
+            time.sleep(1)
+            current = db_transactions()
+            print(json.dumps({'second': second + 1, 'db_tps': current - previous}))
+            previous = current
+        legit_thread.join()
+
+        attack: Counter = Counter()
+        for _ in workers:
+            attack.update(results.get())
+        for worker in workers:
+            worker.join()
+
+        print(json.dumps({
+            'throttle': not args.no_throttle,
+            'attack_responses': {str(status): count for status, count in sorted(attack.items())},
+            'legit_baseline': percentiles(baseline),
+            'legit_under_attack': percentiles(legit)
+        }))
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Латентность одной страницы списка лидов в зависимости от числа лидов пользователя.
+
+    DATABASE_URL=postgresql://localhost/leads_bench \
+        python backend/bench/bench_pagination.py --sizes 1000 10000 100000
+
+Для каждого размера засевает синтетического пользователя, затем меряет
+первую страницу и страницу из середины списка (по курсору). При keyset-
+пагинации обе должны оставаться плоскими при росте числа лидов.
+Синтетические строки удаляются в конце.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'get-leads'))
+# Стенд ходит с X-User-Id вместо подписанного токена
+os.environ.setdefault('AUTH_ALLOW_USER_ID_HEADER', 'true')
+
+import db  # noqa: E402
+import pagination  # noqa: E402
+from index import handler  # noqa: E402
+
+BENCH_USER_ID = -4242
+
+
+class Context:
+    request_id = 'bench'
+    function_name = 'get-leads'
+
+
+def reset(user_id: int) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (user_id,))
+        conn.commit()
+
+
+def seed(user_id: int, total: int) -> None:
+    """Добивает пользователя до total лидов без видео-данных"""
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (user_id,))
+            existing = cursor.fetchone()[0]
+            cursor.execute('''
+                INSERT INTO t_p80273517_video_feedback_app.user_videos
+                (user_id, filename, original_filename, file_size, comments, created_at)
+                SELECT %s, 'bench-' || g || '.webm', 'bench.webm', 1048576, 'Комментарий ' || g,
+                       TIMESTAMP '2024-01-01' + g * INTERVAL '1 minute'
+                FROM generate_series(%s, %s) AS g
+            ''', (user_id, existing + 1, total))
+            cursor.execute('ANALYZE t_p80273517_video_feedback_app.user_videos')
+        conn.commit()
+
+
+def middle_cursor(user_id: int, total: int) -> str:
+    with db.connection(autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT created_at, id FROM t_p80273517_video_feedback_app.user_videos
+                WHERE user_id = %s ORDER BY created_at DESC, id DESC OFFSET %s LIMIT 1
+            ''', (user_id, total // 2))
+            return pagination.encode_cursor(*cursor.fetchone())
+
+
+def time_page(user_id: int, limit: int, cursor: str, repeats: int) -> float:
+    params = {'limit': str(limit)}
+    if cursor:
+        params['cursor'] = cursor
+    event = {'httpMethod': 'GET', 'headers': {'X-User-Id': str(user_id)}, 'queryStringParameters': params}
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = handler(event, Context())
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--user-id', type=int, default=BENCH_USER_ID)
+    args = parser.parse_args()
+
+    reset(args.user_id)
+    try:
+        for total in sorted(args.sizes):
+            seed(args.user_id, total)
+            first_ms = time_page(args.user_id, args.limit, '', args.repeats)
+            middle_ms = time_page(args.user_id, args.limit, middle_cursor(args.user_id, total), args.repeats)
+            print(json.dumps({
+                'leads': total,
+                'limit': args.limit,
+                'first_page_p50_ms': round(first_ms, 3),
+                'middle_page_p50_ms': round(middle_ms, 3)
+            }))
+    finally:
+        reset(args.user_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+Чтение get-leads с реплики: маршрутизация, read-your-writes и переход на основную базу.
+
+    DATABASE_URL=postgresql://localhost:5432/leads_bench \
+    DATABASE_URL_READONLY=postgresql://localhost:5433/leads_bench \
+        python backend/bench/bench_replica.py --writes 20
+
+Нужны два локальных Postgres: основной и потоковая реплика (см. README).
+Лиды пишутся прямо в основную базу так же, как save-lead (лид + версия
+user_lead_stats), и сразу читаются через get-leads: с X-Last-Write-At
+(created_at нового лида) - такой список обязан содержать лид, и без
+заголовка - тогда видно, через сколько лид доходит до реплики. В конце -
+строка JSON: p50 списка, доля чтений с реплики по причинам
+(db.read_stats) и задержка репликации.
+
+--unreachable-replica подменяет DATABASE_URL_READONLY недоступным портом и
+показывает, что чтения уходят в основную базу, а не падают.
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+if '--unreachable-replica' in sys.argv:
+    os.environ['DATABASE_URL_READONLY'] = 'postgresql://127.0.0.1:1/leads_bench'
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'get-leads'))
+# Стенд ходит с X-User-Id вместо подписанного токена
+os.environ.setdefault('AUTH_ALLOW_USER_ID_HEADER', 'true')
+
+import db  # noqa: E402
+from index import handler  # noqa: E402
+
+BENCH_USER_ID = -4245
+
+
+class Context:
+    request_id = 'bench'
+    function_name = 'get-leads'
+
+
+def write_lead(n: int) -> str:
+    """Лид и новая версия списка одной транзакцией в основной базе; created_at в ISO"""
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                WITH lead AS (
+                    INSERT INTO t_p80273517_video_feedback_app.user_videos (user_id, filename, file_size)
+                    VALUES (%s, %s, 0)
+                    RETURNING user_id, created_at
+                ), stats AS (
+                    INSERT INTO t_p80273517_video_feedback_app.user_lead_stats AS s
+                        (user_id, version, lead_count, total_bytes, last_lead_at)
+                    SELECT user_id, 1, 1, 0, created_at FROM lead
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET version = s.version + 1, lead_count = s.lead_count + 1, last_lead_at = EXCLUDED.last_lead_at
+                )
+                SELECT created_at FROM lead
+            ''', (BENCH_USER_ID, f'replica-{n}.webm'))
+            created_at = cursor.fetchone()[0]
+        conn.commit()
+    return created_at.isoformat()
+
+
+def list_filenames(last_write_at=None) -> list:
+    headers = {'X-User-Id': str(BENCH_USER_ID)}
+    if last_write_at:
+        headers['X-Last-Write-At'] = last_write_at
+    response = handler({'httpMethod': 'GET', 'headers': headers, 'queryStringParameters': {'limit': '5'}}, Context())
+    assert response['statusCode'] == 200, response
+    return [lead['filename'] for lead in json.loads(response['body'])['leads']]
+
+
+def cleanup() -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (BENCH_USER_ID,))
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_lead_stats WHERE user_id = %s',
+                           (BENCH_USER_ID,))
+        conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--reads', type=int, default=50, help='чтений списка без записи для p50')
+    parser.add_argument('--unreachable-replica', action='store_true')
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_URL_READONLY'):
+        raise SystemExit('DATABASE_URL_READONLY не задан')
+
+    cleanup()
+    try:
+        stale_reads = 0
+        delays = []
+        for n in range(args.writes):
+            created_at = write_lead(n)
+            filename = f'replica-{n}.webm'
+            # Сразу после записи: с X-Last-Write-At лид виден всегда
+            assert filename in list_filenames(created_at), 'read-your-writes нарушен'
+            started = time.perf_counter()
+            while filename not in list_filenames():
+                stale_reads += 1
+                time.sleep(0.005)
+            delays.append((time.perf_counter() - started) * 1000)
+
+        samples = []
+        for _ in range(args.reads):
+            started = time.perf_counter()
+            list_filenames()
+            samples.append((time.perf_counter() - started) * 1000)
+
+        print(json.dumps({
+            'list_p50_ms': round(statistics.median(samples), 3),
+            'replication_visible_p50_ms': round(statistics.median(delays), 3),
+            'replication_visible_max_ms': round(max(delays), 3),
+            'stale_reads_without_header': stale_reads,
+            'routing': db.read_stats(),
+        }))
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
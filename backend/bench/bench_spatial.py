@@ -0,0 +1,123 @@
+'''
+Латентность геопоиска (?bbox= и ?near=) в зависимости от числа лидов пользователя.
+
+    DATABASE_URL=postgresql://localhost/leads_bench \
+        python backend/bench/bench_spatial.py --sizes 1000 10000 100000
+
+Лиды засеваются случайными точками по европейской части России. Для
+сравнения меряется и прежний способ - фильтр по всем лидам пользователя
+(scan_p50_ms): он растёт линейно, а запросы по geohash-индексу должны
+оставаться почти плоскими. Синтетические строки удаляются в конце.
+'''
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'get-leads'))
+# Стенд ходит с X-User-Id вместо подписанного токена
+os.environ.setdefault('AUTH_ALLOW_USER_ID_HEADER', 'true')
+
+from psycopg2.extras import execute_values  # noqa: E402
+
+import db  # noqa: E402
+import geohash  # noqa: E402
+from index import handler  # noqa: E402
+
+BENCH_USER_ID = -4243
+# south, west, north, east
+REGION = (45.0, 30.0, 65.0, 60.0)
+# Окно поиска ~ 20 x 20 км в центре Москвы
+BBOX = '55.65,37.45,55.85,37.75'
+NEAR = '55.751,37.618'
+
+
+class Context:
+    request_id = 'bench'
+    function_name = 'get-leads'
+
+
+def reset(user_id: int) -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (user_id,))
+        conn.commit()
+
+
+def seed(user_id: int, total: int, rng: random.Random) -> None:
+    """Добивает пользователя до total лидов со случайными координатами"""
+    south, west, north, east = REGION
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (user_id,))
+            existing = cursor.fetchone()[0]
+            rows = []
+            for n in range(existing + 1, total + 1):
+                lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+                rows.append((user_id, f'bench-{n}.webm', 1048576, round(lat, 8), round(lon, 8), geohash.encode(lat, lon)))
+            execute_values(cursor, '''
+                INSERT INTO t_p80273517_video_feedback_app.user_videos
+                (user_id, filename, file_size, latitude, longitude, geohash)
+                VALUES %s
+            ''', rows, page_size=1000)
+            cursor.execute('ANALYZE t_p80273517_video_feedback_app.user_videos')
+        conn.commit()
+
+
+def time_handler(user_id: int, params: dict, repeats: int) -> float:
+    event = {'httpMethod': 'GET', 'headers': {'X-User-Id': str(user_id)}, 'queryStringParameters': params}
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = handler(event, Context())
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response['statusCode'] == 200, response
+    return statistics.median(samples)
+
+
+def time_scan(user_id: int, repeats: int) -> float:
+    """Прежний способ: все лиды пользователя с фильтром по координатам"""
+    south, west, north, east = (float(value) for value in BBOX.split(','))
+    samples = []
+    with db.connection(autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            for _ in range(repeats):
+                started = time.perf_counter()
+                cursor.execute('''
+                    SELECT id FROM t_p80273517_video_feedback_app.user_videos
+                    WHERE user_id = %s AND latitude + 0 BETWEEN %s AND %s AND longitude + 0 BETWEEN %s AND %s
+                ''', (user_id, south, north, west, east))
+                cursor.fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--user-id', type=int, default=BENCH_USER_ID)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reset(args.user_id)
+    try:
+        for total in sorted(args.sizes):
+            seed(args.user_id, total, rng)
+            print(json.dumps({
+                'leads': total,
+                'bbox_p50_ms': round(time_handler(args.user_id, {'bbox': BBOX, 'limit': '200'}, args.repeats), 3),
+                'near_p50_ms': round(time_handler(args.user_id, {'near': NEAR, 'k': str(args.k)}, args.repeats), 3),
+                'scan_p50_ms': round(time_scan(args.user_id, args.repeats), 3)
+            }))
+    finally:
+        reset(args.user_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+'''
+Нагрузочный стенд: вызывает handler функций напрямую (без HTTP) против
+локального Postgres и пишет результаты в JSON.
+
+    DATABASE_URL=postgresql://localhost/leads_bench TOKEN_KEYS=bench:secret \
+        python backend/bench/harness.py --concurrency 8 --output bench_results.json
+
+    python backend/bench/harness.py --compare old.json new.json
+
+Сценарии (--scenarios):
+- tests       - запросы из tests.json каждой функции, статус сверяется с expectedStatus;
+- login_storm - параллельные входы одного пользователя в auth2;
+- upload      - сохранение видео размером --upload-mb через save-lead;
+- list        - страницы списка get-leads (по курсорам) для пользователя с --list-leads лидами.
+
+Каждый сценарий идёт в отдельном процессе: у всех функций свои index.py и
+db.py, а пик RSS должен относиться к одному сценарию. По каждому - число
+запросов, ошибки 5xx, неожиданные статусы, rps, p50/p95/p99, пик RSS и
+гистограммы фаз из tracing.py. Синтетические данные удаляются в конце.
+'''
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+FUNCTIONS = ('auth', 'auth2', 'get-leads', 'save-lead', 'telegram-dispatcher', 'test-auth')
+SCENARIOS = ('tests', 'login_storm', 'upload', 'list')
+BENCH_USER_ID = -4343
+BENCH_USERNAME = 'bench_login_storm'
+BENCH_PASSWORD = 'bench-password'
+
+Event = Dict[str, Any]
+# (имя запроса, event, ожидаемый статус или None)
+Call = Tuple[str, Event, Optional[int]]
+
+
+class Context:
+    request_id = 'bench'
+
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+
+
+def load_function(name: str) -> Callable[[Event, Any], Dict[str, Any]]:
+    """Импорт handler из каталога функции; в одном процессе - только одна функция"""
+    sys.path.insert(0, os.path.join(BACKEND_DIR, name))
+    from index import handler
+    return handler
+
+
+def make_event(method: str, path: str = '/', headers: Optional[Dict[str, str]] = None, body: Any = None) -> Event:
+    query = dict(parse_qsl(urlsplit(path).query))
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    return {
+        'httpMethod': method,
+        'headers': dict(headers or {}),
+        'queryStringParameters': query or None,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def percentile(sorted_ms: List[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, int(round(q * len(sorted_ms))) - 1))]
+
+
+def run_load(handler, context: Context, calls: List[Call], concurrency: int) -> Dict[str, Any]:
+    """Прогоняет calls с заданной параллельностью, возвращает сводку латентности"""
+    def call(item: Call) -> Tuple[str, int, Optional[int], float]:
+        name, event, expected = item
+        started = time.perf_counter()
+        response = handler(event, context)
+        return name, response['statusCode'], expected, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, calls))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[3] for r in results)
+    unexpected: Dict[str, int] = {}
+    for name, status, expected, _ in results:
+        if expected is not None and status != expected:
+            unexpected[f'{name}: {status}'] = unexpected.get(f'{name}: {status}', 0) + 1
+    return {
+        'requests': len(results),
+        'errors_5xx': sum(1 for r in results if r[1] >= 500),
+        'unexpected_status': unexpected,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux - в КБ, в macOS - в байтах
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+# --- сценарии (выполняются в дочернем процессе) ---
+
+def scenario_tests(function: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    handler = load_function(function)
+    with open(os.path.join(BACKEND_DIR, function, 'tests.json'), encoding='utf-8') as f:
+        specs = json.load(f)['tests']
+    calls: List[Call] = []
+    for _ in range(args.iterations):
+        for spec in specs:
+            event = make_event(spec['method'], spec.get('path', '/'), spec.get('headers'), spec.get('body'))
+            calls.append((spec['name'], event, spec.get('expectedStatus')))
+    return [dict(name=f'tests:{function}', **run_load(handler, Context(function), calls, args.concurrency))]
+
+
+def scenario_login_storm(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    handler = load_function('auth2')
+    import db
+    context = Context('auth2')
+    credentials = {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}
+    handler(make_event('POST', body=dict(credentials, action='register')), context)
+    try:
+        calls: List[Call] = [
+            ('login', make_event('POST', body=dict(credentials, action='login')), 200)
+            for _ in range(args.iterations * 50)
+        ]
+        return [dict(name='login_storm', **run_load(handler, context, calls, args.concurrency))]
+    finally:
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM t_p80273517_video_feedback_app.users WHERE username = %s', (BENCH_USERNAME,))
+            conn.commit()
+
+
+def scenario_upload(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    handler = load_function('save-lead')
+    import db
+    context = Context('save-lead')
+    headers = {'X-User-Id': str(BENCH_USER_ID)}
+    results = []
+    try:
+        for size_mb in args.upload_mb:
+            body = json.dumps({
+                'videoBase64': 'data:video/webm;base64,' + base64.b64encode(os.urandom(size_mb * 1024 * 1024)).decode('ascii'),
+                'filename': 'bench.webm',
+                'comments': 'bench'
+            })
+            # Тело одно на все запросы: его, как и рантайм функции, держим в памяти заранее
+            calls: List[Call] = [
+                (f'upload {size_mb}MB', make_event('POST', headers=headers, body=body), 200)
+                for _ in range(args.iterations)
+            ]
+            results.append(dict(name=f'upload:{size_mb}MB', **run_load(handler, context, calls, args.concurrency)))
+            del body, calls
+    finally:
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (BENCH_USER_ID,))
+            conn.commit()
+    return results
+
+
+def scenario_list(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    handler = load_function('get-leads')
+    import db
+    context = Context('get-leads')
+    headers = {'X-User-Id': str(BENCH_USER_ID)}
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (BENCH_USER_ID,))
+            cursor.execute('''
+                INSERT INTO t_p80273517_video_feedback_app.user_videos
+                (user_id, filename, original_filename, file_size, comments, created_at)
+                SELECT %s, 'bench-' || g || '.webm', 'bench.webm', 1048576, 'Комментарий ' || g,
+                       TIMESTAMP '2024-01-01' + g * INTERVAL '1 minute'
+                FROM generate_series(1, %s) AS g
+            ''', (BENCH_USER_ID, args.list_leads))
+            cursor.execute('ANALYZE t_p80273517_video_feedback_app.user_videos')
+        conn.commit()
+    try:
+        # Курсоры всех страниц собираем последовательным обходом, затем запрашиваем страницы вразнобой
+        cursors: List[Optional[str]] = [None]
+        while True:
+            path = '/?limit=50' + (f'&cursor={cursors[-1]}' if cursors[-1] else '')
+            response = handler(make_event('GET', path, headers), context)
+            next_cursor = json.loads(response['body']).get('next_cursor')
+            if not next_cursor:
+                break
+            cursors.append(next_cursor)
+        calls: List[Call] = []
+        for _ in range(args.iterations * 50):
+            cursor = random.choice(cursors)
+            calls.append(('page', make_event('GET', '/?limit=50' + (f'&cursor={cursor}' if cursor else ''), headers), 200))
+        return [dict(name=f'list:{args.list_leads}', pages=len(cursors), **run_load(handler, context, calls, args.concurrency))]
+    finally:
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM t_p80273517_video_feedback_app.user_videos WHERE user_id = %s', (BENCH_USER_ID,))
+            conn.commit()
+
+
+def worker(scenario: str, function: Optional[str], args: argparse.Namespace) -> None:
+    if scenario == 'tests':
+        results = scenario_tests(function, args)
+    else:
+        results = globals()[f'scenario_{scenario}'](args)
+    import tracing
+    for result in results:
+        result['peak_rss_mb'] = peak_rss_mb()
+        result['phases'] = tracing.snapshot()
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f)
+
+
+# --- родительский процесс ---
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_worker(scenario: str, function: Optional[str], argv: List[str]) -> List[Dict[str, Any]]:
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_file = f.name
+    # Трассировка в stdout на стенде не нужна, гистограммы забираются через tracing.snapshot().
+    # Запросы стенда и tests.json приходят с X-User-Id - на стенде он разрешён
+    env = dict(os.environ, TRACE_SLOW_MS='1e12', TRACE_SAMPLE_RATE='0', TRACE_DUMP_EVERY='0')
+    env.setdefault('AUTH_ALLOW_USER_ID_HEADER', 'true')
+    command = [sys.executable, __file__, *argv, '--worker', scenario, '--result-file', result_file]
+    if function:
+        command += ['--function', function]
+    try:
+        completed = subprocess.run(command, env=env)
+        if completed.returncode != 0:
+            return [{'name': f'{scenario}:{function}' if function else scenario, 'failed': completed.returncode}]
+        with open(result_file, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.unlink(result_file)
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Сравнение двух прогонов: изменение p95 и rps по совпадающим сценариям"""
+    with open(old_path, encoding='utf-8') as f:
+        old = {r['name']: r for r in json.load(f)['results']}
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+    for result in new:
+        base = old.get(result['name'])
+        if not base or 'failed' in base or 'failed' in result:
+            continue
+        p95_change = (result['p95_ms'] / base['p95_ms'] - 1) * 100 if base['p95_ms'] else 0.0
+        rps_change = (result['throughput_rps'] / base['throughput_rps'] - 1) * 100 if base['throughput_rps'] else 0.0
+        print(f"{result['name']:<24} p95 {base['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms ({p95_change:+.1f}%)  "
+              f"rps {base['throughput_rps']:>8.1f} -> {result['throughput_rps']:>8.1f} ({rps_change:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--functions', nargs='+', choices=FUNCTIONS, default=list(FUNCTIONS),
+                        help='функции для сценария tests')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20, help='повторов на сценарий')
+    parser.add_argument('--upload-mb', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--list-leads', type=int, default=10000)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--worker', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--function', choices=FUNCTIONS, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.worker:
+        worker(args.worker, args.function, args)
+        return
+
+    passthrough = [
+        '--concurrency', str(args.concurrency), '--iterations', str(args.iterations),
+        '--upload-mb', *map(str, args.upload_mb), '--list-leads', str(args.list_leads),
+    ]
+    results: List[Dict[str, Any]] = []
+    for scenario in args.scenarios:
+        for function in (args.functions if scenario == 'tests' else [None]):
+            for result in run_worker(scenario, function, passthrough):
+                print(json.dumps({k: v for k, v in result.items() if k != 'phases'}, ensure_ascii=False))
+                results.append(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': git_commit(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'concurrency': args.concurrency,
+            'iterations': args.iterations,
+            'results': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Параллельная регистрация одного и того же логина/email против auth2.
+
+    DATABASE_URL=postgresql://localhost/leads_bench TOKEN_KEYS=bench:secret \
+        python backend/bench/stress_register.py --threads 32 --rounds 20
+
+В каждом раунде --threads потоков одновременно регистрируют одинаковый
+логин (и отдельно - разные логины с одинаковым email). Ровно один запрос
+должен получить 201, остальные - 400 с сообщением про логин/email.
+Созданные пользователи удаляются в конце.
+'''
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+THREADS_DEFAULT = 32
+os.environ.setdefault('DB_POOL_MAX_SIZE', str(THREADS_DEFAULT))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'auth2'))
+
+import db  # noqa: E402
+from index import handler  # noqa: E402
+
+PREFIX = 'stress_'
+
+
+class Context:
+    request_id = 'stress'
+    function_name = 'auth2'
+
+
+def register(username: str, email: str, barrier: threading.Barrier):
+    event = {
+        'httpMethod': 'POST',
+        'headers': {},
+        'body': json.dumps({'action': 'register', 'username': username, 'password': 'pw', 'email': email})
+    }
+    barrier.wait()
+    started = time.perf_counter()
+    response = handler(event, Context())
+    return response['statusCode'], json.loads(response['body']), (time.perf_counter() - started) * 1000
+
+
+def run_round(pool: ThreadPoolExecutor, threads: int, same_username: bool):
+    tag = secrets.token_hex(4)
+    barrier = threading.Barrier(threads)
+    jobs = []
+    for i in range(threads):
+        username = f'{PREFIX}{tag}' if same_username else f'{PREFIX}{tag}_{i}'
+        email = f'{PREFIX}{tag}_{i}@example.com' if same_username else f'{PREFIX}{tag}@example.com'
+        jobs.append(pool.submit(register, username, email, barrier))
+    results = [job.result() for job in jobs]
+    created = [r for r in results if r[0] == 201]
+    expected_error = 'логином' if same_username else 'email'
+    rejected = [r for r in results if r[0] == 400 and expected_error in r[1].get('error', '')]
+    assert len(created) == 1, f'expected exactly one 201, got {len(created)}: {results}'
+    assert len(rejected) == threads - 1, f'unexpected responses: {results}'
+    return [r[2] for r in results]
+
+
+def cleanup() -> None:
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM t_p80273517_video_feedback_app.users WHERE username LIKE %s', (PREFIX + '%',))
+        conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=THREADS_DEFAULT)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    latencies = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            for i in range(args.rounds):
+                latencies += run_round(pool, args.threads, same_username=(i % 2 == 0))
+    finally:
+        cleanup()
+    latencies.sort()
+    print(json.dumps({
+        'rounds': args.rounds,
+        'threads': args.threads,
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        'pool': db.pool_stats()
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+'''
+Пакетная выдача видео: GET ?ids=1,2,3 -> NDJSON, по строке на лид.
+
+    {"id": 1, "filename": ..., "videoBase64": "..."}
+    {"id": 2, "error": "Video not found"}
+    {"next_ids": [3]}
+
+Строки читаются из именованного (серверного) курсора по BATCH_FETCH_ROWS и
+сразу пишутся в ответ, поэтому в памяти одновременно лежит одно видео, а не
+все. Ответ функции всё равно собирается целиком, поэтому после
+BATCH_MAX_BYTES выдача обрывается строкой next_ids - их клиент запрашивает
+следующим вызовом.
+'''
+import base64
+import os
+from typing import Any, Dict, List
+
+import lead_rows
+import runtime
+import storage
+import tracing
+
+BATCH_MAX_IDS = 100
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', str(3 * 1024 * 1024)))
+BATCH_FETCH_ROWS = 1
+
+
+def parse_ids(value: str) -> List[int]:
+    """Список id из ?ids=1,2,3: без повторов, по возрастанию, не больше BATCH_MAX_IDS"""
+    try:
+        ids = sorted({int(item) for item in value.split(',') if item.strip()})
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers')
+    if not ids:
+        raise ValueError('ids must be a comma-separated list of integers')
+    if len(ids) > BATCH_MAX_IDS:
+        raise ValueError(f'At most {BATCH_MAX_IDS} ids per request')
+    return ids
+
+
+def _video_bytes(video_data: Any, video_url: Any) -> bytes:
+    if video_url:
+        store = storage.get_store()
+        if store is None:
+            raise RuntimeError('BLOB_STORAGE_BACKEND не настроен')
+        with store.open(video_url) as f:
+            return f.read()
+    return video_data or b''
+
+
+def fetch_batch(conn, user_id: int, ids: List[int], cors_headers: Dict[str, str],
+                max_bytes: int = BATCH_MAX_BYTES) -> Dict[str, Any]:
+    parts: List[str] = []
+    size = 0
+    pending = iter(ids)
+    expected = next(pending, None)
+
+    def missing_until(lead_id: Any) -> None:
+        """Строки ошибок для запрошенных id меньше lead_id, которых нет в выборке"""
+        nonlocal expected, size
+        while expected is not None and (lead_id is None or expected < lead_id):
+            line = runtime.dumps({'id': expected, 'error': 'Video not found'}) + '\n'
+            parts.append(line)
+            size += len(line)
+            expected = next(pending, None)
+
+    # Именованный курсор: строки (и bytea) приходят с сервера по BATCH_FETCH_ROWS
+    truncated = False
+    with conn.cursor(name='leads_batch') as cursor:
+        cursor.execute(f'''
+            SELECT {lead_rows.LEAD_COLUMNS}, video_data, video_url
+            FROM t_p80273517_video_feedback_app.user_videos
+            WHERE user_id = %s AND id = ANY(%s)
+            ORDER BY id
+        ''', (user_id, ids))
+        while True:
+            if size >= max_bytes:
+                truncated = expected is not None
+                break
+            with tracing.phase('query'):
+                rows = cursor.fetchmany(BATCH_FETCH_ROWS)
+            if not rows:
+                break
+            while rows:
+                # pop, а не for: видео строки освобождается сразу после записи
+                row = rows.pop(0)
+                missing_until(row[0])
+                with tracing.phase('store'):
+                    video = _video_bytes(row[lead_rows.VIDEO_INDEX], row[lead_rows.VIDEO_INDEX + 1])
+                with tracing.phase('serialize'):
+                    # Метаданные через dumps, а base64 дописывается отдельной частью без лишней копии
+                    head = runtime.dumps(lead_rows.lead_dict(row))[:-1]
+                    del row
+                    encoded = base64.b64encode(video).decode('ascii')
+                    del video
+                parts.extend((head, ',"videoBase64":"', encoded, '"}\n'))
+                size += len(head) + len(encoded) + 19
+                expected = next(pending, None)
+
+    if truncated:
+        # Бюджет ответа исчерпан: остальное - следующим запросом
+        parts.append(runtime.dumps({'next_ids': [expected, *pending]}) + '\n')
+    else:
+        missing_until(None)
+
+    return {
+        'statusCode': 200,
+        # no-transform: строки с base64 видео не сжимаются (см. runtime.Service.compress)
+        'headers': dict(cors_headers, **{'Content-Type': 'application/x-ndjson', 'Cache-Control': 'private, no-transform'}),
+        'body': ''.join(parts),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,33 @@
+'''
+ETag для условных GET (If-None-Match -> 304).
+
+Список: версия из user_lead_stats (lead_stats.py) плюс параметры
+страницы. Неизменившийся опрос стоит одного поиска по первичному ключу.
+
+Видео: sha256 из ключа blob-хранилища. У старых лидов с video_data
+хэша нет, но видео лида не меняется, поэтому берётся id.
+'''
+import hashlib
+from typing import Any, Optional
+
+# Клиент может хранить ответ, но обязан перепроверять его по ETag
+REVALIDATE = {'Cache-Control': 'private, no-cache'}
+# То же для ответов с видео внутри: base64 уже сжатого видео
+# не стоит сжимать ещё раз
+REVALIDATE_VIDEO = {'Cache-Control': 'private, no-cache, no-transform'}
+
+
+def list_etag(user_id: int, version: int, *params: Any) -> str:
+    digest = hashlib.sha1(repr((user_id, version) + params).encode('utf-8')).hexdigest()
+    return f'"l-{digest[:24]}"'
+
+
+def video_etag(video_id: int, video_url: Optional[str], version: Optional[int] = None) -> str:
+    """
+    ETag содержимого видео; version - для JSON-ответа, где рядом с видео
+    есть и метаданные
+    """
+    tag = video_url.rsplit('/', 1)[-1] if video_url else f'lead-{video_id}'
+    if version is not None:
+        tag += f'-{version}'
+    return f'"{tag}"'
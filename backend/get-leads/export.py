@@ -0,0 +1,338 @@
+'''
+Выгрузка всех лидов пользователя одним архивом (tar или zip).
+
+    DATABASE_URL=... python export.py --user-id 123 --format zip --manifest csv -o leads.zip
+
+В архиве videos/<id>.<расширение> и manifest.json (или manifest.csv) с
+метаданными лидов. Метаданные читаются именованным (серверным) курсором по
+id, видео копируется в архив кусками по EXPORT_CHUNK_BYTES - из blob-хранилища
+или substring'ом из bytea, - а манифест копится во временном файле и
+дописывается последним. Память не зависит от числа и размера лидов, архив
+можно писать в stdout.
+
+Выгрузка продолжается с места остановки: --after-id (или ?after_id=) - id
+последнего выгруженного лида. Через get-leads?export=tar ответ собирается
+целиком, поэтому часть обрывается после EXPORT_MAX_BYTES; id для следующей
+части - в заголовке X-Next-After-Id и в манифесте. Видео больше
+EXPORT_MAX_BYTES в такую часть не попадает (в манифесте "error":
+"too_large") - его отдаёт ?video_id=..&raw=1.
+'''
+import argparse
+import base64
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import Any, BinaryIO, Dict, NamedTuple, Optional, Tuple
+
+import lead_rows
+import runtime
+import storage
+import tracing
+
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+EXPORT_CHUNK_BYTES = 1024 * 1024
+EXPORT_FETCH_ROWS = 500
+MANIFEST_SPOOL_BYTES = 1024 * 1024
+FORMATS = {
+    'tar': ('application/x-tar', '.tar'),
+    'zip': ('application/zip', '.zip'),
+}
+MANIFEST_FORMATS = ('json', 'csv')
+MANIFEST_FIELDS = ('id', 'path', 'error', 'filename', 'original_filename', 'file_size', 'duration', 'comments',
+                   'created_at', 'latitude', 'longitude', 'width', 'height', 'video_codec')
+
+# Размер видео: из blob-хранилища берётся file_size, из bytea - фактическая длина
+SELECT_LEADS = f'''
+    SELECT {lead_rows.LEAD_COLUMNS}, video_url,
+           CASE WHEN video_url IS NULL THEN octet_length(video_data) ELSE file_size END
+    FROM t_p80273517_video_feedback_app.user_videos
+    WHERE user_id = %s AND id > %s
+    ORDER BY id
+'''
+
+SELECT_SLICE = '''
+    SELECT substring(video_data FROM %s FOR %s)
+    FROM t_p80273517_video_feedback_app.user_videos
+    WHERE user_id = %s AND id = %s
+'''
+
+
+class ExportResult(NamedTuple):
+    count: int
+    last_id: Optional[int]
+    complete: bool
+
+
+def parse_export(query: Dict[str, str]) -> Tuple[str, str, int]:
+    """(формат архива, формат манифеста, after_id) из ?export=&manifest=&after_id="""
+    archive = (query.get('export') or '').lower()
+    if archive not in FORMATS:
+        raise ValueError('export must be one of: ' + ', '.join(FORMATS))
+    manifest = (query.get('manifest') or 'json').lower()
+    if manifest not in MANIFEST_FORMATS:
+        raise ValueError('manifest must be one of: ' + ', '.join(MANIFEST_FORMATS))
+    try:
+        after_id = int(query.get('after_id') or 0)
+    except ValueError:
+        after_id = -1
+    if after_id < 0:
+        raise ValueError('after_id must be a non-negative integer')
+    return archive, manifest, after_id
+
+
+class _CountingWriter:
+    '''Обёртка над выходным потоком: считает байты, seek не умеет (zip пишет дескрипторы данных)'''
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.out.write(data)
+        self.written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.written
+
+    def flush(self) -> None:
+        self.out.flush()
+
+
+class _ChunkReader:
+    '''Файловый объект поверх генератора кусков: tar читает его мелкими порциями'''
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._chunk = memoryview(b'')
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size < 0 or size > 0:
+            if not self._chunk:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._chunk = memoryview(chunk)
+            part = self._chunk if size < 0 else self._chunk[:size]
+            self._chunk = self._chunk[len(part):]
+            parts.append(part)
+            if size > 0:
+                size -= len(part)
+        return b''.join(parts)
+
+
+class _TarArchive:
+    def __init__(self, out: _CountingWriter):
+        # 'w|' - потоковый режим без seek, размер записи нужен заранее
+        self.tar = tarfile.open(fileobj=out, mode='w|', format=tarfile.PAX_FORMAT)
+
+    def add(self, name: str, size: int, mtime: float, chunks) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        self.tar.addfile(info, _ChunkReader(chunks))
+
+    def close(self) -> None:
+        self.tar.close()
+
+
+class _ZipArchive:
+    def __init__(self, out: _CountingWriter):
+        self.zip = zipfile.ZipFile(out, mode='w', allowZip64=True)
+
+    def add(self, name: str, size: int, mtime: float, chunks) -> None:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+        # Видео уже сжато кодеком - хранится как есть; манифест - deflate
+        info.compress_type = zipfile.ZIP_STORED if name.startswith('videos/') else zipfile.ZIP_DEFLATED
+        with self.zip.open(info, mode='w', force_zip64=True) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+class _Manifest:
+    '''Манифест во временном файле: в памяти не больше MANIFEST_SPOOL_BYTES'''
+
+    def __init__(self, kind: str, user_id: int):
+        self.kind = kind
+        self.file = tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL_BYTES)
+        self.count = 0
+        if kind == 'csv':
+            self._write_csv(MANIFEST_FIELDS)
+        else:
+            self.file.write(f'{{"user_id":{int(user_id)},"leads":['.encode('ascii'))
+
+    def _write_csv(self, values) -> None:
+        line = io.StringIO()
+        csv.writer(line).writerow(values)
+        self.file.write(line.getvalue().encode('utf-8'))
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        if self.kind == 'csv':
+            self._write_csv([entry.get(field) for field in MANIFEST_FIELDS])
+        else:
+            self.file.write(((',\n' if self.count else '\n') + runtime.dumps(entry)).encode('utf-8'))
+        self.count += 1
+
+    def finish(self, result: ExportResult) -> int:
+        """Закрывает манифест; возвращает размер, позиция - в начале"""
+        if self.kind == 'json':
+            tail = {'count': result.count, 'complete': result.complete,
+                    'next_after_id': None if result.complete else result.last_id}
+            self.file.write(('\n],' + runtime.dumps(tail)[1:]).encode('utf-8'))
+        size = self.file.tell()
+        self.file.seek(0)
+        return size
+
+    def chunks(self):
+        return iter(lambda: self.file.read(EXPORT_CHUNK_BYTES), b'')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _video_path(lead_id: int, filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or '')[1].lower()
+    if not (1 < len(ext) <= 8 and ext[1:].isalnum()):
+        ext = '.mp4'
+    return f'videos/{lead_id}{ext}'
+
+
+def _bytea_chunks(conn, user_id: int, lead_id: int, size: int):
+    """Видео из bytea кусками: substring вычитывает из TOAST только нужное"""
+    with conn.cursor() as cursor:
+        for start in range(0, size, EXPORT_CHUNK_BYTES):
+            with tracing.phase('query'):
+                cursor.execute(SELECT_SLICE, (start + 1, EXPORT_CHUNK_BYTES, user_id, lead_id))
+                chunk = bytes(cursor.fetchone()[0])
+            yield chunk
+
+
+def _blob_chunks(fileobj: BinaryIO):
+    try:
+        while True:
+            with tracing.phase('store'):
+                chunk = fileobj.read(EXPORT_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def write_archive(conn, user_id: int, out: BinaryIO, archive_format: str = 'tar', manifest_format: str = 'json',
+                  after_id: int = 0, max_bytes: Optional[int] = None) -> ExportResult:
+    """
+    Пишет в out архив лидов с id > after_id. conn - не autocommit: именованный
+    курсор живёт в транзакции. max_bytes - после скольких байт архива
+    остановиться (None - выгрузить всё).
+    """
+    writer = _CountingWriter(out)
+    archive = _TarArchive(writer) if archive_format == 'tar' else _ZipArchive(writer)
+    manifest = _Manifest(manifest_format, user_id)
+    count = 0
+    last_id = None
+    complete = True
+    try:
+        with conn.cursor(name='leads_export') as cursor:
+            cursor.itersize = EXPORT_FETCH_ROWS
+            with tracing.phase('query'):
+                cursor.execute(SELECT_LEADS, (user_id, after_id))
+            for row in cursor:
+                lead = lead_rows.lead_dict(row)
+                video_url, size = row[lead_rows.VIDEO_INDEX], row[lead_rows.VIDEO_INDEX + 1] or 0
+                lead_id = lead['id']
+                if max_bytes is not None and count and writer.written + size > max_bytes:
+                    complete = False
+                    break
+                entry = dict(lead, path=None, error=None)
+                if not size:
+                    entry['error'] = 'no_video'
+                elif max_bytes is not None and size > max_bytes:
+                    entry['error'] = 'too_large'
+                else:
+                    chunks = None
+                    if video_url:
+                        store = storage.get_store()
+                        if store is None:
+                            raise RuntimeError('BLOB_STORAGE_BACKEND не настроен')
+                        try:
+                            with tracing.phase('store'):
+                                chunks = _blob_chunks(store.open(video_url))
+                        except storage.BlobNotFound:
+                            entry['error'] = 'not_found'
+                    else:
+                        chunks = _bytea_chunks(conn, user_id, lead_id, size)
+                    if chunks is not None:
+                        entry['path'] = _video_path(lead_id, lead['filename'])
+                        mtime = row[6].timestamp() if row[6] else time.time()
+                        archive.add(entry['path'], size, mtime, chunks)
+                manifest.add(entry)
+                count += 1
+                last_id = lead_id
+        result = ExportResult(count, last_id, complete)
+        name = 'manifest.' + manifest_format
+        size = manifest.finish(result)
+        archive.add(name, size, time.time(), manifest.chunks())
+        archive.close()
+    finally:
+        manifest.close()
+    return result
+
+
+def export_response(conn, user_id: int, archive_format: str, manifest_format: str, after_id: int,
+                    cors_headers: Dict[str, str], max_bytes: int = EXPORT_MAX_BYTES) -> Dict[str, Any]:
+    """Часть архива для get-leads?export=...: тело целиком, base64"""
+    content_type, suffix = FORMATS[archive_format]
+    buffer = io.BytesIO()
+    result = write_archive(conn, user_id, buffer, archive_format, manifest_format, after_id, max_bytes)
+    headers = dict(cors_headers, **{
+        'Content-Type': content_type,
+        'Content-Disposition': f'attachment; filename="leads-{user_id}-{after_id}{suffix}"',
+        # no-transform: архив с видео не сжимается (см. runtime.Service.compress)
+        'Cache-Control': 'private, no-transform',
+        'X-Export-Complete': 'true' if result.complete else 'false',
+    })
+    if not result.complete:
+        headers['X-Next-After-Id'] = str(result.last_id)
+    with tracing.phase('serialize'):
+        body = base64.b64encode(buffer.getbuffer()).decode('ascii')
+    return {'statusCode': 200, 'headers': headers, 'body': body, 'isBase64Encoded': True}
+
+
+def main() -> None:
+    import db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='tar')
+    parser.add_argument('--manifest', choices=MANIFEST_FORMATS, default='json')
+    parser.add_argument('--after-id', type=int, default=0, help='продолжить после этого id лида')
+    parser.add_argument('--max-bytes', type=int, help='остановиться после стольких байт архива')
+    parser.add_argument('-o', '--output', default='-', help='файл архива, по умолчанию stdout')
+    args = parser.parse_args()
+
+    out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        with db.connection() as conn:
+            result = write_archive(conn, args.user_id, out, args.format, args.manifest, args.after_id, args.max_bytes)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(json.dumps({'leads': result.count, 'last_id': result.last_id, 'complete': result.complete}),
+          file=sys.stderr)
+    if not result.complete:
+        print(f'продолжить: --after-id {result.last_id}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
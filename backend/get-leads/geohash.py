@@ -0,0 +1,155 @@
+'''
+Geohash для геопоиска лидов без PostGIS.
+
+Ячейка geohash длины p - прямоугольник, и все точки внутри неё имеют общий
+префикс, поэтому B-tree по (user_id, geohash COLLATE "C") отвечает на
+"точки в ячейке" диапазоном [prefix, prefix + '~'). Прямоугольник и
+ближайшие точки сводятся к нескольким таким диапазонам.
+'''
+import math
+from typing import List, Optional, Tuple
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+
+_DECODE = {char: index for index, char in enumerate(BASE32)}
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (rng[0] + rng[1]) / 2
+        if coord >= middle:
+            value = value * 2 + 1
+            rng[0] = middle
+        else:
+            value *= 2
+            rng[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) ячейки"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            middle = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = middle
+            else:
+                rng[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(высота, ширина) ячейки в градусах"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def coordinates(latitude, longitude) -> Optional[Tuple[float, float]]:
+    """Проверенные координаты или None, если их нет или они вне диапазона"""
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def encode_optional(latitude, longitude) -> Optional[str]:
+    point = coordinates(latitude, longitude)
+    return encode(*point) if point else None
+
+
+def _wrap_lon(lon: float) -> float:
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def neighbourhood(latitude: float, longitude: float, precision: int) -> List[str]:
+    """Ячейка точки и её соседи (до 9 префиксов)"""
+    height, width = cell_size(precision)
+    cells = []
+    for d_lat in (-height, 0.0, height):
+        lat = latitude + d_lat
+        if not -90 <= lat <= 90:
+            continue
+        for d_lon in (-width, 0.0, width):
+            cell = encode(lat, _wrap_lon(longitude + d_lon), precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def cover(south: float, west: float, north: float, east: float, max_cells: int = 32) -> List[str]:
+    """
+    Префиксы, ячейки которых покрывают прямоугольник: самая мелкая длина,
+    при которой ячеек не больше max_cells. west > east - через 180-й меридиан.
+    """
+    span_lon = east - west if west <= east else east - west + 360.0
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        columns = math.floor((west + span_lon) / width) - math.floor(west / width) + 1
+        if rows * columns <= max_cells or precision == 1:
+            break
+    cells = []
+    lat = south
+    while True:
+        lon = west
+        while True:
+            cell = encode(min(lat, 90.0), _wrap_lon(lon) if lon != 180.0 else 180.0, precision)
+            if cell not in cells:
+                cells.append(cell)
+            if lon >= west + span_lon:
+                break
+            lon = min(lon + width, west + span_lon)
+        if lat >= north:
+            break
+        lat = min(lat + height, north)
+    return cells
+
+
+def prefix_ranges(prefixes: List[str]) -> Tuple[List[str], List[str]]:
+    """Префиксы как диапазоны [lo, hi) для сравнения строк в COLLATE "C" """
+    return list(prefixes), [prefix + '~' for prefix in prefixes]
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по дуге большого круга (гаверсинус)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def min_reach_km(latitude: float, precision: int) -> float:
+    """
+    Нижняя граница расстояния от точки до края окрестности из 9 ячеек:
+    всё, что ближе, гарантированно лежит в neighbourhood().
+    """
+    height, width = cell_size(precision)
+    # До параллели - по меридиану, до меридиана (большого круга) - asin(cos(phi) * sin(d_lambda))
+    lat_km = math.radians(height) * EARTH_RADIUS_KM
+    lon_km = math.asin(math.cos(math.radians(latitude)) * math.sin(math.radians(min(width, 90.0)))) * EARTH_RADIUS_KM
+    return min(lat_km, lon_km)
@@ -1,8 +1,28 @@
-import json
 import base64
 import os
-import psycopg2
-from typing import Dict, Any, List
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import batch
+import db
+import etags
+import export
+import lead_rows
+import lead_stats
+import pagination
+import runtime
+import search
+import spatial
+import storage
+import streaming
+import tokens
+import tracing
+
+service = runtime.Service(allow_headers=('Content-Type', 'X-User-Id', 'X-Auth-Token', 'Range', 'If-None-Match',
+                                         'X-Last-Write-At'),
+                          expose_headers=('ETag', 'Content-Disposition', 'X-Export-Complete', 'X-Next-After-Id'),
+                          compress=True)
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -11,165 +31,255 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
           context - объект с атрибутами request_id, function_name
     Returns: HTTP response dict со списком лидов
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    cors_headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-    }
-    
-    # Handle CORS OPTIONS request
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps({'message': 'OK'}),
-            'isBase64Encoded': False
-        }
-    
-    if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': cors_headers,
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+    return service(event, context)
+
+
+@service.route('GET')
+def get_leads(request: runtime.Request) -> Dict[str, Any]:
+    query_params = request.query
+    
+    # Параметр raw=1 отдаёт само видео с поддержкой Range (для <video src>)
+    raw = query_params.get('raw', '').lower() in ('1', 'true')
+    
+    # Параметр для получения видео-данных (опционально)
+    include_video = query_params.get('include_video', '').lower() == 'true'
+    video_id = query_params.get('video_id')  # Для получения конкретного видео
+    if video_id and not video_id.isdigit():
+        return service.error(400, 'Invalid video_id')
+    
+    # Подпись токена проверяется в процессе, без запроса в БД.
+    # Тег <video> не умеет передавать заголовки, поэтому для raw - ещё и
+    # ?token=, выданный на это видео (stream_token=1)
+    scope = tokens.video_scope(int(video_id)) if raw and video_id else None
+    try:
+        user_id = tokens.authenticate(request.headers, query_params if raw else None, scope)
+    except tokens.InvalidToken:
+        return service.error(401, 'Invalid or expired token')
+    if not user_id:
+        return service.error(401, 'Authentication required')
+    
+    # Короткий токен на одно видео для <video src>: сессионный токен в URL
+    # осел бы в логах и истории браузера
+    if video_id and not raw and query_params.get('stream_token', '').lower() in ('1', 'true'):
+        stream_token = tokens.issue_token(
+            user_id, tokens.VIDEO_TOKEN_TTL_SECONDS, scope=tokens.video_scope(int(video_id))
+        )
+        return service.respond(200, {'token': stream_token, 'expires_in': tokens.VIDEO_TOKEN_TTL_SECONDS})
+    
+    # Подключаемся к базе данных
+    if not os.environ.get('DATABASE_URL'):
+        return service.error(500, 'Database connection not configured')
     
+    # Чтения идут на реплику (DATABASE_URL_READONLY), кроме как сразу после записи
+    # пользователя: created_at его последнего лида приходит в X-Last-Write-At
+    last_write_at = parse_last_write_at(request.header('X-Last-Write-At') or query_params.get('last_write_at'))
+    
+    ids = query_params.get('ids')
+    if ids:
+        # Несколько видео сразу - NDJSON из серверного курсора (нужна транзакция)
+        try:
+            lead_ids = batch.parse_ids(ids)
+        except ValueError as e:
+            return service.error(400, str(e))
+        return db.read(lambda conn: batch.fetch_batch(conn, user_id, lead_ids, service.cors_headers),
+                       autocommit=False, last_write_at=last_write_at)
+    
+    if query_params.get('export'):
+        # Архив видео с манифестом; именованный курсор тоже требует транзакции
+        try:
+            archive_format, manifest_format, after_id = export.parse_export(query_params)
+        except ValueError as e:
+            return service.error(400, str(e))
+        return db.read(lambda conn: export.export_response(conn, user_id, archive_format, manifest_format, after_id,
+                                                           service.cors_headers),
+                       autocommit=False, last_write_at=last_write_at)
+    
+    return db.read(lambda conn: read_leads(conn, request, user_id, include_video, video_id, raw),
+                   last_write_at=last_write_at)
+
+
+def parse_last_write_at(value: Optional[str]) -> Optional[float]:
+    """Время последней записи (ISO created_at из save-lead или unix-мс) -> unix-время; мусор - None"""
+    if not value:
+        return None
     try:
-        headers = event.get('headers', {})
-        query_params = event.get('queryStringParameters') or {}
-        
-        user_id = headers.get('X-User-Id') or headers.get('x-user-id')
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'User ID is required'}),
-                'isBase64Encoded': False
-            }
-        
-        # Параметр для получения видео-данных (опционально)
-        include_video = query_params.get('include_video', '').lower() == 'true'
-        video_id = query_params.get('video_id')  # Для получения конкретного видео
-        
-        # Подключаемся к базе данных
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
-            return {
-                'statusCode': 500,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'Database connection not configured'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(database_url)
-        cursor = conn.cursor()
-        
+        if value.isdigit():
+            return int(value) / 1000
+        moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    # created_at - TIMESTAMP без зоны, CURRENT_TIMESTAMP базы в UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def read_leads(conn, request: runtime.Request, user_id: int, include_video: bool,
+               video_id: Optional[str], raw: bool) -> Dict[str, Any]:
+    query_params = request.query
+    with conn.cursor() as cursor:
+        if video_id and raw:
+            return streaming.stream_video(
+                cursor, user_id, int(video_id), request.header('Range'), service.cors_headers,
+                request.header('If-None-Match')
+            )
+        if 'q' in query_params:
+            return search_leads(cursor, request, user_id)
+        if query_params.get('bbox') or query_params.get('near'):
+            return find_leads(cursor, request, user_id)
+        if query_params.get('summary', '').lower() in ('1', 'true'):
+            return get_summary(cursor, request, user_id)
         if video_id:
-            # Получаем конкретное видео с данными
-            query = '''
-                SELECT id, filename, original_filename, file_size, duration, comments, 
-                       created_at, latitude, longitude, video_data
-                FROM t_p80273517_video_feedback_app.user_videos 
-                WHERE user_id = %s AND id = %s
-            '''
-            cursor.execute(query, (int(user_id), int(video_id)))
-            row = cursor.fetchone()
-            
-            if not row:
-                cursor.close()
-                conn.close()
-                return {
-                    'statusCode': 404,
-                    'headers': cors_headers,
-                    'body': json.dumps({'error': 'Video not found'}),
-                    'isBase64Encoded': False
-                }
-            
-            video_data = {
-                'id': row[0],
-                'filename': row[1],
-                'original_filename': row[2],
-                'file_size': row[3],
-                'duration': row[4],
-                'comments': row[5],
-                'created_at': row[6].isoformat() if row[6] else None,
-                'latitude': float(row[7]) if row[7] else None,
-                'longitude': float(row[8]) if row[8] else None,
-                'videoBase64': base64.b64encode(row[9]).decode('utf-8') if row[9] else None
-            }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': cors_headers,
-                'body': json.dumps(video_data),
-                'isBase64Encoded': False
-            }
-        
+            return get_video(cursor, request, user_id, int(video_id))
+        return list_leads(cursor, request, user_id, include_video)
+
+
+def search_leads(cursor, request: runtime.Request, user_id: int) -> Dict[str, Any]:
+    """Поиск по комментариям (?q=), по релевантности, с курсором"""
+    query_params = request.query
+    try:
+        query = search.parse_query(query_params['q'] or '')
+        limit = pagination.parse_limit(query_params.get('limit'))
+        after = query_params.get('cursor')
+        after_key = search.decode_rank_cursor(after) if after else None
+    except ValueError as e:
+        return service.error(400, str(e))
+    
+    etag = etags.list_etag(user_id, lead_stats.fetch(cursor, user_id).version, 'q', query, limit, after)
+    if request.etag_matches(etag):
+        return service.not_modified(etag, etags.REVALIDATE)
+    result = search.search(cursor, user_id, query, limit, after_key)
+    return service.respond(200, result, dict(etags.REVALIDATE, ETag=etag))
+
+
+def find_leads(cursor, request: runtime.Request, user_id: int) -> Dict[str, Any]:
+    """Геопоиск: лиды в прямоугольнике (?bbox=) или k ближайших к точке (?near=&k=)"""
+    query_params = request.query
+    try:
+        if query_params.get('bbox'):
+            bbox = spatial.parse_bbox(query_params['bbox'])
+            limit = pagination.parse_limit(query_params.get('limit'))
+            key = ('bbox', bbox, limit)
         else:
-            # Получаем список всех лидов пользователя
-            if include_video:
-                query = '''
-                    SELECT id, filename, original_filename, file_size, duration, comments, 
-                           created_at, latitude, longitude, video_data
-                    FROM t_p80273517_video_feedback_app.user_videos 
-                    WHERE user_id = %s 
-                    ORDER BY created_at DESC
-                '''
-            else:
-                query = '''
-                    SELECT id, filename, original_filename, file_size, duration, comments, 
-                           created_at, latitude, longitude
-                    FROM t_p80273517_video_feedback_app.user_videos 
-                    WHERE user_id = %s 
-                    ORDER BY created_at DESC
-                '''
-            
-            cursor.execute(query, (int(user_id),))
-            rows = cursor.fetchall()
-            
-            leads: List[Dict[str, Any]] = []
-            for row in rows:
-                lead = {
-                    'id': row[0],
-                    'filename': row[1],
-                    'original_filename': row[2],
-                    'file_size': row[3],
-                    'duration': row[4],
-                    'comments': row[5],
-                    'created_at': row[6].isoformat() if row[6] else None,
-                    'latitude': float(row[7]) if row[7] else None,
-                    'longitude': float(row[8]) if row[8] else None
-                }
-                
-                # Добавляем видео данные если запрошено
-                if include_video and len(row) > 9 and row[9]:
-                    lead['videoBase64'] = base64.b64encode(row[9]).decode('utf-8')
-                
-                leads.append(lead)
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': cors_headers,
-                'body': json.dumps({
-                    'leads': leads,
-                    'count': len(leads)
-                }),
-                'isBase64Encoded': False
-            }
-            
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': cors_headers,
-            'body': json.dumps({'error': f'Server error: {str(e)}'}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+            near = spatial.parse_near(query_params['near'], query_params.get('k'))
+            key = ('near', near)
+    except ValueError as e:
+        return service.error(400, str(e))
+    
+    etag = etags.list_etag(user_id, lead_stats.fetch(cursor, user_id).version, *key)
+    if request.etag_matches(etag):
+        return service.not_modified(etag, etags.REVALIDATE)
+    if key[0] == 'bbox':
+        leads = spatial.in_bbox(cursor, user_id, bbox, limit)
+    else:
+        leads = spatial.nearest(cursor, user_id, *near)
+    return service.respond(200, {'leads': leads, 'count': len(leads)}, dict(etags.REVALIDATE, ETag=etag))
+
+
+def get_summary(cursor, request: runtime.Request, user_id: int) -> Dict[str, Any]:
+    """Количество лидов, их объём и время последнего - для дашборда и проверки квот"""
+    stats = lead_stats.fetch(cursor, user_id)
+    etag = etags.list_etag(user_id, stats.version, 'summary')
+    if request.etag_matches(etag):
+        return service.not_modified(etag, etags.REVALIDATE)
+    return service.respond(200, lead_stats.summary_dict(stats), dict(etags.REVALIDATE, ETag=etag))
+
+
+def get_video(cursor, request: runtime.Request, user_id: int, video_id: int) -> Dict[str, Any]:
+    """Конкретное видео вместе с данными"""
+    # Сначала лёгкий запрос без bytea: при совпадении ETag видео не читается
+    with tracing.phase('query'):
+        cursor.execute('''
+            SELECT video_url,
+                   (SELECT version FROM t_p80273517_video_feedback_app.user_lead_stats WHERE user_id = %s)
+            FROM t_p80273517_video_feedback_app.user_videos
+            WHERE user_id = %s AND id = %s
+        ''', (user_id, user_id, video_id))
+        head = cursor.fetchone()
+    if not head:
+        return service.error(404, 'Video not found')
+    etag = etags.video_etag(video_id, head[0], head[1] or 0)
+    if request.etag_matches(etag):
+        return service.not_modified(etag, etags.REVALIDATE_VIDEO)
+    
+    with tracing.phase('query'):
+        cursor.execute(f'''
+            SELECT {lead_rows.LEAD_COLUMNS}, video_data, video_url
+            FROM t_p80273517_video_feedback_app.user_videos 
+            WHERE user_id = %s AND id = %s
+        ''', (user_id, video_id))
+        row = cursor.fetchone()
+    
+    if not row:
+        return service.error(404, 'Video not found')
+    
+    video_data = lead_rows.lead_dict(row)
+    video_data['videoBase64'] = encode_video(row[lead_rows.VIDEO_INDEX], row[lead_rows.VIDEO_INDEX + 1])
+    return service.respond(200, video_data, dict(etags.REVALIDATE_VIDEO, ETag=etag))
+
+
+def list_leads(cursor, request: runtime.Request, user_id: int, include_video: bool) -> Dict[str, Any]:
+    """Страница лидов пользователя (keyset-пагинация по (created_at, id))"""
+    query_params = request.query
+    try:
+        limit = pagination.parse_limit(query_params.get('limit'))
+        after = query_params.get('cursor')
+        after_key = pagination.decode_created_cursor(after) if after else None
+    except ValueError as e:
+        return service.error(400, str(e))
+    
+    # Список не менялся с прошлого опроса - один поиск по ключу и пустой 304
+    stats = lead_stats.fetch(cursor, user_id)
+    etag = etags.list_etag(user_id, stats.version, limit, after, include_video)
+    if request.etag_matches(etag):
+        return service.not_modified(etag, etags.REVALIDATE_VIDEO if include_video else etags.REVALIDATE)
+    
+    columns = lead_rows.LEAD_COLUMNS
+    if include_video:
+        columns += ', video_data, video_url'
+    where = 'user_id = %s'
+    params: List[Any] = [user_id]
+    if after_key:
+        where += ' AND (created_at, id) < (%s, %s)'
+        params.extend(after_key)
+    params.append(limit + 1)
+    
+    with tracing.phase('query'):
+        cursor.execute(f'''
+            SELECT {columns}
+            FROM t_p80273517_video_feedback_app.user_videos 
+            WHERE {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        ''', params)
+        rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    leads: List[Dict[str, Any]] = []
+    for row in rows:
+        lead = lead_rows.lead_dict(row)
+        # Добавляем видео данные если запрошено
+        if include_video and (row[lead_rows.VIDEO_INDEX] or row[lead_rows.VIDEO_INDEX + 1]):
+            lead['videoBase64'] = encode_video(row[lead_rows.VIDEO_INDEX], row[lead_rows.VIDEO_INDEX + 1])
+        leads.append(lead)
+    
+    return service.respond(200, {
+        'leads': leads,
+        'count': len(leads),
+        'total': stats.lead_count,
+        'next_cursor': pagination.encode_cursor(rows[-1][6], rows[-1][0]) if has_more else None
+    }, dict(etags.REVALIDATE_VIDEO if include_video else etags.REVALIDATE, ETag=etag))
+
+
+def encode_video(video_data: Any, video_url: Optional[str]) -> Optional[str]:
+    """Base64 видео из blob-хранилища или из старой колонки video_data"""
+    if video_url:
+        store = storage.get_store()
+        if store is None:
+            raise RuntimeError('BLOB_STORAGE_BACKEND не настроен')
+        with tracing.phase('store'), store.open(video_url) as f:
+            return base64.b64encode(f.read()).decode('utf-8')
+    if video_data:
+        return base64.b64encode(video_data).decode('utf-8')
+    return None
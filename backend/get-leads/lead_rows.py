@@ -0,0 +1,26 @@
+from typing import Any, Dict
+
+LEAD_COLUMNS = (
+    'id, filename, original_filename, file_size, duration, comments, created_at, latitude, longitude, '
+    'width, height, video_codec'
+)
+# Позиция video_data, video_url в строке, если они запрошены после LEAD_COLUMNS
+VIDEO_INDEX = 12
+
+
+def lead_dict(row) -> Dict[str, Any]:
+    """Строка с колонками LEAD_COLUMNS -> JSON лида"""
+    return {
+        'id': row[0],
+        'filename': row[1],
+        'original_filename': row[2],
+        'file_size': row[3],
+        'duration': row[4],
+        'comments': row[5],
+        'created_at': row[6].isoformat() if row[6] else None,
+        'latitude': float(row[7]) if row[7] else None,
+        'longitude': float(row[8]) if row[8] else None,
+        'width': row[9],
+        'height': row[10],
+        'video_codec': row[11]
+    }
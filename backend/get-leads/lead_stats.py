@@ -0,0 +1,37 @@
+'''
+Счётчики лидов пользователя из user_lead_stats: одна строка по первичному
+ключу вместо агрегата по user_videos. save-lead обновляет строку в той же
+транзакции, что и вставляет лид; расхождения чинит save-lead/reconcile_stats.py.
+'''
+from typing import Any, Dict, NamedTuple, Optional
+
+import tracing
+
+
+class LeadStats(NamedTuple):
+    version: int
+    lead_count: int
+    total_bytes: int
+    last_lead_at: Optional[Any]
+
+
+EMPTY = LeadStats(0, 0, 0, None)
+
+
+def fetch(cursor, user_id: int) -> LeadStats:
+    with tracing.phase('query'):
+        cursor.execute('''
+            SELECT version, lead_count, total_bytes, last_lead_at
+            FROM t_p80273517_video_feedback_app.user_lead_stats
+            WHERE user_id = %s
+        ''', (user_id,))
+        row = cursor.fetchone()
+    return LeadStats(*row) if row else EMPTY
+
+
+def summary_dict(stats: LeadStats) -> Dict[str, Any]:
+    return {
+        'lead_count': stats.lead_count,
+        'total_bytes': stats.total_bytes,
+        'last_lead_at': stats.last_lead_at.isoformat() if stats.last_lead_at else None,
+    }
@@ -0,0 +1,52 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('LEADS_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_limit(value: Optional[str]) -> int:
+    """Размер страницы из параметра limit, ограниченный MAX_PAGE_SIZE"""
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Непрозрачный курсор из значений ключа сортировки последней строки"""
+    plain = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(plain, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def decode_created_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Курсор списка лидов: (created_at, id) последней строки страницы"""
+    created_at, lead_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), int(lead_id)
+    except (TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
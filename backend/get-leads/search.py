@@ -0,0 +1,68 @@
+'''
+Полнотекстовый поиск по комментариям: GET ?q=...&limit=&cursor=.
+
+Запрос разбирается websearch_to_tsquery('russian') (кавычки, "or", минус
+работают как в поисковиках) и ищется по сгенерированной колонке
+comments_tsv через GIN-индекс (user_id, comments_tsv). Выдача - по
+убыванию ts_rank_cd, курсор - (rank, id) последней строки; rank сравнивается
+как real, чтобы значение из курсора совпадало с посчитанным бит в бит.
+'''
+from typing import Any, Dict, List, Optional, Tuple
+
+import lead_rows
+import pagination
+import tracing
+
+MAX_QUERY_LENGTH = 200
+
+RANK_SQL = "ts_rank_cd(comments_tsv, websearch_to_tsquery('russian', %(q)s))"
+
+
+def parse_query(value: str) -> str:
+    query = value.strip()
+    if not query:
+        raise ValueError('q must not be empty')
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError(f'q must be at most {MAX_QUERY_LENGTH} characters')
+    return query
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    rank, lead_id = pagination.decode_cursor(cursor, 2)
+    try:
+        return float(rank), int(lead_id)
+    except (TypeError, ValueError):
+        raise pagination.InvalidCursor('Invalid cursor')
+
+
+def search(cursor, user_id: int, query: str, limit: int,
+           after: Optional[Tuple[float, int]] = None) -> Dict[str, Any]:
+    """Страница найденных лидов с rank и next_cursor"""
+    params: Dict[str, Any] = {'user_id': user_id, 'q': query, 'limit': limit + 1}
+    where = "user_id = %(user_id)s AND comments_tsv @@ websearch_to_tsquery('russian', %(q)s)"
+    if after:
+        where += f' AND ({RANK_SQL}, id) < (%(rank)s::real, %(id)s)'
+        params.update(rank=after[0], id=after[1])
+
+    with tracing.phase('query'):
+        cursor.execute(f'''
+            SELECT {lead_rows.LEAD_COLUMNS}, {RANK_SQL} AS rank
+            FROM t_p80273517_video_feedback_app.user_videos
+            WHERE {where}
+            ORDER BY rank DESC, id DESC
+            LIMIT %(limit)s
+        ''', params)
+        rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    leads: List[Dict[str, Any]] = []
+    for row in rows:
+        lead = lead_rows.lead_dict(row)
+        lead['rank'] = row[-1]
+        leads.append(lead)
+    return {
+        'leads': leads,
+        'count': len(leads),
+        'next_cursor': pagination.encode_cursor(rows[-1][-1], rows[-1][0]) if has_more else None
+    }
@@ -0,0 +1,119 @@
+'''
+Геопоиск по лидам пользователя: ?bbox=south,west,north,east и ?near=lat,lon&k=10.
+
+Оба режима сводятся к нескольким диапазонам по индексу (user_id, geohash),
+см. geohash.py. Для k ближайших окрестность из 9 ячеек расширяется (префикс
+короче), пока k-й найденный лид не окажется ближе края окрестности - тогда
+более близких за её пределами быть не может.
+'''
+import os
+from typing import Any, Dict, List, Tuple
+
+import geohash
+import lead_rows
+import tracing
+
+KNN_MAX_K = 100
+KNN_DEFAULT_K = 10
+# С какой длины префикса начинать поиск ближайших (6 - ячейка около 1 x 0.6 км)
+KNN_START_PRECISION = int(os.environ.get('KNN_START_PRECISION', '6'))
+
+DISTANCE_SQL = '''
+    2 * 6371.0088 * asin(sqrt(least(1,
+        power(sin(radians(latitude - %(lat)s) / 2), 2)
+        + cos(radians(%(lat)s)) * cos(radians(latitude)) * power(sin(radians(longitude - %(lon)s) / 2), 2)
+    )))
+'''
+
+
+def _floats(value: str, count: int, name: str) -> List[float]:
+    try:
+        numbers = [float(item) for item in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise ValueError(f'{name} must be {count} comma-separated numbers')
+    return numbers
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """south,west,north,east; west > east - прямоугольник через 180-й меридиан"""
+    south, west, north, east = _floats(value, 4, 'bbox')
+    if geohash.coordinates(south, west) is None or geohash.coordinates(north, east) is None or south > north:
+        raise ValueError('bbox must be south,west,north,east within valid coordinates')
+    return south, west, north, east
+
+
+def parse_near(value: str, k: Any) -> Tuple[float, float, int]:
+    point = geohash.coordinates(*_floats(value, 2, 'near'))
+    if point is None:
+        raise ValueError('near must be lat,lon within valid coordinates')
+    try:
+        count = int(k) if k else KNN_DEFAULT_K
+    except ValueError:
+        raise ValueError('k must be an integer')
+    if not 1 <= count <= KNN_MAX_K:
+        raise ValueError(f'k must be between 1 and {KNN_MAX_K}')
+    return point[0], point[1], count
+
+
+def _ranges_join(prefixes: List[str]) -> Tuple[str, Dict[str, Any]]:
+    lo, hi = geohash.prefix_ranges(prefixes)
+    join = '''
+        JOIN unnest(%(lo)s::text[], %(hi)s::text[]) AS cell (lo, hi)
+          ON geohash >= cell.lo AND geohash < cell.hi
+    '''
+    return join, {'lo': lo, 'hi': hi}
+
+
+def in_bbox(cursor, user_id: int, bbox: Tuple[float, float, float, float], limit: int) -> List[Dict[str, Any]]:
+    """Новейшие лиды внутри прямоугольника"""
+    south, west, north, east = bbox
+    join, params = _ranges_join(geohash.cover(south, west, north, east))
+    lon_filter = 'longitude BETWEEN %(west)s AND %(east)s' if west <= east else \
+        '(longitude >= %(west)s OR longitude <= %(east)s)'
+    params.update(user_id=user_id, south=south, west=west, north=north, east=east, limit=limit)
+    with tracing.phase('query'):
+        cursor.execute(f'''
+            SELECT {lead_rows.LEAD_COLUMNS}
+            FROM t_p80273517_video_feedback_app.user_videos
+            {join}
+            WHERE user_id = %(user_id)s
+              AND latitude BETWEEN %(south)s AND %(north)s AND {lon_filter}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %(limit)s
+        ''', params)
+        rows = cursor.fetchall()
+    return [lead_rows.lead_dict(row) for row in rows]
+
+
+def nearest(cursor, user_id: int, lat: float, lon: float, k: int) -> List[Dict[str, Any]]:
+    """k ближайших к точке лидов с distance_km, по возрастанию расстояния"""
+    params: Dict[str, Any] = {'user_id': user_id, 'lat': lat, 'lon': lon, 'limit': k}
+    for precision in range(KNN_START_PRECISION, 0, -1):
+        join, ranges = _ranges_join(geohash.neighbourhood(lat, lon, precision))
+        rows = _nearest_query(cursor, join, dict(params, **ranges))
+        if len(rows) == k and rows[-1][-1] <= geohash.min_reach_km(lat, precision):
+            break
+    else:
+        # Лидов меньше k или они на другом конце света - все геолиды пользователя
+        rows = _nearest_query(cursor, '', params)
+    leads = []
+    for row in rows:
+        lead = lead_rows.lead_dict(row)
+        lead['distance_km'] = round(row[-1], 3)
+        leads.append(lead)
+    return leads
+
+
+def _nearest_query(cursor, join: str, params: Dict[str, Any]) -> List[Tuple]:
+    with tracing.phase('query'):
+        cursor.execute(f'''
+            SELECT {lead_rows.LEAD_COLUMNS}, {DISTANCE_SQL} AS distance_km
+            FROM t_p80273517_video_feedback_app.user_videos
+            {join}
+            WHERE user_id = %(user_id)s AND geohash IS NOT NULL
+            ORDER BY distance_km
+            LIMIT %(limit)s
+        ''', params)
+        return cursor.fetchall()
@@ -0,0 +1,219 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, NamedTuple, Optional
+
+STORAGE_BACKEND = os.environ.get('BLOB_STORAGE_BACKEND', '')  # '' - видео хранится в bytea
+BLOB_STORAGE_DIR = os.environ.get('BLOB_STORAGE_DIR', '/tmp/blobs')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION', 'ru-central1')
+COPY_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class BlobInfo(NamedTuple):
+    key: str
+    size: int
+    sha256: str
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+def blob_key(sha256: str) -> str:
+    """Ключ объекта по SHA-256 содержимого"""
+    return f'videos/{sha256[:2]}/{sha256}'
+
+
+def _hash_seekable(fileobj: BinaryIO) -> Dict[str, Any]:
+    """Хеш и размер файла без копирования; позиция возвращается в начало"""
+    start = fileobj.tell()
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(COPY_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(start)
+    return {'sha256': digest.hexdigest(), 'size': size}
+
+
+def _is_seekable(fileobj: BinaryIO) -> bool:
+    try:
+        return fileobj.seekable()
+    except AttributeError:
+        return False
+
+
+class LocalBlobStore:
+    '''Хранилище в локальной файловой системе (разработка, тесты, один сервер)'''
+
+    def __init__(self, root: str = BLOB_STORAGE_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def put_file(self, fileobj: BinaryIO, sha256: Optional[str] = None, size: Optional[int] = None) -> BlobInfo:
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        written = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix='.upload-', delete=False) as tmp:
+            try:
+                for chunk in iter(lambda: fileobj.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    written += len(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        info = BlobInfo(blob_key(digest.hexdigest()), written, digest.hexdigest())
+        path = self._path(info.key)
+        if os.path.exists(path):
+            os.unlink(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp.name, path)
+        return info
+
+    def write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.write-', delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self._path(key), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        with self.open(key) as f:
+            f.seek(start)
+            return f.read(length)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    '''S3-совместимое хранилище (Yandex Object Storage, MinIO, moto)'''
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        if not bucket:
+            raise RuntimeError('S3_BUCKET не задан')
+        self.bucket = bucket
+        self._client_error = ClientError
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=S3_REGION,
+            aws_access_key_id=os.environ.get('S3_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('S3_SECRET_ACCESS_KEY'),
+        )
+
+    def _is_missing(self, error: Exception) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def put_file(self, fileobj: BinaryIO, sha256: Optional[str] = None, size: Optional[int] = None) -> BlobInfo:
+        spool = None
+        if sha256 is None or size is None:
+            if not _is_seekable(fileobj):
+                spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+                shutil.copyfileobj(fileobj, spool, COPY_CHUNK_SIZE)
+                spool.seek(0)
+                fileobj = spool
+            hashed = _hash_seekable(fileobj)
+            sha256, size = hashed['sha256'], hashed['size']
+        info = BlobInfo(blob_key(sha256), size, sha256)
+        try:
+            if not self.exists(info.key):
+                self.client.upload_fileobj(fileobj, self.bucket, info.key)
+        finally:
+            if spool is not None:
+                spool.close()
+        return info
+
+    def write(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self._client_error as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def size(self, key: str) -> int:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key)
+            raise
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key)
+            raise
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        if length <= 0:
+            return b''
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key, Range=f'bytes={start}-{start + length - 1}')
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key)
+            raise
+        return obj['Body'].read()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+_store = None
+
+
+def get_store():
+    """Настроенное хранилище или None, если видео по-прежнему пишется в bytea"""
+    global _store
+    if _store is None and STORAGE_BACKEND:
+        if STORAGE_BACKEND == 'local':
+            _store = LocalBlobStore()
+        elif STORAGE_BACKEND == 's3':
+            _store = S3BlobStore()
+        else:
+            raise RuntimeError(f'Неизвестный BLOB_STORAGE_BACKEND: {STORAGE_BACKEND}')
+    return _store
+
+
+def put_bytes(store, data) -> BlobInfo:
+    """Сохранение буфера целиком (bytes или memoryview из bytea)"""
+    return store.put_file(io.BytesIO(data))
@@ -0,0 +1,124 @@
+import base64
+import mimetypes
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import etags
+import runtime
+import storage
+import tracing
+
+# Ответ функции ограничен по размеру, а base64 добавляет треть - отдаём окнами
+STREAM_MAX_RANGE = int(os.environ.get('STREAM_MAX_RANGE', str(2 * 1024 * 1024)))
+
+mimetypes.add_type('video/webm', '.webm')
+mimetypes.add_type('video/mp4', '.mp4')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def content_type(filename: Optional[str]) -> str:
+    guessed, _ = mimetypes.guess_type(filename or '')
+    return guessed if guessed and guessed.startswith('video/') else 'video/mp4'
+
+
+def parse_range(header: Optional[str], size: int, max_length: int = STREAM_MAX_RANGE) -> Optional[Tuple[int, int]]:
+    """
+    Первый диапазон из заголовка Range как (start, end) включительно,
+    обрезанный до max_length байт. None - заголовка нет или он не bytes=.
+    """
+    if not header or not header.strip().lower().startswith('bytes='):
+        return None
+    spec = header.strip()[6:].split(',')[0].strip()
+    first, _, last = spec.partition('-')
+    try:
+        if first == '':
+            # bytes=-N - последние N байт
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    end = min(end, size - 1, start + max_length - 1)
+    return start, end
+
+
+def _read_slice(cursor, user_id: int, video_id: int, video_url: Optional[str], start: int, length: int) -> bytes:
+    if video_url:
+        store = storage.get_store()
+        if store is None:
+            raise RuntimeError('BLOB_STORAGE_BACKEND не настроен')
+        return store.read_range(video_url, start, length)
+    # substring по bytea вычитывает из TOAST только нужные куски
+    cursor.execute('''
+        SELECT substring(video_data FROM %s FOR %s)
+        FROM t_p80273517_video_feedback_app.user_videos
+        WHERE user_id = %s AND id = %s
+    ''', (start + 1, length, user_id, video_id))
+    return bytes(cursor.fetchone()[0])
+
+
+def stream_video(cursor, user_id: int, video_id: int, range_header: Optional[str],
+                 cors_headers: Dict[str, str], if_none_match: Optional[str] = None) -> Dict[str, Any]:
+    """Бинарный ответ с видео (или его диапазоном) без JSON-обёртки"""
+    with tracing.phase('query'):
+        cursor.execute('''
+            SELECT filename, video_url,
+                   CASE WHEN video_url IS NULL THEN octet_length(video_data) ELSE file_size END
+            FROM t_p80273517_video_feedback_app.user_videos
+            WHERE user_id = %s AND id = %s
+        ''', (user_id, video_id))
+        row = cursor.fetchone()
+    headers = dict(cors_headers)
+    headers['Content-Type'] = 'application/json'
+    if not row or not row[2]:
+        return {'statusCode': 404, 'headers': headers, 'body': '{"error": "Video not found"}', 'isBase64Encoded': False}
+    filename, video_url, size = row
+    etag = etags.video_etag(video_id, video_url)
+
+    headers.update({
+        'Content-Type': content_type(filename),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=3600',
+        'Access-Control-Expose-Headers': 'Accept-Ranges, Content-Length, Content-Range, ETag',
+        'ETag': etag,
+    })
+    if runtime.etag_matches(if_none_match, etag):
+        del headers['Content-Type']
+        return {'statusCode': 304, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        headers['Content-Range'] = f'bytes */{size}'
+        return {'statusCode': 416, 'headers': headers, 'body': '', 'isBase64Encoded': False}
+
+    # 206 и Content-Range - только в ответ на Range (RFC 9110, 15.3.7).
+    # Без Range большое видео не помещается в ответ функции: отдаём первое
+    # окно как 200, а Accept-Ranges подсказывает плееру дозапрашивать диапазоны
+    status = 206
+    if byte_range is None:
+        status = 200
+        byte_range = (0, min(size, STREAM_MAX_RANGE) - 1)
+    start, end = byte_range
+
+    with tracing.phase('store'):
+        data = _read_slice(cursor, user_id, video_id, video_url, start, end - start + 1)
+    headers['Content-Length'] = str(len(data))
+    if status == 206:
+        headers['Content-Range'] = f'bytes {start}-{start + len(data) - 1}/{size}'
+    with tracing.phase('serialize'):
+        body = base64.b64encode(data).decode('ascii')
+    return {
+        'statusCode': status,
+        'headers': headers,
+        'body': body,
+        'isBase64Encoded': True
+    }
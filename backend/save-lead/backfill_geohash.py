@@ -0,0 +1,62 @@
+'''
+Заполняет user_videos.geohash у лидов, сохранённых до появления колонки.
+
+    DATABASE_URL=... python backfill_geohash.py --batch-size 1000
+
+Пачки по id коммитятся отдельно, прерванный запуск можно повторить.
+'''
+import argparse
+import time
+
+from psycopg2.extras import execute_values
+
+import db
+import geohash
+
+SELECT_BATCH = '''
+    SELECT id, latitude, longitude
+    FROM t_p80273517_video_feedback_app.user_videos
+    WHERE geohash IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL AND id > %s
+    ORDER BY id
+    LIMIT %s
+'''
+
+UPDATE_BATCH = '''
+    UPDATE t_p80273517_video_feedback_app.user_videos v
+    SET geohash = data.geohash
+    FROM (VALUES %s) AS data (id, geohash)
+    WHERE v.id = data.id
+'''
+
+
+def backfill(batch_size: int) -> int:
+    last_id = 0
+    updated = 0
+    while True:
+        started = time.monotonic()
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SELECT_BATCH, (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                values = [(lead_id, geohash.encode_optional(lat, lon)) for lead_id, lat, lon in rows]
+                values = [value for value in values if value[1]]
+                if values:
+                    execute_values(cursor, UPDATE_BATCH, values)
+            conn.commit()
+        last_id = rows[-1][0]
+        updated += len(values)
+        print(f'batch: {len(rows)} rows, {len(values)} updated, last id {last_id}, {time.monotonic() - started:.2f}s')
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    print(f'done: {backfill(args.batch_size)} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+'''
+Пакетное сохранение лидов, записанных без сети: POST {"leads": [{...}, ...]}.
+
+Каждый элемент - то же тело, что у обычного save-lead (videoBase64,
+filename, comments, координаты, idempotency_key). Ответ - результат по
+каждому элементу в исходном порядке:
+
+    {"success": false, "saved": 2, "failed": 1, "results": [
+        {"index": 0, "success": true, "lead_id": 10, ...},
+        {"index": 1, "success": false, "status": 400, "error": "Invalid video data"},
+        {"index": 2, "success": true, "lead_id": 11, ...}
+    ]}
+
+Ошибки отдельных элементов (нет видео, битый base64, слишком большой файл)
+не мешают остальным. С blob-хранилищем все прошедшие проверку лиды
+вставляются одним многострочным INSERT; без него (видео в bytea) - по
+одному INSERT на лид, иначе байты всех видео пакета и их экранированная
+копия в тексте запроса лежали бы в памяти одновременно. В обоих случаях
+транзакция и commit одни на пакет, ошибка базы откатывает его целиком.
+Элементы с уже сохранённым idempotency_key возвращают прежний лид без
+декодирования, так что пакет после обрыва связи можно безопасно отправить
+ещё раз.
+
+Память - как у одиночного save-lead: base64 не копируется из тела, видео
+декодируются и загружаются в хранилище по одному, а тело пакета ограничено
+SAVE_BATCH_MAX_BYTES (больше - 413 на весь пакет).
+'''
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import blobs
+import db
+import ingest
+import leads
+import media_probe
+import storage
+import tracing
+
+SAVE_BATCH_MAX_LEADS = int(os.environ.get('SAVE_BATCH_MAX_LEADS', '20'))
+# Суммарный размер видео пакета: тело держится в памяти целиком
+SAVE_BATCH_MAX_BYTES = int(os.environ.get('SAVE_BATCH_MAX_BYTES', str(32 * 1024 * 1024)))
+
+
+def is_batch(body_data: Any, query_params: Dict[str, Any]) -> bool:
+    """Пакет - ?batch=1 или поле leads в разобранном теле (порядок ключей не важен)"""
+    if query_params.get('batch', '').lower() in ('1', 'true'):
+        return True
+    return isinstance(body_data, dict) and 'leads' in body_data
+
+
+def _failed(index: int, status: int, error: str, **extra: Any) -> Dict[str, Any]:
+    return dict({'index': index, 'success': False, 'status': status, 'error': error}, **extra)
+
+
+def _saved(index: int, lead_id: int, created_at: Any, file_size: int) -> Dict[str, Any]:
+    return dict({'index': index}, **leads.saved_response_body(lead_id, created_at, file_size))
+
+
+def _store_video(body: str, value: Any, spans: List[Tuple[int, int]], store, known: Dict[str, str],
+                 uploaded: List[Tuple[str, str, int]]) -> Tuple[int, str, Optional[media_probe.MediaInfo],
+                                                                Optional[str], Optional[bytes]]:
+    """
+    Видео одного элемента: декодирование, заголовки контейнера и загрузка в
+    хранилище (без хранилища - байты для bytea). Временный файл закрыт до
+    возврата. Возвращает (размер, sha256, media, ключ, байты); битые данные -
+    исключения ingest. Новые объекты дописываются в uploaded.
+    """
+    span = ingest.value_span(value, spans)
+    if span:
+        text, (begin, end) = body, span
+    elif isinstance(value, str):
+        text, begin, end = value, 0, len(value)
+    else:
+        raise ingest.InvalidVideoData('videoBase64 must be a string')
+    with tracing.phase('decode'):
+        video = ingest.decode_base64(text, begin=begin, stop=end)
+    try:
+        with tracing.phase('probe'):
+            media = media_probe.probe_file(video.file, video.size)
+        if store is None:
+            with tracing.phase('store'):
+                return video.size, video.sha256, media, None, video.read_all()
+        # Такое же видео уже загружено (тот же SHA-256) - только ссылаемся на него
+        if video.sha256 not in known:
+            with db.connection(autocommit=True) as conn:
+                with tracing.phase('query'), conn.cursor() as cursor:
+                    video_url = blobs.touch(cursor, video.sha256)
+            if video_url is None:
+                with tracing.phase('store'):
+                    video_url = store.put_file(video.file, video.sha256, video.size).key
+                uploaded.append((video.sha256, video_url, video.size))
+            known[video.sha256] = video_url
+        return video.size, video.sha256, media, known[video.sha256], None
+    finally:
+        video.file.close()
+
+
+def save_batch(user_id: int, body: str, items: Any, spans: List[Tuple[int, int]]) -> Tuple[int, Dict[str, Any]]:
+    """
+    Сохраняет пакет лидов; возвращает (статус, тело ответа) как uploads.handle.
+    items - разобранный список leads, spans - границы base64 видео внутри body
+    (ingest.split_json_body).
+    """
+    if not isinstance(items, list) or not items:
+        return 400, {'error': 'leads must be a non-empty array'}
+    if len(items) > SAVE_BATCH_MAX_LEADS:
+        return 400, {'error': f'At most {SAVE_BATCH_MAX_LEADS} leads per request'}
+    if len(body) > ingest.max_body_length(SAVE_BATCH_MAX_BYTES):
+        return 413, {'error': 'Batch is too large', 'max_bytes': SAVE_BATCH_MAX_BYTES}
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    fields_by_index: Dict[int, Dict[str, Any]] = {}
+    first_with_key: Dict[str, int] = {}
+    duplicates: Dict[int, int] = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = _failed(index, 400, 'Lead must be an object')
+            continue
+        fields = leads.lead_fields(item)
+        key = fields['idempotency_key']
+        if key and len(key) > leads.IDEMPOTENCY_KEY_MAX_LENGTH:
+            results[index] = _failed(index, 400, 'Idempotency key is too long')
+        elif not item.get('videoBase64'):
+            results[index] = _failed(index, 400, 'Video data is required')
+        elif key and key in first_with_key:
+            # Тот же ключ дважды в пакете - один лид на оба элемента
+            duplicates[index] = first_with_key[key]
+        else:
+            if key:
+                first_with_key[key] = index
+            fields_by_index[index] = fields
+
+    # Уже сохранённые ключи (повтор пакета) - одним запросом и без декодирования видео
+    if first_with_key:
+        with db.connection(autocommit=True) as conn:
+            with tracing.phase('query'), conn.cursor() as cursor:
+                existing = leads.find_by_idempotency_keys(cursor, user_id, list(first_with_key))
+        for key, (lead_id, created_at, file_size) in existing.items():
+            index = first_with_key[key]
+            results[index] = _saved(index, lead_id, created_at, file_size)
+            del fields_by_index[index]
+
+    # Видео - по одному: следующее декодируется, когда предыдущее уже в
+    # хранилище и его временный файл закрыт
+    store = storage.get_store()
+    known: Dict[str, str] = {}
+    uploaded: List[Tuple[str, str, int]] = []
+
+    def store_video(index: int):
+        """_store_video для элемента; ошибка данных записывается в results, возвращается None"""
+        try:
+            return _store_video(body, items[index]['videoBase64'], spans, store, known, uploaded)
+        except ingest.VideoTooLarge as e:
+            results[index] = _failed(index, 413, 'Video is too large', max_bytes=e.limit)
+        except ingest.InvalidVideoData:
+            results[index] = _failed(index, 400, 'Invalid video data')
+        return None
+
+    if store is None and fields_by_index:
+        # bytea: лид вставляется сразу после декодирования, чтобы байты всех
+        # видео пакета не лежали в памяти одновременно - поэтому здесь
+        # insert_lead на каждый лид, а не insert_leads; commit - один
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                for index, fields in fields_by_index.items():
+                    video = store_video(index)
+                    if video is None:
+                        continue
+                    file_size, sha256, media, _, video_bytes = video
+                    del video
+                    with tracing.phase('query'):
+                        lead_id, created_at = leads.insert_lead(
+                            cursor, user_id, fields, file_size, video_bytes, None, media, sha256
+                        )
+                    del video_bytes
+                    results[index] = _saved(index, lead_id, created_at, file_size)
+            with tracing.phase('query'):
+                conn.commit()
+    elif fields_by_index:
+        # Один INSERT на все лиды, один commit
+        order: List[Tuple[int, int]] = []
+        values = []
+        try:
+            for index, fields in fields_by_index.items():
+                video = store_video(index)
+                if video is None:
+                    continue
+                file_size, sha256, media, video_url, _ = video
+                order.append((index, file_size))
+                values.append(leads.lead_values(user_id, fields, file_size, None, video_url, media, sha256))
+            if values:
+                with db.connection() as conn:
+                    with tracing.phase('query'):
+                        with conn.cursor() as cursor:
+                            inserted = leads.insert_leads(cursor, user_id, values)
+                        conn.commit()
+        except Exception:
+            # Загруженные объекты без строки в video_blobs сборщик не нашёл бы
+            for blob in uploaded:
+                blobs.record_unreferenced(*blob)
+            raise
+        if values:
+            for (index, file_size), (lead_id, created_at) in zip(order, inserted):
+                results[index] = _saved(index, lead_id, created_at, file_size)
+
+    for index, original in duplicates.items():
+        result = results[original]
+        results[index] = dict(result, index=index)
+
+    failed = sum(1 for result in results if not result['success'])
+    return 200, {
+        'success': failed == 0,
+        'saved': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }
@@ -0,0 +1,105 @@
+'''
+Учёт ссылок на видео в blob-хранилище (таблица video_blobs).
+
+Ключ объекта - SHA-256 содержимого, поэтому одинаковые видео лежат в
+хранилище один раз. ref_count увеличивает insert_lead, уменьшает триггер на
+удаление из user_videos (в том числе каскадное). Объект удаляется, только
+когда ссылок нет дольше BLOB_GC_GRACE_SECONDS:
+
+    BLOB_STORAGE_BACKEND=s3 S3_BUCKET=... DATABASE_URL=... python blobs.py gc
+
+Перед загрузкой save-lead "трогает" строку (touched_at = now()): сборщик не
+берёт строки, тронутые за последний grace-период, поэтому видео, на которое
+вот-вот сошлётся новый лид, не удаляется у него из-под ног. Если лид после
+загрузки так и не вставился, record_unreferenced заводит строку с
+ref_count = 0, и объект уходит в ту же сборку.
+'''
+import os
+import sys
+from typing import Dict, List, Optional
+
+import db
+import storage
+import tracing
+
+BLOB_GC_GRACE_SECONDS = int(os.environ.get('BLOB_GC_GRACE_SECONDS', '86400'))
+GC_BATCH_SIZE = 100
+
+
+def touch(cursor, sha256: str) -> Optional[str]:
+    """Ключ уже сохранённого видео с таким хешем (и отсрочка его сборки) или None"""
+    cursor.execute('''
+        UPDATE t_p80273517_video_feedback_app.video_blobs
+        SET touched_at = CURRENT_TIMESTAMP
+        WHERE sha256 = %s
+        RETURNING key
+    ''', (sha256,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def touch_many(cursor, sha256s: List[str]) -> Dict[str, str]:
+    """touch для нескольких хешей одним запросом: {sha256: ключ} уже сохранённых"""
+    cursor.execute('''
+        UPDATE t_p80273517_video_feedback_app.video_blobs
+        SET touched_at = CURRENT_TIMESTAMP
+        WHERE sha256 = ANY(%s)
+        RETURNING sha256, key
+    ''', (sha256s,))
+    return dict(cursor.fetchall())
+
+
+def record_unreferenced(sha256: str, key: str, size: int) -> None:
+    """
+    Объект уже в хранилище, а лид на него не сослался (вставка упала): строка
+    с ref_count = 0, иначе сборщик о нём не узнает. Есть строка - не трогаем.
+    Своё соединение - транзакция с лидом к этому моменту откачена.
+    """
+    try:
+        with db.connection(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO t_p80273517_video_feedback_app.video_blobs (sha256, key, size, ref_count)
+                    VALUES (%s, %s, %s, 0)
+                    ON CONFLICT (sha256) DO NOTHING
+                ''', (sha256, key, size))
+    except Exception as e:
+        # Исходная ошибка вставки важнее; объект останется до ручной чистки
+        tracing.emit({'event': 'blob_record_failed', 'sha256': sha256, 'key': key, 'error': str(e)})
+
+
+def collect_unreferenced(store, limit: int = GC_BATCH_SIZE, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> int:
+    """Удаляет объекты без ссылок; строки блокируются до удаления объектов"""
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT sha256, key FROM t_p80273517_video_feedback_app.video_blobs
+                WHERE ref_count <= 0 AND touched_at < now() - make_interval(secs => %s)
+                ORDER BY touched_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ''', (grace_seconds, limit))
+            rows = cursor.fetchall()
+            for _, key in rows:
+                store.delete(key)
+            if rows:
+                cursor.execute('''
+                    DELETE FROM t_p80273517_video_feedback_app.video_blobs WHERE sha256 = ANY(%s)
+                ''', ([sha256 for sha256, _ in rows],))
+        conn.commit()
+    return len(rows)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['gc']:
+        sys.exit('usage: python blobs.py gc')
+    blob_store = storage.get_store()
+    if blob_store is None:
+        sys.exit('BLOB_STORAGE_BACKEND не настроен')
+    total = 0
+    while True:
+        removed = collect_unreferenced(blob_store)
+        total += removed
+        if removed == 0:
+            break
+    print(f'removed {total} unreferenced blobs')
@@ -1,166 +1,155 @@
 import json
-import base64
 import os
-import psycopg2
 from typing import Dict, Any
 
+import batch
+import blobs
+import db
+import ingest
+import leads
+import media_probe
+import runtime
+import storage
+import tokens
+import tracing
+import uploads
+
+service = runtime.Service(allow_headers=('Content-Type', 'X-User-Id', 'X-Auth-Token', 'X-Chunk-Sha256', 'Idempotency-Key'))
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Business: Сохраняет видео-лид пользователя в базу данных
-    Args: event - dict с httpMethod, body, headers
+    Args: event - dict с httpMethod, body, headers, queryStringParameters
           context - объект с атрибутами request_id, function_name
     Returns: HTTP response dict с результатом сохранения
     """
-    method = event.get('httpMethod', 'GET')
-    
-    # CORS headers
-    cors_headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
-    }
-    
-    # Handle OPTIONS request
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    # Only POST allowed
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': cors_headers,
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-    
+    return service(event, context)
+
+
+@service.route('POST', 'PUT', 'GET')
+def save_lead(request: runtime.Request) -> Dict[str, Any]:
+    method = request.method
+    query_params = request.query
+    upload_action = query_params.get('action')
+    upload_id = query_params.get('upload_id')
+    is_upload = upload_action in uploads.ACTIONS or bool(upload_id)
+
+    # Only POST allowed (PUT/GET - только для сессий загрузки по частям)
+    if method != 'POST' and not is_upload:
+        return service.error(405, 'Method not allowed')
+
+    # Get request data
+    headers = request.headers
+    body = request.body
+
+    # Get user_id from the signed token (or legacy X-User-Id header)
+    try:
+        user_id = tokens.authenticate(headers)
+    except tokens.InvalidToken:
+        return service.error(401, 'Invalid or expired token')
+    if not user_id:
+        return service.error(401, 'Authentication required')
+
+    # Database connection
+    if not os.environ.get('DATABASE_URL'):
+        return service.error(500, 'Database not configured')
+
+    if is_upload:
+        with tracing.phase('upload'):
+            status, payload = uploads.handle(method, upload_action, upload_id, request.event, user_id)
+        return service.respond(status, payload)
+
+    # Лимит размера проверяем до разбора JSON
+    if body and len(body) > ingest.max_body_length():
+        return service.error(413, 'Video is too large', max_bytes=ingest.MAX_VIDEO_BYTES)
+
+    # Parse JSON body; videoBase64 не копируется, а декодируется прямо из тела
     try:
-        # Get request data
-        headers = event.get('headers', {})
-        body = event.get('body', '{}')
-        
-        print(f"[DEBUG] Method: {method}")
-        print(f"[DEBUG] Headers: {headers}")
-        print(f"[DEBUG] Body length: {len(body) if body else 0}")
-        
-        # Get user_id from headers
-        user_id = headers.get('X-User-Id') or headers.get('x-user-id')
-        print(f"[DEBUG] User ID: {user_id}")
-        if not user_id:
-            print("[ERROR] User ID missing")
-            return {
-                'statusCode': 400,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'User ID is required'}),
-                'isBase64Encoded': False
-            }
-        
-        # Parse JSON body
-        try:
-            body_data = json.loads(body) if body else {}
-            print(f"[DEBUG] Body data keys: {list(body_data.keys()) if body_data else 'none'}")
-        except json.JSONDecodeError as e:
-            print(f"[ERROR] JSON decode error: {str(e)}")
-            return {
-                'statusCode': 400,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'Invalid JSON format'}),
-                'isBase64Encoded': False
-            }
-        
-        # Get fields
-        video_base64 = body_data.get('videoBase64', '')
-        filename = body_data.get('filename', 'video.mp4')
-        original_filename = body_data.get('original_filename', '')
-        comments = body_data.get('comments', '')
-        latitude = body_data.get('latitude')
-        longitude = body_data.get('longitude')
-        
-        print(f"[DEBUG] Video Base64 length: {len(video_base64) if video_base64 else 0}")
-        print(f"[DEBUG] Comments: {comments}")
-        
-        # Check required field
-        if not video_base64:
-            print("[ERROR] Video data is missing")
-            return {
-                'statusCode': 400,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'Video data is required'}),
-                'isBase64Encoded': False
-            }
-        
-        # Decode base64
-        if video_base64.startswith('data:'):
-            video_base64 = video_base64.split(',')[1]
-        
-        video_bytes = base64.b64decode(video_base64)
-        file_size = len(video_bytes)
-        
-        # Database connection
-        database_url = os.environ.get('DATABASE_URL')
-        if not database_url:
-            return {
-                'statusCode': 500,
-                'headers': cors_headers,
-                'body': json.dumps({'error': 'Database not configured'}),
-                'isBase64Encoded': False
-            }
-        
-        # Save to database
-        print("[DEBUG] Connecting to database...")
-        conn = psycopg2.connect(database_url)
-        cursor = conn.cursor()
-        
-        print(f"[DEBUG] Inserting: user_id={user_id}, filename={filename}, file_size={file_size}")
-        cursor.execute('''
-            INSERT INTO t_p80273517_video_feedback_app.user_videos 
-            (user_id, filename, original_filename, file_size, comments, video_data, latitude, longitude)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id, created_at
-        ''', (
-            int(user_id),
-            filename,
-            original_filename,
-            file_size,
-            comments,
-            video_bytes,
-            latitude,
-            longitude
-        ))
-        
-        result = cursor.fetchone()
-        lead_id, created_at = result
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        print(f"[SUCCESS] Lead saved with ID: {lead_id}")
-        
-        return {
-            'statusCode': 200,
-            'headers': cors_headers,
-            'body': json.dumps({
-                'success': True,
-                'lead_id': lead_id,
-                'created_at': created_at.isoformat(),
-                'file_size': file_size,
-                'message': 'Лид успешно сохранен в базе данных'
-            }),
-            'isBase64Encoded': False
-        }
-        
-    except Exception as e:
-        print(f"[ERROR] Exception occurred: {str(e)}")
-        print(f"[ERROR] Exception type: {type(e).__name__}")
-        return {
-            'statusCode': 500,
-            'headers': cors_headers,
-            'body': json.dumps({'error': f'Server error: {str(e)}'}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        with tracing.phase('parse'):
+            body_data, video_spans = ingest.split_json_body(body) if body else ({}, [])
+    except json.JSONDecodeError:
+        raise runtime.InvalidJson()
+
+    # Несколько лидов, накопленных без сети: {"leads": [...]} - одна транзакция на пакет
+    if batch.is_batch(body_data, query_params):
+        items = body_data.get('leads') if isinstance(body_data, dict) else None
+        status, payload = batch.save_batch(user_id, body, items, video_spans)
+        return service.respond(status, payload)
+
+    # Get fields
+    video_text = body_data.pop('videoBase64', '') or ''
+    video_span = ingest.value_span(video_text, video_spans)
+    if video_span:
+        video_text, (video_begin, video_end) = body, video_span
+    else:
+        video_begin, video_end = 0, len(video_text)
+    fields = leads.lead_fields(body_data)
+
+    # Check required field
+    if video_end <= video_begin:
+        return service.error(400, 'Video data is required')
+
+    # Повтор запроса с тем же ключом возвращает уже созданный лид, видео не декодируется
+    idempotency_key = request.header('Idempotency-Key') or fields['idempotency_key']
+    if idempotency_key:
+        if len(idempotency_key) > leads.IDEMPOTENCY_KEY_MAX_LENGTH:
+            return service.error(400, 'Idempotency key is too long')
+        fields['idempotency_key'] = idempotency_key
+        with db.connection(autocommit=True) as conn:
+            with tracing.phase('query'), conn.cursor() as cursor:
+                existing = leads.find_by_idempotency_key(cursor, user_id, idempotency_key)
+        if existing:
+            return service.respond(200, leads.saved_response_body(*existing))
+
+    # Decode base64 по кускам во временный файл, без полных копий строки
+    try:
+        with tracing.phase('decode'):
+            video = ingest.decode_base64(video_text, begin=video_begin, stop=video_end)
+    except ingest.VideoTooLarge as e:
+        return service.error(413, 'Video is too large', max_bytes=e.limit)
+    except ingest.InvalidVideoData:
+        return service.error(400, 'Invalid video data')
+    del video_text
+    file_size = video.size
+
+    # Длительность, разрешение и кодек - только по заголовкам контейнера
+    with tracing.phase('probe'):
+        media = media_probe.probe_file(video.file, video.size)
+
+    # Видео кладём в blob-хранилище, в таблице остаётся только ключ.
+    # Такое же видео уже загружено (тот же SHA-256) - ссылаемся на него
+    video_url = None
+    video_bytes = None
+    uploaded = False
+    try:
+        store = storage.get_store()
+        if store is not None:
+            with db.connection(autocommit=True) as conn:
+                with tracing.phase('query'), conn.cursor() as cursor:
+                    video_url = blobs.touch(cursor, video.sha256)
+        with tracing.phase('store'):
+            if store is None:
+                video_bytes = video.read_all()
+            elif video_url is None:
+                video_url = store.put_file(video.file, video.sha256, video.size).key
+                uploaded = True
+    finally:
+        video.file.close()
+
+    # Save to database
+    try:
+        with db.connection() as conn:
+            with tracing.phase('query'):
+                with conn.cursor() as cursor:
+                    lead_id, created_at = leads.insert_lead(
+                        cursor, user_id, fields, file_size, video_bytes, video_url, media, video.sha256
+                    )
+                conn.commit()
+    except Exception:
+        # Только что загруженный объект без строки в video_blobs сборщик не нашёл бы
+        if uploaded:
+            blobs.record_unreferenced(video.sha256, video_url, file_size)
+        raise
+
+    return service.respond(200, leads.saved_response_body(lead_id, created_at, file_size))
@@ -0,0 +1,122 @@
+import binascii
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Any, BinaryIO, List, NamedTuple, Optional, Tuple
+
+MAX_VIDEO_BYTES = int(os.environ.get('MAX_VIDEO_BYTES', str(100 * 1024 * 1024)))
+# Кусок base64-строки на одну итерацию декодирования, кратен 4
+DECODE_CHUNK_CHARS = 1024 * 1024
+# До этого размера видео держится в памяти, дальше - во временном файле
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class VideoTooLarge(Exception):
+    def __init__(self, limit: int = MAX_VIDEO_BYTES):
+        super().__init__(f'Video exceeds {limit} bytes')
+        self.limit = limit
+
+
+class InvalidVideoData(Exception):
+    pass
+
+
+class IngestedVideo(NamedTuple):
+    file: BinaryIO
+    size: int
+    sha256: str
+
+    def read_all(self) -> bytes:
+        """Всё видео одним буфером - только для записи в bytea"""
+        self.file.seek(0)
+        data = self.file.read()
+        self.file.seek(0)
+        return data
+
+
+def max_body_length(limit: int = MAX_VIDEO_BYTES) -> int:
+    """Длина base64 для limit байт с запасом на JSON-поля и data:-префикс"""
+    return (limit + 2) // 3 * 4 + 64 * 1024
+
+
+def split_json_body(body: str, field: str = 'videoBase64') -> Tuple[Any, List[Tuple[int, int]]]:
+    """
+    Разбирает JSON-тело, не копируя значения field ни на каком уровне (видео
+    одного лида и каждого лида пакета). Вместо значения в разобранном
+    объекте стоит метка, value_span() по ней даёт границы внутри body.
+    Пустые значения и значения с экранированными символами (редкость)
+    разбираются обычным путём.
+    """
+    pieces: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    pos = 0
+    for match in re.finditer(r'"%s"\s*:\s*"' % re.escape(field), body):
+        start = match.end()
+        end = body.find('"', start)
+        if end == -1:
+            break
+        if end == start or body.find('\\', start, end) != -1:
+            continue
+        pieces.append(body[pos:start])
+        pieces.append('\\u0000%d' % len(spans))
+        spans.append((start, end))
+        pos = end
+    if not spans:
+        return json.loads(body), spans
+    pieces.append(body[pos:])
+    return json.loads(''.join(pieces)), spans
+
+
+def value_span(value: Any, spans: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """Границы значения, вынесенного split_json_body, или None для обычной строки"""
+    if isinstance(value, str) and value.startswith('\x00') and value[1:].isdigit():
+        index = int(value[1:])
+        if index < len(spans):
+            return spans[index]
+    return None
+
+
+def decode_base64(text: str, limit: int = MAX_VIDEO_BYTES, begin: int = 0, stop: Optional[int] = None) -> IngestedVideo:
+    """
+    Декодирует base64 (в т.ч. data:-URL) из text[begin:stop] кусками во
+    временный файл, попутно считая размер и SHA-256. Лимит проверяется до
+    декодирования по длине строки и ещё раз по фактическим байтам.
+    """
+    stop = len(text) if stop is None else stop
+    start = begin
+    if text.startswith('data:', begin):
+        start = text.find(',', begin, stop) + 1
+        if start == 0:
+            raise InvalidVideoData('Malformed data URL')
+    if (stop - start) // 4 * 3 > limit + 2:
+        raise VideoTooLarge(limit)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    digest = hashlib.sha256()
+    size = 0
+    carry = ''
+    try:
+        for pos in range(start, stop, DECODE_CHUNK_CHARS):
+            piece = carry + text[pos:min(pos + DECODE_CHUNK_CHARS, stop)]
+            if ' ' in piece or '\n' in piece or '\r' in piece:
+                piece = ''.join(piece.split())
+            cut = len(piece) // 4 * 4
+            carry = piece[cut:]
+            chunk = binascii.a2b_base64(piece[:cut])
+            size += len(chunk)
+            if size > limit:
+                raise VideoTooLarge(limit)
+            digest.update(chunk)
+            spool.write(chunk)
+        if carry:
+            raise InvalidVideoData('Incorrect base64 padding')
+    except binascii.Error as e:
+        spool.close()
+        raise InvalidVideoData(str(e))
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return IngestedVideo(spool, size, digest.hexdigest())
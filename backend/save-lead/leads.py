@@ -0,0 +1,205 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+import geohash
+import media_probe
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 200
+
+
+def lead_fields(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Поля лида из тела запроса; geohash - для геопоиска в get-leads,
+    idempotency_key - ключ повтора от клиента (заголовок Idempotency-Key важнее)
+    """
+    return {
+        'filename': body_data.get('filename', 'video.mp4'),
+        'original_filename': body_data.get('original_filename', ''),
+        'comments': body_data.get('comments', ''),
+        'latitude': body_data.get('latitude'),
+        'longitude': body_data.get('longitude'),
+        'geohash': geohash.encode_optional(body_data.get('latitude'), body_data.get('longitude')),
+        'idempotency_key': body_data.get('idempotency_key') or None,
+    }
+
+
+def lead_values(user_id: int, fields: Dict[str, Any], file_size: int, video_bytes: Optional[bytes],
+                video_url: Optional[str], media: Optional[media_probe.MediaInfo] = None,
+                video_sha256: Optional[str] = None) -> Tuple[Any, ...]:
+    """Значения колонок user_videos в порядке INSERT из insert_lead и insert_leads"""
+    return (
+        user_id,
+        fields['filename'],
+        fields['original_filename'],
+        file_size,
+        fields['comments'],
+        video_bytes,
+        video_url,
+        fields['latitude'],
+        fields['longitude'],
+        fields['geohash'],
+        media.duration_seconds if media else None,
+        media.width if media else None,
+        media.height if media else None,
+        media.codec if media else None,
+        video_sha256,
+        fields['idempotency_key']
+    )
+
+
+def insert_lead(cursor, user_id: int, fields: Dict[str, Any], file_size: int,
+                video_bytes: Optional[bytes], video_url: Optional[str],
+                media: Optional[media_probe.MediaInfo] = None,
+                video_sha256: Optional[str] = None) -> Tuple[int, Any]:
+    """
+    Вставка лида в текущей транзакции, возвращает (lead_id, created_at).
+    Тем же запросом в outbox lead_notifications ставится уведомление, в
+    user_lead_stats обновляются счётчики и версия списка (ETag в get-leads),
+    а у видео в blob-хранилище увеличивается счётчик ссылок video_blobs.
+    Лид с уже использованным idempotency_key не создаётся - возвращается прежний.
+    """
+    cursor.execute('''
+        WITH lead AS (
+            INSERT INTO t_p80273517_video_feedback_app.user_videos
+            (user_id, filename, original_filename, file_size, comments, video_data, video_url, latitude, longitude,
+             geohash, duration, width, height, video_codec, video_sha256, idempotency_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            RETURNING id, user_id, file_size, created_at, video_url, video_sha256
+        ), notification AS (
+            INSERT INTO t_p80273517_video_feedback_app.lead_notifications (lead_id)
+            SELECT id FROM lead
+        ), stats AS (
+            INSERT INTO t_p80273517_video_feedback_app.user_lead_stats
+            (user_id, version, lead_count, total_bytes, last_lead_at)
+            SELECT user_id, 1, 1, COALESCE(file_size, 0), created_at FROM lead
+            ON CONFLICT (user_id) DO UPDATE
+            SET version = user_lead_stats.version + 1,
+                lead_count = user_lead_stats.lead_count + 1,
+                total_bytes = user_lead_stats.total_bytes + EXCLUDED.total_bytes,
+                last_lead_at = GREATEST(user_lead_stats.last_lead_at, EXCLUDED.last_lead_at),
+                updated_at = CURRENT_TIMESTAMP
+        ), blob AS (
+            INSERT INTO t_p80273517_video_feedback_app.video_blobs (sha256, key, size, ref_count)
+            SELECT video_sha256, video_url, file_size, 1 FROM lead
+            WHERE video_url IS NOT NULL AND video_sha256 IS NOT NULL
+            ON CONFLICT (sha256) DO UPDATE
+            SET ref_count = video_blobs.ref_count + 1, touched_at = CURRENT_TIMESTAMP
+        )
+        SELECT id, created_at FROM lead
+    ''', lead_values(user_id, fields, file_size, video_bytes, video_url, media, video_sha256))
+    row = cursor.fetchone()
+    if row is None:
+        # Параллельный повтор с тем же ключом успел вставить лид первым
+        lead_id, created_at, _ = find_by_idempotency_key(cursor, user_id, fields['idempotency_key'])
+        return lead_id, created_at
+    lead_id, created_at = row
+    return lead_id, created_at
+
+
+# Типы колонок input в insert_leads: у VALUES без них NULL в первой строке
+# делает колонку text, и INSERT ... SELECT не сходится с integer/bytea
+INSERT_LEADS_TEMPLATE = (
+    '(%s, %s::integer, %s::varchar, %s::varchar, %s::bigint, %s::text, %s::bytea, %s::varchar, %s::numeric,'
+    ' %s::numeric, %s::varchar, %s::integer, %s::integer, %s::integer, %s::varchar, %s::char(64), %s::varchar)'
+)
+
+
+def insert_leads(cursor, user_id: int, values: Sequence[Tuple[Any, ...]]) -> List[Tuple[int, Any]]:
+    """
+    Пакетный вариант insert_lead: values - кортежи lead_values, все лиды
+    вставляются одним многострочным INSERT в текущей транзакции; outbox,
+    счётчики (версия списка растёт один раз на пакет) и ссылки на видео -
+    тем же запросом. Возвращает (lead_id, created_at) в порядке values.
+
+    Порядок строк RETURNING и id не гарантирован, поэтому у каждой строки
+    есть порядковый номер ord, а id берётся из последовательности заранее -
+    по нему вставленная строка находит свой ord. Ключ, уже занятый
+    параллельным повтором, - прежний лид из таблицы. Повторяющихся ключей
+    внутри values быть не должно.
+    """
+    rows = execute_values(cursor, '''
+        WITH input (ord, user_id, filename, original_filename, file_size, comments, video_data, video_url,
+                    latitude, longitude, geohash, duration, width, height, video_codec, video_sha256,
+                    idempotency_key) AS (
+            VALUES %s
+        ), numbered AS (
+            SELECT nextval(pg_get_serial_sequence('t_p80273517_video_feedback_app.user_videos', 'id')) AS id,
+                   input.*
+            FROM input
+        ), lead AS (
+            INSERT INTO t_p80273517_video_feedback_app.user_videos
+            (id, user_id, filename, original_filename, file_size, comments, video_data, video_url, latitude,
+             longitude, geohash, duration, width, height, video_codec, video_sha256, idempotency_key)
+            SELECT id, user_id, filename, original_filename, file_size, comments, video_data, video_url, latitude,
+                   longitude, geohash, duration, width, height, video_codec, video_sha256, idempotency_key
+            FROM numbered ORDER BY ord
+            ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            RETURNING id, user_id, file_size, created_at, video_url, video_sha256
+        ), notification AS (
+            INSERT INTO t_p80273517_video_feedback_app.lead_notifications (lead_id)
+            SELECT id FROM lead ORDER BY id
+        ), stats AS (
+            INSERT INTO t_p80273517_video_feedback_app.user_lead_stats
+            (user_id, version, lead_count, total_bytes, last_lead_at)
+            SELECT user_id, 1, count(*), COALESCE(sum(file_size), 0), max(created_at) FROM lead
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET version = user_lead_stats.version + 1,
+                lead_count = user_lead_stats.lead_count + EXCLUDED.lead_count,
+                total_bytes = user_lead_stats.total_bytes + EXCLUDED.total_bytes,
+                last_lead_at = GREATEST(user_lead_stats.last_lead_at, EXCLUDED.last_lead_at),
+                updated_at = CURRENT_TIMESTAMP
+        ), blob AS (
+            -- Одно видео в нескольких лидах пакета - одна строка с суммой ссылок
+            INSERT INTO t_p80273517_video_feedback_app.video_blobs (sha256, key, size, ref_count)
+            SELECT video_sha256, min(video_url), min(file_size), count(*) FROM lead
+            WHERE video_url IS NOT NULL AND video_sha256 IS NOT NULL
+            GROUP BY video_sha256
+            ON CONFLICT (sha256) DO UPDATE
+            SET ref_count = video_blobs.ref_count + EXCLUDED.ref_count, touched_at = CURRENT_TIMESTAMP
+        )
+        SELECT numbered.ord, lead.id, lead.created_at FROM lead JOIN numbered USING (id)
+    ''', [(ordinal,) + tuple(value) for ordinal, value in enumerate(values)], template=INSERT_LEADS_TEMPLATE,
+        page_size=max(len(values), 1), fetch=True)
+
+    by_ord = {ordinal: (lead_id, created_at) for ordinal, lead_id, created_at in rows}
+    missing = [value[-1] for ordinal, value in enumerate(values) if ordinal not in by_ord]
+    if missing:
+        # Параллельный повтор успел вставить эти лиды первым (без ключа
+        # конфликта нет, так что здесь только лиды с ключом)
+        existing = find_by_idempotency_keys(cursor, user_id, missing)
+        for ordinal, value in enumerate(values):
+            if ordinal not in by_ord:
+                lead_id, created_at, _ = existing[value[-1]]
+                by_ord[ordinal] = (lead_id, created_at)
+    return [by_ord[ordinal] for ordinal in range(len(values))]
+
+
+def find_by_idempotency_key(cursor, user_id: int, key: str) -> Optional[Tuple[int, Any, int]]:
+    """(lead_id, created_at, file_size) лида, уже сохранённого с этим ключом"""
+    cursor.execute('''
+        SELECT id, created_at, file_size FROM t_p80273517_video_feedback_app.user_videos
+        WHERE user_id = %s AND idempotency_key = %s
+    ''', (user_id, key))
+    return cursor.fetchone()
+
+
+def find_by_idempotency_keys(cursor, user_id: int, keys: Sequence[str]) -> Dict[str, Tuple[int, Any, int]]:
+    """find_by_idempotency_key для нескольких ключей одним запросом"""
+    cursor.execute('''
+        SELECT idempotency_key, id, created_at, file_size FROM t_p80273517_video_feedback_app.user_videos
+        WHERE user_id = %s AND idempotency_key = ANY(%s)
+    ''', (user_id, list(keys)))
+    return {key: (lead_id, created_at, file_size) for key, lead_id, created_at, file_size in cursor.fetchall()}
+
+
+def saved_response_body(lead_id: int, created_at: Any, file_size: int) -> Dict[str, Any]:
+    return {
+        'success': True,
+        'lead_id': lead_id,
+        'created_at': created_at.isoformat(),
+        'file_size': file_size,
+        'message': 'Лид успешно сохранен в базе данных'
+    }
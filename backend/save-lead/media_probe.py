@@ -0,0 +1,394 @@
+import math
+import struct
+from typing import BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+# read_at(offset, length) -> bytes: файл, blob-хранилище и т.п.
+ReadAt = Callable[[int, int], bytes]
+
+# Чтение идёт блоками с небольшим кэшем: для S3 каждый блок - отдельный GET
+READ_BLOCK_SIZE = 64 * 1024
+READ_CACHE_BLOCKS = 16
+# Границы разбора на одно видео: байт прочитано и боксов/элементов обойдено
+MAX_READ_BYTES = 2 * 1024 * 1024
+MAX_NODES = 4096
+# Хвост WebM, где ищется последний Cluster, если в Info нет Duration
+WEBM_TAIL_BYTES = 512 * 1024
+# Пределы колонок user_videos: duration, width, height - integer, video_codec - varchar(32)
+MAX_DB_INT = 2 ** 31 - 1
+MAX_CODEC_LENGTH = 32
+
+MP4_CODECS = {
+    'avc1': 'h264', 'avc3': 'h264', 'hvc1': 'hevc', 'hev1': 'hevc',
+    'vp08': 'vp8', 'vp09': 'vp9', 'av01': 'av1', 'mp4v': 'mpeg4',
+}
+WEBM_CODECS = {
+    'V_VP8': 'vp8', 'V_VP9': 'vp9', 'V_AV1': 'av1',
+    'V_MPEG4/ISO/AVC': 'h264', 'V_MPEGH/ISO/HEVC': 'hevc',
+}
+
+# EBML/Matroska element ids (с маркерными битами)
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TRACKS = 0x1654AE6B
+CLUSTER = 0x1F43B675
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER_TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+CLUSTER_MAGIC = b'\x1f\x43\xb6\x75'
+
+
+class MediaInfo(NamedTuple):
+    container: str
+    duration: Optional[float]
+    width: Optional[int]
+    height: Optional[int]
+    codec: Optional[str]
+
+    @property
+    def duration_seconds(self) -> Optional[int]:
+        """Длительность для user_videos.duration (целые секунды)"""
+        return None if self.duration is None else int(round(self.duration))
+
+
+class ProbeError(Exception):
+    pass
+
+
+class _Source:
+    '''Чтение по смещению через блочный кэш с бюджетом на байты и число узлов'''
+
+    def __init__(self, read_at: ReadAt, size: int):
+        self._read_at = read_at
+        self.size = size
+        self._cache: Dict[int, bytes] = {}
+        self._budget = MAX_READ_BYTES
+        self._nodes = MAX_NODES
+
+    def _block(self, index: int) -> bytes:
+        block = self._cache.get(index)
+        if block is None:
+            start = index * READ_BLOCK_SIZE
+            length = min(READ_BLOCK_SIZE, self.size - start)
+            self._budget -= length
+            if self._budget < 0:
+                raise ProbeError('Read budget exceeded')
+            block = self._read_at(start, length)
+            if len(block) != length:
+                raise ProbeError('Short read')
+            if len(self._cache) >= READ_CACHE_BLOCKS:
+                self._cache.clear()
+            self._cache[index] = block
+        return block
+
+    def read(self, offset: int, length: int) -> bytes:
+        length = min(length, self.size - offset)
+        if offset < 0 or length <= 0:
+            return b''
+        first, last = offset // READ_BLOCK_SIZE, (offset + length - 1) // READ_BLOCK_SIZE
+        data = b''.join(self._block(index) for index in range(first, last + 1))
+        skip = offset - first * READ_BLOCK_SIZE
+        return data[skip:skip + length]
+
+    def node(self) -> None:
+        self._nodes -= 1
+        if self._nodes < 0:
+            raise ProbeError('Too many boxes')
+
+
+def probe(read_at: ReadAt, size: int) -> Optional[MediaInfo]:
+    """
+    Длительность, разрешение и кодек по заголовкам MP4 (moov/mvhd, trak/tkhd,
+    stsd) или WebM (Segment/Info, Tracks). Читаются только нужные боксы и
+    элементы, не больше MAX_READ_BYTES. Непонятный или битый файл - None:
+    метаданные не должны ломать сохранение лида.
+    """
+    source = _Source(read_at, size)
+    try:
+        head = source.read(0, 12)
+        if head[:4] == b'\x1a\x45\xdf\xa3':
+            return _checked(_probe_webm(source))
+        if head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide'):
+            return _checked(_probe_mp4(source))
+    except (ProbeError, struct.error, IndexError, ValueError, OverflowError):
+        pass
+    return None
+
+
+def _checked(info: MediaInfo) -> MediaInfo:
+    """
+    Значения из заголовков присылает клиент: NaN, бесконечность, отрицательные
+    и не влезающие в колонки БД заменяются на None, как и непонятные поля.
+    """
+    duration = info.duration
+    if duration is not None and not (math.isfinite(duration) and 0 <= duration < MAX_DB_INT):
+        duration = None
+    width, height = (
+        value if value is not None and 0 < value <= MAX_DB_INT else None
+        for value in (info.width, info.height)
+    )
+    codec = info.codec if info.codec and len(info.codec) <= MAX_CODEC_LENGTH else None
+    return info._replace(duration=duration, width=width, height=height, codec=codec)
+
+
+def probe_file(fileobj: BinaryIO, size: int) -> Optional[MediaInfo]:
+    """probe для seekable-файла; позиция файла восстанавливается"""
+    position = fileobj.tell()
+
+    def read_at(offset: int, length: int) -> bytes:
+        fileobj.seek(offset)
+        return fileobj.read(length)
+
+    try:
+        return probe(read_at, size)
+    finally:
+        fileobj.seek(position)
+
+
+def probe_blob(store, key: str, size: int) -> Optional[MediaInfo]:
+    """probe для объекта в blob-хранилище: только Range-чтения"""
+    return probe(lambda offset, length: store.read_range(key, offset, length), size)
+
+
+# --- MP4 / ISO BMFF ---
+
+def _boxes(source: _Source, start: int, end: int) -> Iterator[Tuple[str, int, int]]:
+    """(тип, начало данных, конец) для боксов в [start, end)"""
+    pos = start
+    while pos + 8 <= end:
+        source.node()
+        size, kind = struct.unpack('>I4s', source.read(pos, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', source.read(pos + 8, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ProbeError('Bad box size')
+        yield kind.decode('latin-1'), pos + header, min(pos + size, end)
+        pos += size
+
+
+def _child(source: _Source, start: int, end: int, kind: str) -> Optional[Tuple[int, int]]:
+    for child_kind, child_start, child_end in _boxes(source, start, end):
+        if child_kind == kind:
+            return child_start, child_end
+    return None
+
+
+def _probe_mp4(source: _Source) -> MediaInfo:
+    moov = _child(source, 0, source.size, 'moov')
+    if moov is None:
+        raise ProbeError('No moov box')
+    duration = None
+    timescale = 0
+    width = height = codec = None
+    for kind, start, end in _boxes(source, *moov):
+        if kind == 'mvhd':
+            if source.read(start, 1)[0] == 1:
+                timescale, length = struct.unpack('>IQ', source.read(start + 20, 12))
+            else:
+                timescale, length = struct.unpack('>II', source.read(start + 12, 8))
+            if timescale and length not in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                duration = length / timescale
+        elif kind == 'mvex' and duration is None and timescale:
+            # Фрагментированный MP4: длительность (если известна) - в mehd
+            mehd = _child(source, start, end, 'mehd')
+            if mehd:
+                fmt = '>Q' if source.read(mehd[0], 1)[0] == 1 else '>I'
+                length = struct.unpack(fmt, source.read(mehd[0] + 4, struct.calcsize(fmt)))[0]
+                if length:
+                    duration = length / timescale
+        elif kind == 'trak' and codec is None:
+            track = _mp4_video_track(source, start, end)
+            if track:
+                width, height, codec = track
+    return MediaInfo('mp4', duration, width, height, codec)
+
+
+def _mp4_video_track(source: _Source, start: int, end: int) -> Optional[Tuple[Optional[int], Optional[int], Optional[str]]]:
+    tkhd = _child(source, start, end, 'tkhd')
+    mdia = _child(source, start, end, 'mdia')
+    if tkhd is None or mdia is None:
+        return None
+    hdlr = _child(source, *mdia, 'hdlr')
+    if hdlr is None or source.read(hdlr[0] + 8, 4) != b'vide':
+        return None
+    # Ширина и высота - последние поля tkhd, фиксированная точка 16.16
+    width, height = struct.unpack('>II', source.read(tkhd[1] - 8, 8))
+    codec = None
+    minf = _child(source, *mdia, 'minf')
+    stbl = minf and _child(source, *minf, 'stbl')
+    stsd = stbl and _child(source, *stbl, 'stsd')
+    if stsd:
+        # version/flags, entry_count, затем первая запись: size, format
+        fourcc = source.read(stsd[0] + 12, 4).decode('latin-1')
+        codec = MP4_CODECS.get(fourcc, fourcc.strip() or None)
+    return (width >> 16) or None, (height >> 16) or None, codec
+
+
+# --- WebM / Matroska ---
+
+def _vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """EBML variable-size integer; для размера все единицы - неизвестный размер (None)"""
+    first = data[pos]
+    if first == 0:
+        raise ProbeError('Bad EBML vint')
+    length = 9 - first.bit_length()
+    if pos + length > len(data):
+        raise ProbeError('Truncated EBML vint')
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+def _elements(source: _Source, start: int, end: int) -> Iterator[Tuple[int, int, Optional[int]]]:
+    """(id, начало данных, конец или None для неизвестного размера); после такого элемента обход заканчивается"""
+    pos = start
+    while pos < end:
+        source.node()
+        head = source.read(pos, min(12, end - pos))
+        element_id, offset = _vint(head, 0, True)
+        size, offset = _vint(head, offset, False)
+        if size is None:
+            yield element_id, pos + offset, None
+            return
+        yield element_id, pos + offset, pos + offset + size
+        pos += offset + size
+
+
+def _uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+
+def _float(data: bytes) -> Optional[float]:
+    if len(data) == 4:
+        return struct.unpack('>f', data)[0]
+    if len(data) == 8:
+        return struct.unpack('>d', data)[0]
+    return None
+
+
+def _probe_webm(source: _Source) -> MediaInfo:
+    segment = None
+    for element_id, start, end in _elements(source, 0, source.size):
+        if element_id == SEGMENT:
+            segment = (start, source.size if end is None else end)
+            break
+    if segment is None:
+        raise ProbeError('No Segment element')
+
+    scale = 1000000
+    ticks = None
+    width = height = codec = None
+    for element_id, start, end in _elements(source, *segment):
+        # Info и Tracks всегда идут до первого кластера
+        if element_id == CLUSTER or end is None:
+            break
+        if element_id == INFO:
+            for child_id, child_start, child_end in _elements(source, start, end):
+                if child_id == TIMECODE_SCALE and child_end - child_start <= 8:
+                    scale = _uint(source.read(child_start, child_end - child_start))
+                elif child_id == DURATION:
+                    ticks = _float(source.read(child_start, child_end - child_start))
+        elif element_id == TRACKS and codec is None:
+            for child_id, child_start, child_end in _elements(source, start, end):
+                if child_id == TRACK_ENTRY:
+                    track = _webm_video_track(source, child_start, child_end)
+                    if track:
+                        width, height, codec = track
+                        break
+
+    if not ticks:
+        # MediaRecorder в Chrome не пишет Duration: берём время последнего блока в хвосте файла
+        ticks = _webm_tail_timestamp(source, segment[0])
+    duration = ticks * scale / 1e9 if ticks else None
+    return MediaInfo('webm', duration, width, height, codec)
+
+
+def _webm_video_track(source: _Source, start: int, end: int) -> Optional[Tuple[Optional[int], Optional[int], Optional[str]]]:
+    track_type = codec_id = width = height = None
+    for element_id, child_start, child_end in _elements(source, start, end):
+        if child_end is None:
+            break
+        if element_id == TRACK_TYPE:
+            track_type = _uint(source.read(child_start, child_end - child_start))
+        elif element_id == CODEC_ID:
+            codec_id = source.read(child_start, child_end - child_start).rstrip(b'\x00').decode('ascii', 'replace')
+        elif element_id == VIDEO:
+            for video_id, video_start, video_end in _elements(source, child_start, child_end):
+                if video_end is None:
+                    break
+                if video_id == PIXEL_WIDTH:
+                    width = _uint(source.read(video_start, video_end - video_start))
+                elif video_id == PIXEL_HEIGHT:
+                    height = _uint(source.read(video_start, video_end - video_start))
+    if track_type != 1:
+        return None
+    return width, height, WEBM_CODECS.get(codec_id, codec_id)
+
+
+def _webm_tail_timestamp(source: _Source, segment_start: int) -> Optional[int]:
+    tail_start = max(segment_start, source.size - WEBM_TAIL_BYTES)
+    tail = source.read(tail_start, source.size - tail_start)
+    pos = tail.rfind(CLUSTER_MAGIC)
+    while pos != -1:
+        try:
+            return _cluster_end_timestamp(tail, pos)
+        except (ProbeError, IndexError, struct.error):
+            # Совпадение внутри данных блока, а не настоящий Cluster
+            pos = tail.rfind(CLUSTER_MAGIC, 0, pos)
+    return None
+
+
+def _cluster_end_timestamp(data: bytes, pos: int) -> int:
+    """Время кластера плюс наибольшее относительное время его блоков (в тиках TimecodeScale)"""
+    _, offset = _vint(data, pos, True)
+    size, offset = _vint(data, offset, False)
+    end = len(data) if size is None else min(len(data), offset + size)
+    cluster_time = None
+    latest = 0
+    while offset < end:
+        element_id, child_offset = _vint(data, offset, True)
+        size, start = _vint(data, child_offset, False)
+        if size is None or start + size > end:
+            break
+        if cluster_time is None and element_id != CLUSTER_TIMECODE:
+            raise ProbeError('Cluster does not start with Timecode')
+        if element_id == CLUSTER_TIMECODE:
+            cluster_time = _uint(data[start:start + size])
+        elif element_id == SIMPLE_BLOCK:
+            latest = max(latest, _block_timecode(data, start))
+        elif element_id == BLOCK_GROUP:
+            group = start
+            while group < start + size:
+                block_id, block_offset = _vint(data, group, True)
+                block_size, block_start = _vint(data, block_offset, False)
+                if block_size is None:
+                    break
+                if block_id == BLOCK:
+                    latest = max(latest, _block_timecode(data, block_start))
+                group = block_start + block_size
+        offset = start + size
+    if cluster_time is None:
+        raise ProbeError('Cluster without Timecode')
+    return cluster_time + latest
+
+
+def _block_timecode(data: bytes, start: int) -> int:
+    # Номер дорожки (vint), затем знаковое 16-битное время относительно кластера
+    _, pos = _vint(data, start, False)
+    return struct.unpack('>h', data[pos:pos + 2])[0]
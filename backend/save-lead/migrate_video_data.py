@@ -0,0 +1,127 @@
+'''
+Переносит видео из колонки user_videos.video_data в blob-хранилище пачками.
+
+    BLOB_STORAGE_BACKEND=s3 S3_BUCKET=... DATABASE_URL=... \
+        python migrate_video_data.py --batch-size 20
+
+Каждая пачка коммитится отдельно, поэтому прерванный перенос можно
+просто запустить заново. Попутно по заголовкам видео заполняются duration,
+width, height и video_codec. После переноса стоит выполнить VACUUM user_videos.
+'''
+import argparse
+import time
+from typing import Optional
+
+import db
+import media_probe
+import storage
+
+# Пачка - только id и размеры; сами байты читаются по одной строке
+# (SELECT_VIDEO), чтобы в памяти не лежали все видео пачки сразу
+SELECT_BATCH = '''
+    SELECT id, octet_length(video_data)
+    FROM t_p80273517_video_feedback_app.user_videos
+    WHERE video_data IS NOT NULL AND video_url IS NULL AND id > %s
+    ORDER BY id
+    LIMIT %s
+'''
+
+SELECT_VIDEO = '''
+    SELECT video_data FROM t_p80273517_video_feedback_app.user_videos
+    WHERE id = %s AND video_url IS NULL
+'''
+
+# Метаданные попадают в список лидов, поэтому версия списка (ETag) меняется
+BUMP_VERSIONS = '''
+    UPDATE t_p80273517_video_feedback_app.user_lead_stats
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id IN (SELECT DISTINCT user_id FROM t_p80273517_video_feedback_app.user_videos WHERE id = ANY(%s))
+'''
+
+UPDATE_ROW = '''
+    UPDATE t_p80273517_video_feedback_app.user_videos
+    SET video_url = %s, video_sha256 = %s, video_data = NULL,
+        duration = COALESCE(duration, %s), width = COALESCE(width, %s),
+        height = COALESCE(height, %s), video_codec = COALESCE(video_codec, %s)
+    WHERE id = %s AND video_url IS NULL
+'''
+
+# Одинаковые видео разных лидов ложатся в один объект - считаем ссылки
+ADD_BLOB_REF = '''
+    INSERT INTO t_p80273517_video_feedback_app.video_blobs (sha256, key, size, ref_count)
+    VALUES (%s, %s, %s, 1)
+    ON CONFLICT (sha256) DO UPDATE
+    SET ref_count = video_blobs.ref_count + 1, touched_at = CURRENT_TIMESTAMP
+'''
+
+
+def move_row(cursor, store, lead_id: int) -> None:
+    """Переносит видео одного лида; байты живут, пока идёт эта функция"""
+    cursor.execute(SELECT_VIDEO, (lead_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return
+    video_data = row[0]
+    blob = storage.put_bytes(store, video_data)
+    # Заодно заполняем метаданные, которых у старых лидов нет
+    media = media_probe.probe(
+        lambda offset, length: bytes(video_data[offset:offset + length]), len(video_data)
+    )
+    cursor.execute(UPDATE_ROW, (
+        blob.key,
+        blob.sha256,
+        media.duration_seconds if media else None,
+        media.width if media else None,
+        media.height if media else None,
+        media.codec if media else None,
+        lead_id
+    ))
+    if cursor.rowcount:
+        cursor.execute(ADD_BLOB_REF, (blob.sha256, blob.key, blob.size))
+
+
+def migrate(batch_size: int, limit: Optional[int] = None, dry_run: bool = False) -> int:
+    """Переносит до limit строк, возвращает количество перенесённых"""
+    store = storage.get_store()
+    if store is None:
+        raise RuntimeError('BLOB_STORAGE_BACKEND не настроен')
+
+    last_id = 0
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        started = time.monotonic()
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SELECT_BATCH, (last_id, size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for lead_id, _ in rows:
+                    if not dry_run:
+                        move_row(cursor, store, lead_id)
+                    last_id = lead_id
+                    moved += 1
+                if not dry_run:
+                    cursor.execute(BUMP_VERSIONS, ([row[0] for row in rows],))
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        batch_bytes = sum(row[1] or 0 for row in rows)
+        print(f'batch: {len(rows)} rows, {batch_bytes} bytes, last id {last_id}, {time.monotonic() - started:.2f}s')
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Перенос video_data в blob-хранилище')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    moved = migrate(args.batch_size, args.limit, args.dry_run)
+    print(f'done: {moved} rows')
+
+
+if __name__ == '__main__':
+    main()
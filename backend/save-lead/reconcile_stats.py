@@ -0,0 +1,91 @@
+'''
+Сверяет счётчики user_lead_stats с user_videos и чинит расхождения.
+
+    DATABASE_URL=... python reconcile_stats.py [--batch-size 500] [--dry-run]
+
+Пользователи обходятся пачками по user_id. Строки пачки сначала
+блокируются FOR UPDATE: save-lead обновляет их в той же транзакции, что и
+вставляет лид, поэтому пересчёт видит либо лид вместе со счётчиком, либо
+ни то, ни другое. Исправленным пользователям увеличивается и версия (ETag).
+'''
+import argparse
+import time
+from typing import List, Tuple
+
+import db
+
+SELECT_USERS = '''
+    SELECT user_id FROM (
+        SELECT DISTINCT user_id FROM t_p80273517_video_feedback_app.user_videos WHERE user_id > %s
+        UNION
+        SELECT user_id FROM t_p80273517_video_feedback_app.user_lead_stats WHERE user_id > %s
+    ) users
+    ORDER BY user_id
+    LIMIT %s
+'''
+
+LOCK_STATS = '''
+    SELECT user_id FROM t_p80273517_video_feedback_app.user_lead_stats
+    WHERE user_id = ANY(%s)
+    ORDER BY user_id
+    FOR UPDATE
+'''
+
+# Пересчёт по индексу (user_id, ...) только для пачки; совпавшие строки не трогаются
+REPAIR = '''
+    INSERT INTO t_p80273517_video_feedback_app.user_lead_stats AS s
+        (user_id, version, lead_count, total_bytes, last_lead_at)
+    SELECT u.user_id, 1, count(v.id), COALESCE(sum(v.file_size), 0), max(v.created_at)
+    FROM unnest(%s::integer[]) AS u (user_id)
+    LEFT JOIN t_p80273517_video_feedback_app.user_videos v ON v.user_id = u.user_id
+    GROUP BY u.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET lead_count = EXCLUDED.lead_count, total_bytes = EXCLUDED.total_bytes,
+        last_lead_at = EXCLUDED.last_lead_at, version = s.version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE (s.lead_count, s.total_bytes, s.last_lead_at)
+          IS DISTINCT FROM (EXCLUDED.lead_count, EXCLUDED.total_bytes, EXCLUDED.last_lead_at)
+    RETURNING s.user_id, s.lead_count, s.total_bytes
+'''
+
+
+def reconcile(batch_size: int, dry_run: bool = False) -> Tuple[int, List[int]]:
+    """Возвращает (сколько пользователей проверено, id исправленных)"""
+    checked = 0
+    repaired: List[int] = []
+    last_id = 0
+    while True:
+        started = time.monotonic()
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SELECT_USERS, (last_id, last_id, batch_size))
+                user_ids = [row[0] for row in cursor.fetchall()]
+                if not user_ids:
+                    break
+                cursor.execute(LOCK_STATS, (user_ids,))
+                cursor.execute(REPAIR, (user_ids,))
+                fixed = cursor.fetchall()
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        for user_id, lead_count, total_bytes in fixed:
+            print(f'user {user_id}: lead_count={lead_count} total_bytes={total_bytes}')
+        checked += len(user_ids)
+        repaired.extend(row[0] for row in fixed)
+        last_id = user_ids[-1]
+        print(f'batch: {len(user_ids)} users, {len(fixed)} drifted, last id {last_id}, '
+              f'{time.monotonic() - started:.2f}s')
+    return checked, repaired
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='только показать расхождения')
+    args = parser.parse_args()
+    checked, repaired = reconcile(args.batch_size, args.dry_run)
+    print(f'done: {checked} users checked, {len(repaired)} {"drifted" if args.dry_run else "repaired"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+
+# Запрос медленнее порога пишется в лог целиком, остальные - с вероятностью TRACE_SAMPLE_RATE
+SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '1000'))
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+# Каждые N запросов воркер пишет в лог снимок гистограмм (0 - не писать)
+DUMP_EVERY = int(os.environ.get('TRACE_DUMP_EVERY', '0'))
+
+# Верхние границы корзин в мс: 0.25, 0.5, 1, ... ~65 с; последняя корзина - всё, что больше
+BUCKETS_MS = tuple(0.25 * 2 ** i for i in range(19))
+
+
+class Histogram:
+    '''Логарифмическая гистограмма длительностей: O(1) памяти, квантили с точностью до корзины'''
+
+    __slots__ = ('counts', 'count', 'sum_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= rank:
+                return min(BUCKETS_MS[index], self.max_ms) if index < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5), 3),
+            'p95_ms': round(self.quantile(0.95), 3),
+            'p99_ms': round(self.quantile(0.99), 3),
+            'max_ms': round(self.max_ms, 3),
+        }
+
+
+class Trace:
+    '''Замеры одного запроса: время по фазам (в секундах) и объём входа/выхода'''
+
+    __slots__ = ('started', 'phases', 'bytes_in', 'bytes_out', 'error')
+
+    def __init__(self, bytes_in: int = 0):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.error: Optional[str] = None
+
+
+class _Phase:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        phases = self.trace.phases
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.started
+
+
+class _NoPhase:
+    '''Вне запроса (CLI, бенчмарки) фазы ничего не стоят'''
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NO_PHASE = _NoPhase()
+_local = threading.local()
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_requests = 0
+
+
+def start(bytes_in: int = 0) -> Trace:
+    trace = Trace(bytes_in)
+    _local.trace = trace
+    return trace
+
+
+def current() -> Optional[Trace]:
+    return getattr(_local, 'trace', None)
+
+
+def phase(name: str):
+    """with tracing.phase('query'): ... - время суммируется в текущий запрос"""
+    trace = getattr(_local, 'trace', None)
+    return _NO_PHASE if trace is None else _Phase(trace, name)
+
+
+def finish(trace: Trace, status: int, method: str, context: Any) -> None:
+    """
+    Закрывает запрос: обновляет гистограммы и, если запрос медленный, упал
+    или попал в выборку, пишет одну JSON-строку в stdout.
+    """
+    global _requests
+    _local.trace = None
+    total_ms = (time.perf_counter() - trace.started) * 1000
+    with _lock:
+        _observe('total', total_ms)
+        for name, seconds in trace.phases.items():
+            _observe(name, seconds * 1000)
+        _requests += 1
+        dump_now = DUMP_EVERY > 0 and _requests % DUMP_EVERY == 0
+
+    if total_ms >= SLOW_MS or status >= 500 or (SAMPLE_RATE and random.random() < SAMPLE_RATE):
+        record: Dict[str, Any] = {
+            'event': 'request',
+            'function': getattr(context, 'function_name', None),
+            'request_id': getattr(context, 'request_id', None),
+            'method': method,
+            'status': status,
+            'total_ms': round(total_ms, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()},
+            'bytes_in': trace.bytes_in,
+            'bytes_out': trace.bytes_out,
+        }
+        if trace.error:
+            record['error'] = trace.error
+        emit(record)
+    if dump_now:
+        emit({'event': 'histograms', 'function': getattr(context, 'function_name', None), 'phases': snapshot()})
+
+
+def _observe(name: str, ms: float) -> None:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram()
+    histogram.observe(ms)
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Квантили по каждой фазе с начала жизни воркера (или последнего reset)"""
+    with _lock:
+        return {name: histogram.snapshot() for name, histogram in _histograms.items()}
+
+
+def reset() -> None:
+    global _requests
+    with _lock:
+        _histograms.clear()
+        _requests = 0
+
+
+def emit(record: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
@@ -0,0 +1,420 @@
+'''
+Загрузка видео по частям: init -> PUT частей по номерам -> finalize.
+
+    POST ?action=upload_init              {"filename", "total_size", "chunk_size"}
+    PUT  ?upload_id=...&chunk=N           тело - base64 части, заголовок X-Chunk-Sha256
+    GET  ?upload_id=...                   состояние сессии для докачки
+    POST ?action=upload_finalize&upload_id=...   поля лида как в обычном запросе
+
+Части складываются в blob-хранилище под uploads/<upload_id>/<N>, поэтому
+в памяти вызова держится не больше одной части. Пока finalize собирает
+видео, сессия в статусе finalizing: части не принимаются, повторный finalize
+получает 409 со status. Брошенные сессии старше
+UPLOAD_SESSION_TTL секунд удаляет отдельная команда по расписанию (не
+запрос пользователя - у него она отнимала бы время на чужие сессии):
+
+    BLOB_STORAGE_BACKEND=s3 S3_BUCKET=... DATABASE_URL=... python uploads.py gc
+'''
+import base64
+import binascii
+import hashlib
+import json
+import os
+import secrets
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+import blobs
+import db
+import ingest
+import leads
+import media_probe
+import storage
+import tracing
+
+ACTIONS = ('upload_init', 'upload_finalize')
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(2 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('UPLOAD_MAX_CHUNK_SIZE', str(4 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', '86400'))
+# Сколько секунд сессия в статусе finalizing закреплена за собравшим её вызовом
+UPLOAD_FINALIZE_LEASE = int(os.environ.get('UPLOAD_FINALIZE_LEASE', '300'))
+GC_BATCH_SIZE = 20
+
+Result = Tuple[int, Dict[str, Any]]
+
+
+def chunk_key(upload_id: str, index: int) -> str:
+    return f'uploads/{upload_id}/{index}'
+
+
+class ChunkReader:
+    '''Последовательное чтение частей сессии как одного файла'''
+
+    def __init__(self, store, upload_id: str, count: int):
+        self.store = store
+        self.upload_id = upload_id
+        self.count = count
+        self._index = 0
+        self._current = None
+
+    def read(self, size: int = -1) -> bytes:
+        while True:
+            if self._current is None:
+                if self._index >= self.count:
+                    return b''
+                self._current = self.store.open(chunk_key(self.upload_id, self._index))
+                self._index += 1
+            data = self._current.read(size) if size is not None and size >= 0 else self._current.read()
+            if data:
+                return data
+            self._current.close()
+            self._current = None
+
+    def close(self) -> None:
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+
+def _header(event: Dict[str, Any], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _json_body(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """JSON-объект из тела; битый base64 или JSON и не объект - None (ответ 400)"""
+    body = event.get('body') or '{}'
+    try:
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body)
+        data = json.loads(body) if body else {}
+    except ValueError:
+        # binascii.Error, UnicodeDecodeError и JSONDecodeError - подклассы ValueError
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def handle(method: str, action: Optional[str], upload_id: Optional[str], event: Dict[str, Any], user_id: int) -> Result:
+    """Маршрутизация запросов сессии загрузки, возвращает (status, payload)"""
+    store = storage.get_store()
+    if store is None:
+        # Не сбой, а настройка по умолчанию: 501 клиент не повторяет и сразу
+        # отправляет видео одним запросом
+        return 501, {'error': 'Chunked upload requires blob storage'}
+    body = _json_body(event) if method == 'POST' else {}
+    if body is None:
+        return 400, {'error': 'Invalid JSON format'}
+    if method == 'POST' and action == 'upload_init':
+        return init_session(user_id, body)
+    if not upload_id:
+        return 400, {'error': 'upload_id is required'}
+    if method == 'GET':
+        return session_status(user_id, upload_id)
+    if method == 'PUT':
+        chunk = (event.get('queryStringParameters') or {}).get('chunk')
+        return put_chunk(store, user_id, upload_id, chunk, event)
+    if method == 'POST' and action == 'upload_finalize':
+        return finalize(store, user_id, upload_id, body)
+    return 400, {'error': 'Unknown upload action'}
+
+
+def init_session(user_id: int, body: Dict[str, Any]) -> Result:
+    upload_id = secrets.token_hex(16)
+    try:
+        chunk_size = min(int(body.get('chunk_size') or UPLOAD_CHUNK_SIZE), UPLOAD_MAX_CHUNK_SIZE)
+        total_size = int(body['total_size']) if body.get('total_size') is not None else None
+    except (TypeError, ValueError):
+        return 400, {'error': 'Invalid chunk_size or total_size'}
+    if total_size is not None and total_size > ingest.MAX_VIDEO_BYTES:
+        return 413, {'error': 'Video is too large', 'max_bytes': ingest.MAX_VIDEO_BYTES}
+
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO t_p80273517_video_feedback_app.upload_sessions
+                (id, user_id, filename, total_size, chunk_size)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (upload_id, user_id, body.get('filename'), total_size, chunk_size))
+        conn.commit()
+
+    return 201, {
+        'upload_id': upload_id,
+        'chunk_size': chunk_size,
+        'next_chunk': 0,
+        'received_bytes': 0
+    }
+
+
+def session_status(user_id: int, upload_id: str) -> Result:
+    with db.connection(autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT next_chunk, received_bytes, total_size, chunk_size, status, lead_id
+                FROM t_p80273517_video_feedback_app.upload_sessions
+                WHERE id = %s AND user_id = %s
+            ''', (upload_id, user_id))
+            row = cursor.fetchone()
+    if not row:
+        return 404, {'error': 'Upload session not found'}
+    return 200, {
+        'upload_id': upload_id,
+        'next_chunk': row[0],
+        'received_bytes': row[1],
+        'total_size': row[2],
+        'chunk_size': row[3],
+        'status': row[4],
+        'lead_id': row[5]
+    }
+
+
+def put_chunk(store, user_id: int, upload_id: str, chunk: Optional[str], event: Dict[str, Any]) -> Result:
+    try:
+        index = int(chunk)
+    except (TypeError, ValueError):
+        return 400, {'error': 'chunk number is required'}
+    checksum = (_header(event, 'X-Chunk-Sha256') or '').strip().lower()
+    if not checksum:
+        return 400, {'error': 'X-Chunk-Sha256 header is required'}
+
+    # Тело - base64 (isBase64Encoded для бинарного тела или base64-текст от клиента)
+    if len(event.get('body') or '') > (UPLOAD_MAX_CHUNK_SIZE + 2) // 3 * 4:
+        return 413, {'error': 'Chunk is too large', 'max_chunk_size': UPLOAD_MAX_CHUNK_SIZE}
+    try:
+        data = base64.b64decode(event.get('body') or '', validate=True)
+    except (binascii.Error, ValueError):
+        return 400, {'error': 'Chunk body must be base64'}
+    if not data:
+        return 400, {'error': 'Empty chunk'}
+    if hashlib.sha256(data).hexdigest() != checksum:
+        return 422, {'error': 'Chunk checksum mismatch'}
+
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT next_chunk, received_bytes, total_size, status
+                FROM t_p80273517_video_feedback_app.upload_sessions
+                WHERE id = %s AND user_id = %s
+                FOR UPDATE
+            ''', (upload_id, user_id))
+            row = cursor.fetchone()
+            if not row:
+                return 404, {'error': 'Upload session not found'}
+            next_chunk, received_bytes, total_size, status = row
+            state = {'upload_id': upload_id, 'next_chunk': next_chunk, 'received_bytes': received_bytes}
+
+            if status != 'open':
+                return 409, dict(state, error='Upload session is closed')
+            if index < next_chunk:
+                # Повтор уже принятой части после обрыва связи - подтверждаем, если совпадает
+                cursor.execute('''
+                    SELECT sha256 FROM t_p80273517_video_feedback_app.upload_chunks
+                    WHERE upload_id = %s AND chunk_index = %s
+                ''', (upload_id, index))
+                stored = cursor.fetchone()
+                if stored and stored[0] == checksum:
+                    return 200, dict(state, chunk=index)
+                return 409, dict(state, error='Chunk already received with different content')
+            if index > next_chunk:
+                return 409, dict(state, error='Unexpected chunk number')
+            if total_size is not None and received_bytes + len(data) > total_size:
+                return 413, dict(state, error='Upload exceeds declared total_size')
+            if received_bytes + len(data) > ingest.MAX_VIDEO_BYTES:
+                return 413, dict(state, error='Video is too large', max_bytes=ingest.MAX_VIDEO_BYTES)
+
+            store.write(chunk_key(upload_id, index), data)
+            cursor.execute('''
+                INSERT INTO t_p80273517_video_feedback_app.upload_chunks
+                (upload_id, chunk_index, size, sha256)
+                VALUES (%s, %s, %s, %s)
+            ''', (upload_id, index, len(data), checksum))
+            cursor.execute('''
+                UPDATE t_p80273517_video_feedback_app.upload_sessions
+                SET next_chunk = next_chunk + 1, received_bytes = received_bytes + %s,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING next_chunk, received_bytes
+            ''', (len(data), upload_id))
+            next_chunk, received_bytes = cursor.fetchone()
+        conn.commit()
+
+    return 200, {'upload_id': upload_id, 'chunk': index, 'next_chunk': next_chunk, 'received_bytes': received_bytes}
+
+
+def _hash_chunks(store, upload_id: str, count: int) -> Tuple[str, int]:
+    """SHA-256 и размер видео из частей сессии - только чтение, без сборки объекта"""
+    digest = hashlib.sha256()
+    size = 0
+    reader = ChunkReader(store, upload_id, count)
+    try:
+        for data in iter(lambda: reader.read(storage.COPY_CHUNK_SIZE), b''):
+            digest.update(data)
+            size += len(data)
+    finally:
+        reader.close()
+    return digest.hexdigest(), size
+
+
+def finalize(store, user_id: int, upload_id: str, body: Dict[str, Any]) -> Result:
+    """
+    Сборка видео из частей и создание лида в три шага, чтобы строка сессии и
+    транзакция не держались, пока хешируются и собираются до 100 МБ:
+    сессия помечается finalizing (commit), видео собирается вне транзакции,
+    лид и статус done записываются второй короткой транзакцией.
+    """
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT next_chunk, received_bytes, total_size, status, lead_id,
+                       updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                FROM t_p80273517_video_feedback_app.upload_sessions
+                WHERE id = %s AND user_id = %s
+                FOR UPDATE
+            ''', (UPLOAD_FINALIZE_LEASE, upload_id, user_id))
+            row = cursor.fetchone()
+            if not row:
+                return 404, {'error': 'Upload session not found'}
+            next_chunk, received_bytes, total_size, status, lead_id, lease_expired = row
+
+            if status == 'done':
+                # Повторный finalize возвращает уже созданный лид
+                return 200, _saved_lead(cursor, lead_id)
+            if status == 'finalizing' and not lease_expired:
+                # Сборку ведёт другой вызов; вызов, упавший посреди сборки,
+                # перестаёт её держать через UPLOAD_FINALIZE_LEASE секунд
+                return 409, {'error': 'Upload is being finalized', 'status': status}
+            if next_chunk == 0:
+                return 400, {'error': 'No chunks uploaded'}
+            if total_size is not None and received_bytes != total_size:
+                return 409, {'error': 'Upload is incomplete', 'next_chunk': next_chunk,
+                             'received_bytes': received_bytes}
+            cursor.execute('''
+                UPDATE t_p80273517_video_feedback_app.upload_sessions
+                SET status = 'finalizing', updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (upload_id,))
+        conn.commit()
+
+    uploaded = None
+    try:
+        # Хеш - до сборки: такое же видео уже сохранено (тот же SHA-256) -
+        # лид ссылается на него, новый объект не собирается
+        sha256, size = _hash_chunks(store, upload_id, next_chunk)
+        with db.connection(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                video_url = blobs.touch(cursor, sha256)
+        if video_url is None:
+            reader = ChunkReader(store, upload_id, next_chunk)
+            try:
+                video_url = store.put_file(reader, sha256, size).key
+            finally:
+                reader.close()
+            uploaded = (sha256, video_url, size)
+        media = media_probe.probe_blob(store, video_url, size)
+
+        with db.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    SELECT status, lead_id FROM t_p80273517_video_feedback_app.upload_sessions
+                    WHERE id = %s
+                    FOR UPDATE
+                ''', (upload_id,))
+                row = cursor.fetchone()
+                if row and row[0] == 'done':
+                    # Сессию после истечения аренды успел закончить другой вызов
+                    result = _saved_lead(cursor, row[1])
+                    conn.rollback()
+                    if uploaded:
+                        blobs.record_unreferenced(*uploaded)
+                    return 200, result
+                if not row:
+                    raise LookupError('Upload session disappeared during finalize')
+                lead_id, created_at = leads.insert_lead(
+                    cursor, user_id, leads.lead_fields(body), size, None, video_url, media, sha256
+                )
+                cursor.execute('''
+                    UPDATE t_p80273517_video_feedback_app.upload_sessions
+                    SET status = 'done', lead_id = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                ''', (lead_id, upload_id))
+            conn.commit()
+    except Exception:
+        # Собранный объект без строки в video_blobs сборщик не нашёл бы
+        if uploaded:
+            blobs.record_unreferenced(*uploaded)
+        _reopen(upload_id)
+        raise
+
+    _delete_chunks(store, upload_id, next_chunk)
+    return 200, leads.saved_response_body(lead_id, created_at, size)
+
+
+def _saved_lead(cursor, lead_id: int) -> Dict[str, Any]:
+    cursor.execute('''
+        SELECT created_at, file_size FROM t_p80273517_video_feedback_app.user_videos
+        WHERE id = %s
+    ''', (lead_id,))
+    created_at, file_size = cursor.fetchone()
+    return leads.saved_response_body(lead_id, created_at, file_size)
+
+
+def _reopen(upload_id: str) -> None:
+    """После сбоя сборки сессия снова open - повторный finalize не ждёт аренду"""
+    try:
+        with db.connection(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    UPDATE t_p80273517_video_feedback_app.upload_sessions
+                    SET status = 'open', updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND status = 'finalizing'
+                ''', (upload_id,))
+    except Exception as e:
+        tracing.emit({'event': 'upload_reopen_failed', 'upload_id': upload_id, 'error': str(e)})
+
+
+def _delete_chunks(store, upload_id: str, count: int) -> None:
+    for index in range(count):
+        try:
+            store.delete(chunk_key(upload_id, index))
+        except Exception as e:
+            tracing.emit({'event': 'chunk_delete_failed', 'upload_id': upload_id, 'chunk': index, 'error': str(e)})
+
+
+def collect_stale_sessions(store, limit: int = GC_BATCH_SIZE) -> int:
+    """Удаляет сессии без активности дольше UPLOAD_SESSION_TTL вместе с частями"""
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                DELETE FROM t_p80273517_video_feedback_app.upload_sessions
+                WHERE id IN (
+                    SELECT id FROM t_p80273517_video_feedback_app.upload_sessions
+                    WHERE updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                    ORDER BY updated_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, next_chunk, status
+            ''', (UPLOAD_SESSION_TTL, limit))
+            rows = cursor.fetchall()
+        conn.commit()
+    for upload_id, next_chunk, status in rows:
+        if status != 'done':
+            _delete_chunks(store, upload_id, next_chunk)
+    return len(rows)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['gc']:
+        sys.exit('usage: python uploads.py gc')
+    blob_store = storage.get_store()
+    if blob_store is None:
+        sys.exit('BLOB_STORAGE_BACKEND не настроен')
+    total = 0
+    while True:
+        removed = collect_stale_sessions(blob_store, limit=100)
+        total += removed
+        if removed == 0:
+            break
+    print(f'removed {total} stale upload sessions')
@@ -0,0 +1,195 @@
+'''
+Отправка уведомлений о новых лидах из outbox lead_notifications.
+
+    DATABASE_URL=... TELEGRAM_BOT_TOKEN=... TELEGRAM_CHAT_ID=... python dispatcher.py [--loop]
+
+Цикл: забрать пачку (FOR UPDATE SKIP LOCKED + аренда на DISPATCH_LEASE_SECONDS,
+чтобы параллельные диспетчеры не брали одни и те же строки, а строки упавшего
+диспетчера вернулись в очередь), разослать параллельно, записать итоги
+несколькими UPDATE на всю пачку. Неудачные попытки откладываются с
+экспоненциальной задержкой, после DISPATCH_MAX_ATTEMPTS строка - failed.
+'''
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+import db
+import telegram
+
+BATCH_SIZE = int(os.environ.get('DISPATCH_BATCH_SIZE', '50'))
+LEASE_SECONDS = int(os.environ.get('DISPATCH_LEASE_SECONDS', '60'))
+MAX_ATTEMPTS = int(os.environ.get('DISPATCH_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE_SECONDS = float(os.environ.get('DISPATCH_BACKOFF_BASE', '5'))
+BACKOFF_MAX_SECONDS = float(os.environ.get('DISPATCH_BACKOFF_MAX', '3600'))
+CONCURRENCY = int(os.environ.get('DISPATCH_CONCURRENCY', '4'))
+# Сколько пачек обрабатывает один вызов функции по таймеру
+MAX_BATCHES = int(os.environ.get('DISPATCH_MAX_BATCHES', '10'))
+
+CLAIM_BATCH = '''
+    WITH claimed AS (
+        SELECT id FROM t_p80273517_video_feedback_app.lead_notifications
+        WHERE status = 'pending' AND next_attempt_at <= now()
+          AND (locked_until IS NULL OR locked_until < now())
+        ORDER BY next_attempt_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE t_p80273517_video_feedback_app.lead_notifications n
+    SET locked_until = now() + make_interval(secs => %s), attempts = n.attempts + 1
+    FROM claimed, t_p80273517_video_feedback_app.user_videos v
+    WHERE n.id = claimed.id AND v.id = n.lead_id
+    RETURNING n.id, n.attempts, v.id, v.user_id, v.original_filename, v.filename, v.comments,
+              v.created_at, v.latitude, v.longitude, v.duration
+'''
+
+MARK_SENT = '''
+    UPDATE t_p80273517_video_feedback_app.lead_notifications
+    SET status = 'sent', sent_at = now(), locked_until = NULL, last_error = NULL
+    WHERE id = ANY(%s)
+'''
+
+MARK_LEADS_SENT = '''
+    UPDATE t_p80273517_video_feedback_app.user_videos SET telegram_sent = TRUE WHERE id = ANY(%s)
+'''
+
+MARK_RETRY = '''
+    UPDATE t_p80273517_video_feedback_app.lead_notifications n
+    SET status = data.status, next_attempt_at = now() + make_interval(secs => data.delay),
+        locked_until = NULL, last_error = data.error
+    FROM (VALUES %s) AS data (id, status, delay, error)
+    WHERE n.id = data.id
+'''
+
+
+class Notification(NamedTuple):
+    id: int
+    attempts: int
+    lead_id: int
+    user_id: int
+    original_filename: Optional[str]
+    filename: str
+    comments: Optional[str]
+    created_at: Any
+    latitude: Any
+    longitude: Any
+    duration: Optional[int]
+
+
+def format_message(item: Notification) -> str:
+    lines = [f'Новый лид #{item.lead_id} (пользователь {item.user_id})']
+    lines.append(f'Файл: {item.original_filename or item.filename}')
+    if item.duration is not None:
+        lines.append(f'Длительность: {item.duration // 60}:{item.duration % 60:02d}')
+    if item.comments:
+        lines.append(f'Комментарий: {item.comments}')
+    if item.latitude is not None and item.longitude is not None:
+        lines.append(f'Геолокация: https://maps.google.com/?q={item.latitude},{item.longitude}')
+    if item.created_at:
+        lines.append(f'Создан: {item.created_at:%d.%m.%Y %H:%M}')
+    return '\n'.join(lines)
+
+
+def backoff_seconds(attempts: int, retry_after: Optional[int] = None) -> float:
+    """Экспоненциальная задержка с джиттером; retry_after из 429 - нижняя граница"""
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    delay *= 0.5 + random.random() / 2
+    return max(delay, retry_after or 0)
+
+
+def claim_batch(batch_size: int = BATCH_SIZE) -> List[Notification]:
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(CLAIM_BATCH, (batch_size, LEASE_SECONDS))
+            rows = cursor.fetchall()
+        conn.commit()
+    return [Notification(*row) for row in rows]
+
+
+def send_batch(client: telegram.TelegramClient, pool: ThreadPoolExecutor,
+               batch: List[Notification]) -> List[Tuple[Notification, Optional[telegram.SendError]]]:
+    def send(item: Notification) -> Tuple[Notification, Optional[telegram.SendError]]:
+        try:
+            client.send_message(format_message(item))
+            return item, None
+        except telegram.SendError as e:
+            return item, e
+
+    return list(pool.map(send, batch))
+
+
+def record_results(results: List[Tuple[Notification, Optional[telegram.SendError]]]) -> Dict[str, int]:
+    sent = [item for item, error in results if error is None]
+    retries = []
+    failed = 0
+    for item, error in results:
+        if error is None:
+            continue
+        if error.permanent or item.attempts >= MAX_ATTEMPTS:
+            retries.append((item.id, 'failed', 0.0, str(error)[:1000]))
+            failed += 1
+        else:
+            retries.append((item.id, 'pending', backoff_seconds(item.attempts, error.retry_after), str(error)[:1000]))
+
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            if sent:
+                cursor.execute(MARK_SENT, ([item.id for item in sent],))
+                cursor.execute(MARK_LEADS_SENT, ([item.lead_id for item in sent],))
+            if retries:
+                execute_values(cursor, MARK_RETRY, retries, template='(%s, %s, %s::float8, %s)')
+        conn.commit()
+    return {'sent': len(sent), 'retried': len(retries) - failed, 'failed': failed}
+
+
+def dispatch(client: telegram.TelegramClient, max_batches: int = MAX_BATCHES,
+             batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY) -> Dict[str, Any]:
+    """Обрабатывает пачки, пока очередь не опустеет или не кончится max_batches"""
+    totals = {'batches': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(max_batches):
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            counts = record_results(send_batch(client, pool, batch))
+            totals['batches'] += 1
+            for key, value in counts.items():
+                totals[key] += value
+    totals['seconds'] = round(time.monotonic() - started, 3)
+    return totals
+
+
+def client_from_env() -> telegram.TelegramClient:
+    token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    chat_id = os.environ.get('TELEGRAM_CHAT_ID')
+    if not token or not chat_id:
+        raise RuntimeError('TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID не найдены в переменных окружения')
+    return telegram.TelegramClient(token, chat_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loop', action='store_true', help='работать постоянно, опрашивая очередь')
+    parser.add_argument('--interval', type=float, default=2.0, help='пауза при пустой очереди, сек')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    client = client_from_env()
+    while True:
+        totals = dispatch(client, batch_size=args.batch_size, concurrency=args.concurrency)
+        print(json.dumps(totals))
+        if not args.loop:
+            break
+        if totals['batches'] < MAX_BATCHES:
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
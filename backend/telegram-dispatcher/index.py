@@ -0,0 +1,53 @@
+import hmac
+import os
+from typing import Dict, Any
+
+import dispatcher
+import runtime
+
+service = runtime.Service()
+
+# Ручной вызов по HTTP - только с этим секретом в X-Dispatch-Secret;
+# без переменной принимаются лишь вызовы таймера
+DISPATCH_SECRET = os.environ.get('DISPATCH_SECRET', '')
+TIMER_EVENT_TYPE = 'yandex.cloud.events.serverless.triggers.TimerMessage'
+
+def is_timer_trigger(event: Dict[str, Any]) -> bool:
+    '''
+    Вызов от триггера-таймера: у него нет httpMethod, а в messages - сообщение
+    TimerMessage. HTTP-запрос такое событие подделать не может - шлюз всегда
+    передаёт httpMethod, а тело запроса лежит в body
+    '''
+    if 'httpMethod' in event:
+        return False
+    messages = event.get('messages')
+    return bool(messages) and isinstance(messages, list) and all(
+        isinstance(message, dict)
+        and (message.get('event_metadata') or {}).get('event_type') == TIMER_EVENT_TYPE
+        for message in messages
+    )
+
+def is_authorized(request: runtime.Request) -> bool:
+    if is_timer_trigger(request.event):
+        return True
+    secret = request.header('X-Dispatch-Secret')
+    return bool(DISPATCH_SECRET) and secret is not None and hmac.compare_digest(
+        secret.encode('utf-8'), DISPATCH_SECRET.encode('utf-8')
+    )
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Отправляет в Telegram уведомления о новых лидах из outbox
+    Args: event - dict с httpMethod (вызов вручную с X-Dispatch-Secret)
+          или messages (вызов по таймеру)
+          context - объект с атрибутами request_id, function_name
+    Returns: HTTP response dict со счётчиками отправки
+    '''
+    return service(event, context)
+
+@service.route('GET', 'POST')
+def dispatch(request: runtime.Request) -> Dict[str, Any]:
+    if not is_authorized(request):
+        return service.error(403, 'Forbidden')
+    totals = dispatcher.dispatch(dispatcher.client_from_env())
+    return service.respond(200, dict(totals, success=True))
@@ -0,0 +1,81 @@
+'''
+Локальная заглушка Telegram Bot API для проверки диспетчера без сети.
+
+    python stub_server.py --port 8081 --fail-rate 0.2 --throttle-rate 0.05 --latency-ms 30
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=stub TELEGRAM_CHAT_ID=1 \
+        DATABASE_URL=... python dispatcher.py
+
+Отвечает на POST /bot<token>/sendMessage: успехом, 500 (доля --fail-rate)
+или 429 с retry_after (доля --throttle-rate). GET /stats - счётчики ответов.
+'''
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+stats: Dict[str, int] = {'ok': 0, 'error': 0, 'throttled': 0}
+stats_lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    options: argparse.Namespace
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        with stats_lock:
+            self._reply(200, dict(stats))
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.endswith('/sendMessage'):
+            self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+        time.sleep(self.options.latency_ms / 1000)
+        roll = random.random()
+        if roll < self.options.throttle_rate:
+            outcome, status = 'throttled', 429
+            payload = {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                       'parameters': {'retry_after': self.options.retry_after}}
+        elif roll < self.options.throttle_rate + self.options.fail_rate:
+            outcome, status = 'error', 500
+            payload = {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+        else:
+            outcome, status = 'ok', 200
+            payload = {'ok': True, 'result': {'message_id': random.randint(1, 10 ** 9)}}
+        with stats_lock:
+            stats[outcome] += 1
+        self._reply(status, payload)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    StubHandler.options = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', StubHandler.options.port), StubHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
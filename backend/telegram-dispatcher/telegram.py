@@ -0,0 +1,79 @@
+import http.client
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+# Для офлайн-проверки направляется на stub_server.py, например http://127.0.0.1:8081
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_TIMEOUT = float(os.environ.get('TELEGRAM_TIMEOUT', '10'))
+
+
+class SendError(Exception):
+    '''
+    Неудачная отправка. retry_after - сколько секунд просит подождать API
+    (ответ 429), permanent - повтор не поможет (неверный чат, бот удалён).
+    '''
+
+    def __init__(self, message: str, retry_after: Optional[int] = None, permanent: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+class TelegramClient:
+    '''
+    Bot API sendMessage поверх http.client: у каждого потока своё
+    keep-alive соединение, поэтому пачка не платит за TLS на каждое сообщение.
+    '''
+
+    def __init__(self, token: str, chat_id: str, api_url: str = TELEGRAM_API_URL, timeout: float = TELEGRAM_TIMEOUT):
+        parts = urlsplit(api_url)
+        self._https = parts.scheme == 'https'
+        self._host = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._path = f'{self._prefix}/bot{token}/sendMessage'
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            conn = self._local.conn = connection_class(self._host, timeout=self.timeout)
+        return conn
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def send_message(self, text: str) -> Dict[str, Any]:
+        body = json.dumps({'chat_id': self.chat_id, 'text': text, 'disable_web_page_preview': True})
+        try:
+            conn = self._connection()
+            conn.request('POST', self._path, body=body.encode('utf-8'), headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self._drop_connection()
+            raise SendError(f'{type(e).__name__}: {e}')
+
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            payload = {}
+        if response.status == 200 and payload.get('ok'):
+            return payload.get('result') or {}
+        description = payload.get('description') or f'HTTP {response.status}'
+        if response.status == 429:
+            retry_after = (payload.get('parameters') or {}).get('retry_after')
+            raise SendError(description, retry_after=int(retry_after) if retry_after else None)
+        # 400 (чат не найден) и 403 (бота удалили из чата) повтором не лечатся
+        raise SendError(description, permanent=response.status in (400, 403))
+
+    def close(self) -> None:
+        self._drop_connection()
@@ -0,0 +1,269 @@
+import base64
+import gzip
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сжатие ответов (Service(compress=True)): тела меньше порога не сжимаются
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+ETAG_ENCODING_SUFFIXES = ('-br"', '-gzip"')
+
+
+def dumps(payload: Any) -> str:
+    """JSON-строка ответа: orjson, если установлен, иначе stdlib"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br (если есть модуль brotli) или gzip по Accept-Encoding с учётом q; None - без сжатия"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        params = params.strip().lower()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    default = weights.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best = max(candidates, key=lambda encoding: weights.get(encoding, default))
+    return best if weights.get(best, default) > 0 else None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class HttpError(Exception):
+    '''Ошибка, которая превращается в JSON-ответ {"error": ...} с нужным статусом'''
+
+    def __init__(self, status: int, error: str, **extra: Any):
+        super().__init__(error)
+        self.status = status
+        self.payload = dict(extra, error=error)
+
+
+class InvalidJson(HttpError):
+    def __init__(self):
+        super().__init__(400, 'Invalid JSON format')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли etag со списком из If-None-Match (слабое сравнение, RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        # Сжатый ответ отдаётся с ETag "<etag>-gzip" - это то же содержимое
+        for suffix in ETAG_ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+        if tag == etag:
+            return True
+    return False
+
+
+class Request:
+    __slots__ = ('event', 'context', 'method', 'headers', 'query', '_lower_headers')
+
+    def __init__(self, event: Dict[str, Any], context: Any):
+        self.event = event
+        self.context = context
+        self.method = event.get('httpMethod', 'GET')
+        self.headers = event.get('headers') or {}
+        self.query = event.get('queryStringParameters') or {}
+        self._lower_headers = None
+
+    def header(self, name: str) -> Optional[str]:
+        """Заголовок без учёта регистра"""
+        value = self.headers.get(name)
+        if value is None:
+            if self._lower_headers is None:
+                self._lower_headers = {k.lower(): v for k, v in self.headers.items()}
+            value = self._lower_headers.get(name.lower())
+        return value
+
+    @property
+    def source_ip(self) -> Optional[str]:
+        """IP клиента из requestContext шлюза, иначе первый адрес X-Forwarded-For"""
+        identity = (self.event.get('requestContext') or {}).get('identity') or {}
+        if identity.get('sourceIp'):
+            return identity['sourceIp']
+        forwarded = self.header('X-Forwarded-For')
+        return forwarded.split(',')[0].strip() if forwarded else None
+
+    def etag_matches(self, etag: str) -> bool:
+        return etag_matches(self.header('If-None-Match'), etag)
+
+    @property
+    def body(self) -> str:
+        return self.event.get('body') or ''
+
+    def json(self) -> Dict[str, Any]:
+        """Тело запроса как JSON-объект; неверный JSON - HttpError 400"""
+        body = self.event.get('body') or '{}'
+        if isinstance(body, dict):
+            return body
+        try:
+            with tracing.phase('parse'):
+                if self.event.get('isBase64Encoded'):
+                    body = base64.b64decode(body)
+                data = json.loads(body) if body else {}
+        except ValueError:
+            raise InvalidJson()
+        if not isinstance(data, dict):
+            raise InvalidJson()
+        return data
+
+
+Route = Callable[[Request], Dict[str, Any]]
+
+
+class Service:
+    '''
+    Общий каркас функции: CORS, OPTIONS, маршрутизация по методу и единый
+    формат ошибок. Заголовки и типовые ответы собираются один раз при импорте.
+    Каждый запрос замеряется (см. tracing.py). С compress=True текстовые
+    ответы сжимаются по Accept-Encoding; ответ с Cache-Control: no-transform
+    (например, с видео внутри) отдаётся как есть.
+    '''
+
+    def __init__(self, allow_headers: Iterable[str] = ('Content-Type',), error_fields: Optional[Dict[str, Any]] = None,
+                 messages: Optional[Dict[str, str]] = None, expose_headers: Iterable[str] = (), compress: bool = False):
+        self.routes: Dict[str, Route] = {}
+        self.compress = compress
+        self.allow_headers = ', '.join(allow_headers)
+        self.expose_headers = ', '.join(expose_headers)
+        self.error_fields = error_fields or {}
+        self.messages = {
+            'method_not_allowed': 'Method not allowed',
+            'invalid_json': 'Invalid JSON format',
+            'internal': 'Server error',
+        }
+        self.messages.update(messages or {})
+        self.cors_headers: Dict[str, str] = {}
+        self.json_headers: Dict[str, str] = {}
+        self._options_response: Dict[str, Any] = {}
+        self._build_templates()
+
+    def _build_templates(self) -> None:
+        self.cors_headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': ', '.join(list(self.routes) + ['OPTIONS']),
+            'Access-Control-Allow-Headers': self.allow_headers,
+        }
+        if self.expose_headers:
+            self.cors_headers['Access-Control-Expose-Headers'] = self.expose_headers
+        self.json_headers = dict(self.cors_headers, **{'Content-Type': 'application/json'})
+        self._options_response = {
+            'statusCode': 200,
+            'headers': dict(self.cors_headers, **{'Access-Control-Max-Age': '86400'}),
+            'body': '{}',
+            'isBase64Encoded': False
+        }
+
+    def route(self, *methods: str) -> Callable[[Route], Route]:
+        def register(func: Route) -> Route:
+            for method in methods:
+                self.routes[method] = func
+            self._build_templates()
+            return func
+        return register
+
+    def respond(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """JSON-ответ; без дополнительных заголовков используется общий шаблон"""
+        with tracing.phase('serialize'):
+            body = dumps(payload)
+        return {
+            'statusCode': status,
+            'headers': dict(self.json_headers, **headers) if headers else self.json_headers,
+            'body': body,
+            'isBase64Encoded': False
+        }
+
+    def not_modified(self, etag: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """304 без тела: клиент использует закэшированный ответ с этим ETag"""
+        return {
+            'statusCode': 304,
+            'headers': dict(self.cors_headers, ETag=etag, **(headers or {})),
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    def error(self, status: int, error: str, **extra: Any) -> Dict[str, Any]:
+        return self.respond(status, dict(self.error_fields, **extra, error=error))
+
+    def _compress(self, request: Request, response: Dict[str, Any]) -> Dict[str, Any]:
+        headers = response.get('headers') or {}
+        body = response.get('body')
+        if response.get('isBase64Encoded') or not body or 'Content-Encoding' in headers:
+            return response
+        if not headers.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return response
+        # Копия: headers может быть общим шаблоном json_headers
+        headers = dict(headers, Vary='Accept-Encoding')
+        encoding = choose_encoding(request.header('Accept-Encoding')) if len(body) >= COMPRESS_MIN_BYTES else None
+        if encoding is None:
+            return dict(response, headers=headers)
+        with tracing.phase('compress'):
+            encoded = base64.b64encode(compress(body.encode('utf-8'), encoding)).decode('ascii')
+        if len(encoded) >= len(body):
+            return dict(response, headers=headers)
+        headers['Content-Encoding'] = encoding
+        if 'ETag' in headers:
+            headers['ETag'] = f'{headers["ETag"][:-1]}-{encoding}"'
+        return dict(response, headers=headers, body=encoded, isBase64Encoded=True)
+
+    def __call__(self, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        request = Request(event, context)
+        if request.method == 'OPTIONS':
+            return self._options_response
+        route = self.routes.get(request.method)
+        if route is None:
+            return self.error(405, self.messages['method_not_allowed'])
+        body = event.get('body')
+        trace = tracing.start(len(body) if isinstance(body, str) else 0)
+        try:
+            response = route(request)
+        except InvalidJson:
+            response = self.error(400, self.messages['invalid_json'])
+        except HttpError as e:
+            response = self.respond(e.status, dict(self.error_fields, **e.payload))
+        except Exception as e:
+            trace.error = type(e).__name__
+            response = self.error(500, self.messages['internal'], details=str(e))
+        if self.compress:
+            response = self._compress(request, response)
+        trace.bytes_out = len(response.get('body') or '')
+        tracing.finish(trace, response['statusCode'], request.method, context)
+        return response
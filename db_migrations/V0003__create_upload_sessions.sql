@@ -0,0 +1,26 @@
+-- Сессии загрузки видео по частям
+
+CREATE TABLE upload_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    filename VARCHAR(255),
+    total_size BIGINT,
+    chunk_size INTEGER NOT NULL,
+    next_chunk INTEGER NOT NULL DEFAULT 0,
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    status VARCHAR(16) NOT NULL DEFAULT 'open',
+    lead_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Контрольные суммы принятых частей (для идемпотентного повтора части)
+CREATE TABLE upload_chunks (
+    upload_id VARCHAR(64) NOT NULL REFERENCES upload_sessions(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    PRIMARY KEY (upload_id, chunk_index)
+);
+
+CREATE INDEX idx_upload_sessions_updated_at ON upload_sessions(updated_at);
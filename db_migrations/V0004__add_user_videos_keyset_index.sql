@@ -0,0 +1,6 @@
+-- Составной индекс под keyset-пагинацию списка лидов:
+-- WHERE user_id = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?
+CREATE INDEX idx_user_videos_user_created_id ON user_videos(user_id, created_at DESC, id DESC);
+
+-- Покрывается префиксом нового индекса
+DROP INDEX IF EXISTS idx_user_videos_user_id;
@@ -0,0 +1,6 @@
+-- Метаданные видео из заголовков контейнера (save-lead/media_probe.py);
+-- duration уже есть, заполняется теперь там же
+ALTER TABLE user_videos
+ADD COLUMN width integer,
+ADD COLUMN height integer,
+ADD COLUMN video_codec varchar(32);
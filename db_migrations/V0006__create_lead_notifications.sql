@@ -0,0 +1,17 @@
+-- Outbox уведомлений о новых лидах: строка пишется в той же транзакции,
+-- что и лид, а отправляет её в Telegram отдельный telegram-dispatcher
+
+CREATE TABLE lead_notifications (
+    id BIGSERIAL PRIMARY KEY,
+    lead_id INTEGER NOT NULL REFERENCES user_videos(id) ON DELETE CASCADE,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Выборка очереди диспетчером: только ожидающие, по времени следующей попытки
+CREATE INDEX idx_lead_notifications_pending ON lead_notifications(next_attempt_at) WHERE status = 'pending';
@@ -0,0 +1,11 @@
+-- Версия списка лидов пользователя для ETag в get-leads: save-lead
+-- увеличивает её в той же транзакции, что и вставку лида
+
+CREATE TABLE user_lead_stats (
+    user_id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO user_lead_stats (user_id, version)
+SELECT user_id, 1 FROM user_videos GROUP BY user_id;
@@ -0,0 +1,16 @@
+-- Счётчики лидов пользователя: save-lead обновляет их вместе со вставкой,
+-- расхождения чинит backend/save-lead/reconcile_stats.py
+
+ALTER TABLE user_lead_stats
+    ADD COLUMN lead_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN total_bytes BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN last_lead_at TIMESTAMP;
+
+UPDATE user_lead_stats s
+SET lead_count = v.lead_count, total_bytes = v.total_bytes, last_lead_at = v.last_lead_at
+FROM (
+    SELECT user_id, count(*) AS lead_count, COALESCE(sum(file_size), 0) AS total_bytes, max(created_at) AS last_lead_at
+    FROM user_videos
+    GROUP BY user_id
+) v
+WHERE s.user_id = v.user_id;
@@ -0,0 +1,8 @@
+-- Geohash координат лида (считается в save-lead при вставке) для геопоиска
+-- без PostGIS: ячейка = префикс, поэтому B-tree в побайтовом порядке ("C")
+-- отвечает на поиск по ячейке диапазоном. Старые лиды заполняет
+-- backend/save-lead/backfill_geohash.py
+
+ALTER TABLE user_videos ADD COLUMN geohash VARCHAR(12) COLLATE "C";
+
+CREATE INDEX idx_user_videos_user_geohash ON user_videos(user_id, geohash);
@@ -0,0 +1,11 @@
+-- Полнотекстовый поиск по комментариям лидов (get-leads?q=).
+-- btree_gin позволяет держать user_id в том же GIN-индексе: поиск пересекает
+-- списки пользователя и слов, а не перебирает совпадения всех пользователей.
+-- Добавление STORED-колонки переписывает таблицу - выполнять в тихое время.
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+ALTER TABLE user_videos
+    ADD COLUMN comments_tsv tsvector GENERATED ALWAYS AS (to_tsvector('russian', coalesce(comments, ''))) STORED;
+
+CREATE INDEX idx_user_videos_comments_tsv ON user_videos USING GIN (user_id, comments_tsv);
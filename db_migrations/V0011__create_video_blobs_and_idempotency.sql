@@ -0,0 +1,48 @@
+-- Дедупликация видео по SHA-256 со счётчиком ссылок и идемпотентные
+-- повторы save-lead по ключу клиента.
+-- ref_count увеличивает save-lead при вставке лида; уменьшает триггер,
+-- чтобы учитывались и каскадные удаления, которых приложение не видит.
+-- Объекты без ссылок удаляет `python blobs.py gc` после grace-периода.
+
+CREATE TABLE video_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    key TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    touched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_video_blobs_unreferenced ON video_blobs(touched_at) WHERE ref_count <= 0;
+
+ALTER TABLE user_videos
+    ADD COLUMN video_sha256 CHAR(64),
+    ADD COLUMN idempotency_key VARCHAR(200);
+
+CREATE UNIQUE INDEX ux_user_videos_idempotency_key ON user_videos(user_id, idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+-- Ключ объекта - videos/<sha256[:2]>/<sha256>
+UPDATE user_videos SET video_sha256 = substring(video_url FROM '[0-9a-f]{64}$')
+WHERE video_url IS NOT NULL;
+
+INSERT INTO video_blobs (sha256, key, size, ref_count)
+SELECT video_sha256, min(video_url), max(file_size), count(*)
+FROM user_videos
+WHERE video_sha256 IS NOT NULL
+GROUP BY video_sha256;
+
+CREATE FUNCTION release_video_blob() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE t_p80273517_video_feedback_app.video_blobs
+    SET ref_count = ref_count - 1, touched_at = CURRENT_TIMESTAMP
+    WHERE sha256 = OLD.video_sha256;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER user_videos_release_blob
+    AFTER DELETE ON user_videos
+    FOR EACH ROW
+    WHEN (OLD.video_url IS NOT NULL AND OLD.video_sha256 IS NOT NULL)
+    EXECUTE FUNCTION release_video_blob();
@@ -0,0 +1,9 @@
+-- Общий счётчик попыток входа по ключам "u:<логин>" и "ip:<адрес>" в окне
+-- фиксированной длины (window_id = unix_time / LOGIN_WINDOW_SECONDS).
+-- UNLOGGED: счётчики не пишутся в WAL, потеря после сбоя БД допустима.
+
+CREATE UNLOGGED TABLE login_throttle (
+    key TEXT PRIMARY KEY,
+    window_id BIGINT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
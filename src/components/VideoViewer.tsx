@@ -18,10 +18,13 @@ interface VideoViewerProps {
   video: Video;
   onClose: () => void;
   userId: number;
+  token: string;
 }
 
-const VideoViewer: React.FC<VideoViewerProps> = ({ video, onClose, userId }) => {
-  const [isLoading, setIsLoading] = useState(false);
+const GET_LEADS_URL = 'https://functions.poehali.dev/e21009da-4465-40ec-8df7-f3de39c8b10d';
+
+const VideoViewer: React.FC<VideoViewerProps> = ({ video, onClose, userId, token }) => {
+  const [isLoading, setIsLoading] = useState(true);
   const [videoData, setVideoData] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
 
@@ -30,42 +33,40 @@ const VideoViewer: React.FC<VideoViewerProps> = ({ video, onClose, userId }) =>
       // Если видео уже загружено
       setVideoData(`data:video/mp4;base64,${video.videoBase64}`);
     } else {
-      // Загружаем видео с сервера
+      // Плеер сам запрашивает нужные диапазоны (HTTP Range) по мере просмотра
       loadVideoFromServer();
     }
-  }, [video.id, userId]);
+  }, [video.id, userId, token]);
 
   const loadVideoFromServer = async () => {
     setIsLoading(true);
     setError(null);
-
     try {
-      const response = await fetch(`https://functions.poehali.dev/e21009da-4465-40ec-8df7-f3de39c8b10d?video_id=${video.id}`, {
-        method: 'GET',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': String(userId)
-        }
+      // <video> не передаёт заголовки, а сессионный токен в URL осел бы в логах и истории -
+      // в src идёт короткий токен, выданный только на это видео
+      const response = await fetch(`${GET_LEADS_URL}?video_id=${video.id}&stream_token=1`, {
+        headers: { 'X-Auth-Token': token }
       });
-
       if (!response.ok) {
-        throw new Error('Не удалось загрузить видео');
+        throw new Error(`stream_token: ${response.status}`);
       }
-
-      const data = await response.json();
-      if (data.videoBase64) {
-        setVideoData(`data:video/mp4;base64,${data.videoBase64}`);
-      } else {
-        throw new Error('Видео данные не найдены');
-      }
-    } catch (err) {
-      console.error('Ошибка загрузки видео:', err);
+      const { token: streamToken } = await response.json();
+      const lastWriteAt = localStorage.getItem(`last_write_at_${userId}`);
+      const fresh = lastWriteAt ? `&last_write_at=${encodeURIComponent(lastWriteAt)}` : '';
+      setVideoData(`${GET_LEADS_URL}?video_id=${video.id}&raw=1&token=${encodeURIComponent(streamToken)}${fresh}`);
+    } catch (loadError) {
+      console.error('Ошибка загрузки видео:', loadError);
       setError('Не удалось загрузить видео');
-    } finally {
       setIsLoading(false);
     }
   };
 
+  const handleVideoError = () => {
+    console.error('Ошибка загрузки видео:', video.id);
+    setError('Не удалось загрузить видео');
+    setIsLoading(false);
+  };
+
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleDateString('ru-RU', {
       year: 'numeric',
@@ -127,12 +128,14 @@ const VideoViewer: React.FC<VideoViewerProps> = ({ video, onClose, userId }) =>
                   </div>
                 )}
 
-                {videoData && !isLoading && !error && (
+                {videoData && !error && (
                   <video
                     src={videoData}
                     controls
-                    className="w-full h-full object-cover"
+                    className={`w-full h-full object-cover ${isLoading ? 'hidden' : ''}`}
                     preload="metadata"
+                    onLoadedMetadata={() => setIsLoading(false)}
+                    onError={handleVideoError}
                   >
                     Ваш браузер не поддерживает воспроизведение видео.
                   </video>
@@ -0,0 +1,120 @@
+const SAVE_LEAD_URL = 'https://functions.poehali.dev/ad81c32f-6f6d-4eca-9841-da0f99740909';
+const MAX_RETRIES = 5;
+
+export interface LeadFields {
+  filename: string;
+  original_filename: string;
+  comments: string;
+  latitude?: number;
+  longitude?: number;
+  // Один ключ на запись: повторная отправка вернёт уже сохранённый лид
+  idempotency_key?: string;
+}
+
+interface UploadState {
+  upload_id: string;
+  chunk_size: number;
+  next_chunk: number;
+  received_bytes: number;
+}
+
+const toHex = (buffer: ArrayBuffer) =>
+  Array.from(new Uint8Array(buffer)).map((b) => b.toString(16).padStart(2, '0')).join('');
+
+const toBase64 = (buffer: ArrayBuffer) => {
+  const bytes = new Uint8Array(buffer);
+  let binary = '';
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+};
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// 501 - загрузка частями выключена на сервере (нет blob-хранилища), повторять бесполезно
+const isTransient = (status: number) => status >= 500 && status !== 501;
+
+// Запрос к save-lead; сетевые ошибки и временные 5xx повторяются с экспоненциальной паузой
+const request = async (query: string, init: RequestInit, token: string) => {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(`${SAVE_LEAD_URL}?${query}`, {
+        ...init,
+        headers: { ...(init.headers || {}), 'X-Auth-Token': token },
+      });
+      if (!isTransient(response.status) || attempt >= MAX_RETRIES) {
+        return response;
+      }
+    } catch (error) {
+      if (attempt >= MAX_RETRIES) throw error;
+    }
+    await sleep(500 * 2 ** attempt);
+  }
+};
+
+/**
+ * Загружает видео частями (upload_init -> PUT частей -> upload_finalize).
+ * После обрыва связи докачивает с последней подтверждённой сервером части.
+ */
+export async function uploadVideoInChunks(
+  blob: Blob,
+  token: string,
+  lead: LeadFields,
+  onProgress?: (fraction: number) => void,
+) {
+  const initResponse = await request('action=upload_init', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: lead.filename, total_size: blob.size }),
+  }, token);
+  if (!initResponse.ok) {
+    throw new Error(`upload_init: ${initResponse.status}`);
+  }
+  let state: UploadState = await initResponse.json();
+  const uploadId = state.upload_id;
+
+  while (state.received_bytes < blob.size) {
+    const start = state.next_chunk * state.chunk_size;
+    const chunk = await blob.slice(start, start + state.chunk_size).arrayBuffer();
+    const checksum = toHex(await crypto.subtle.digest('SHA-256', chunk));
+
+    const response = await request(`upload_id=${uploadId}&chunk=${state.next_chunk}`, {
+      method: 'PUT',
+      headers: { 'Content-Type': 'text/plain', 'X-Chunk-Sha256': checksum },
+      body: toBase64(chunk),
+    }, token);
+
+    if (response.status === 409) {
+      // Сервер принял другую часть, чем мы думали - сверяемся и продолжаем
+      const statusResponse = await request(`upload_id=${uploadId}`, { method: 'GET' }, token);
+      if (!statusResponse.ok) throw new Error(`upload status: ${statusResponse.status}`);
+      state = { ...state, ...(await statusResponse.json()) };
+      continue;
+    }
+    if (!response.ok) {
+      throw new Error(`upload chunk: ${response.status}`);
+    }
+    state = { ...state, ...(await response.json()) };
+    onProgress?.(state.received_bytes / blob.size);
+  }
+
+  const finalize = () => request(`action=upload_finalize&upload_id=${uploadId}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(lead),
+  }, token);
+  let finalizeResponse = await finalize();
+  // 409 finalizing - видео ещё собирает предыдущий вызов (например, после
+  // таймаута на клиенте); ждём, пока он запишет лид или отпустит сессию
+  for (let attempt = 0; finalizeResponse.status === 409 && attempt < MAX_RETRIES; attempt++) {
+    const { status } = await finalizeResponse.clone().json().catch(() => ({}));
+    if (status !== 'finalizing') break;
+    await sleep(1000 * 2 ** attempt);
+    finalizeResponse = await finalize();
+  }
+  if (!finalizeResponse.ok) {
+    throw new Error(`upload_finalize: ${finalizeResponse.status}`);
+  }
+  return finalizeResponse.json();
+}
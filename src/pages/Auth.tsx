@@ -7,6 +7,8 @@ import { useToast } from "@/hooks/use-toast";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import Icon from '@/components/ui/icon';
 
+const AUTH_URL = 'https://functions.poehali.dev/7ecca539-d662-426e-ab1f-5a4509fc9524';
+
 interface AuthResponse {
   success: boolean;
   message: string;
@@ -48,84 +50,42 @@ const Auth = ({ onAuth }: AuthProps) => {
 
     setIsLoading(true);
 
-    // Имитация работы сервера
-    setTimeout(() => {
-      try {
-        if (action === 'register') {
-          // Проверяем, есть ли уже такой пользователь
-          const existingUsers = JSON.parse(localStorage.getItem('users') || '[]');
-          const userExists = existingUsers.find((u: any) => u.username === formData.username);
-          
-          if (userExists) {
-            toast({
-              title: "Ошибка",
-              description: "Пользователь с таким логином уже существует",
-              variant: "destructive"
-            });
-            setIsLoading(false);
-            return;
-          }
-
-          // Создаем нового пользователя
-          const newUser = {
-            id: Date.now(),
-            username: formData.username,
-            email: formData.email || null,
-            password: formData.password // В реальном приложении пароль нужно хэшировать
-          };
-
-          existingUsers.push(newUser);
-          localStorage.setItem('users', JSON.stringify(existingUsers));
-          
-          const token = `token_${newUser.id}_${Date.now()}`;
-          localStorage.setItem('user', JSON.stringify(newUser));
-          localStorage.setItem('token', token);
-
-          toast({
-            title: "Успешно!",
-            description: "Регистрация прошла успешно",
-          });
-
-          onAuth(newUser, token);
-          
-        } else if (action === 'login') {
-          // Ищем пользователя
-          const existingUsers = JSON.parse(localStorage.getItem('users') || '[]');
-          const user = existingUsers.find((u: any) => 
-            u.username === formData.username && u.password === formData.password
-          );
-          
-          if (!user) {
-            toast({
-              title: "Ошибка",
-              description: "Неверный логин или пароль",
-              variant: "destructive"
-            });
-            setIsLoading(false);
-            return;
-          }
-
-          const token = `token_${user.id}_${Date.now()}`;
-          localStorage.setItem('user', JSON.stringify(user));
-          localStorage.setItem('token', token);
-
-          toast({
-            title: "Успешно!",
-            description: "Вход выполнен успешно",
-          });
+    try {
+      const response = await fetch(AUTH_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ action, ...formData })
+      });
+      const data: AuthResponse = await response.json();
 
-          onAuth(user, token);
-        }
-      } catch (error) {
+      if (!response.ok || !data.success) {
         toast({
           title: "Ошибка",
-          description: "Произошла ошибка при обработке запроса",
+          description: data.error || "Неверный логин или пароль",
           variant: "destructive"
         });
-      } finally {
-        setIsLoading(false);
+        return;
       }
-    }, 1000); // Имитация задержки сервера
+
+      // Подписанный сервером токен: data-функции берут user id только из него
+      localStorage.setItem('user', JSON.stringify(data.user));
+      localStorage.setItem('token', data.token);
+
+      toast({
+        title: "Успешно!",
+        description: action === 'register' ? "Регистрация прошла успешно" : "Вход выполнен успешно",
+      });
+
+      onAuth(data.user, data.token);
+    } catch (error) {
+      toast({
+        title: "Ошибка",
+        description: "Произошла ошибка при обработке запроса",
+        variant: "destructive"
+      });
+    } finally {
+      setIsLoading(false);
+    }
   };
 
   return (
@@ -18,6 +18,10 @@ interface Video {
   comments: string;
   created_at: string;
   file_size?: number;
+  duration?: number | null;
+  width?: number | null;
+  height?: number | null;
+  video_codec?: string | null;
   latitude?: number;
   longitude?: number;
   videoBase64?: string;
@@ -30,24 +34,30 @@ interface DashboardProps {
   onStartRecording: () => void;
 }
 
-const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
+const Dashboard = ({ user, token, onLogout, onStartRecording }: DashboardProps) => {
   const [videos, setVideos] = useState<Video[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [selectedVideo, setSelectedVideo] = useState<Video | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const { toast } = useToast();
 
   useEffect(() => {
     fetchUserVideos();
   }, []);
 
-  const fetchUserVideos = async () => {
+  const fetchUserVideos = async (cursor?: string) => {
     try {
-      // Загружаем видео с сервера
-      const response = await fetch('https://functions.poehali.dev/e21009da-4465-40ec-8df7-f3de39c8b10d', {
+      // Загружаем видео с сервера постранично
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const lastWriteAt = localStorage.getItem(`last_write_at_${user.id}`);
+      const response = await fetch(`https://functions.poehali.dev/e21009da-4465-40ec-8df7-f3de39c8b10d${query}`, {
         method: 'GET',
         headers: {
           'Content-Type': 'application/json',
-          'X-User-Id': String(user.id)
+          'X-Auth-Token': token,
+          // Сразу после сохранения лида сервер читает с основной базы, а не с реплики
+          ...(lastWriteAt ? { 'X-Last-Write-At': lastWriteAt } : {})
         }
       });
 
@@ -56,7 +66,8 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
       }
 
       const data = await response.json();
-      setVideos(data.leads || []);
+      setVideos((prev) => cursor ? [...prev, ...(data.leads || [])] : (data.leads || []));
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Ошибка загрузки лидов:', error);
       toast({
@@ -64,7 +75,8 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
         description: "Не удалось загрузить видео с сервера",
         variant: "destructive"
       });
-      // Фолбэк к localStorage
+      // Фолбэк к localStorage (только для первой страницы)
+      if (cursor) return;
       try {
         const savedVideos = localStorage.getItem(`user_videos_${user.id}`);
         if (savedVideos) {
@@ -81,6 +93,13 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
     }
   };
 
+  const loadMoreVideos = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    await fetchUserVideos(nextCursor);
+    setIsLoadingMore(false);
+  };
+
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleDateString('ru-RU', {
       day: '2-digit',
@@ -91,6 +110,22 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
     });
   };
 
+  const formatVideoMeta = (video: Video) => {
+    const parts: string[] = [];
+    if (video.duration != null) {
+      const minutes = Math.floor(video.duration / 60);
+      const seconds = video.duration % 60;
+      parts.push(`${minutes}:${seconds.toString().padStart(2, '0')}`);
+    }
+    if (video.width && video.height) {
+      parts.push(`${video.width}×${video.height}`);
+    }
+    if (video.video_codec) {
+      parts.push(video.video_codec.toUpperCase());
+    }
+    return parts.join(' · ');
+  };
+
   return (
     <div className="min-h-screen !bg-white p-4" style={{backgroundColor: 'white'}}>
       <div className="max-w-6xl mx-auto">
@@ -209,6 +244,7 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
                         </p>
                         <p className="text-xs text-gray-500 mt-1">
                           {formatDate(video.created_at)}
+                          {formatVideoMeta(video) && ` · ${formatVideoMeta(video)}`}
                         </p>
                       </div>
                     </div>
@@ -228,6 +264,19 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
                     </div>
                   </div>
                 ))}
+                {nextCursor && (
+                  <div className="flex justify-center pt-2">
+                    <Button
+                      variant="outline"
+                      onClick={loadMoreVideos}
+                      disabled={isLoadingMore}
+                      className="bg-white border-gray-300 text-black hover:bg-gray-50"
+                    >
+                      {isLoadingMore && <Icon name="Loader2" className="w-4 h-4 mr-2 animate-spin" />}
+                      Показать ещё
+                    </Button>
+                  </div>
+                )}
               </div>
             )}
           </CardContent>
@@ -240,6 +289,7 @@ const Dashboard = ({ user, onLogout, onStartRecording }: DashboardProps) => {
           video={selectedVideo}
           onClose={() => setSelectedVideo(null)}
           userId={user.id}
+          token={token}
         />
       )}
     </div>
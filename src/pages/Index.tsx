@@ -6,6 +6,7 @@ import VideoRecorder from '@/components/VideoRecorder';
 import CommentForm from '@/components/CommentForm';
 import SuccessScreen from '@/components/SuccessScreen';
 import ProgressIndicator from '@/components/ProgressIndicator';
+import { uploadVideoInChunks, type LeadFields } from '@/lib/chunkedUpload';
 
 interface VideoRecordingState {
   isRecording: boolean;
@@ -36,6 +37,7 @@ const Index = () => {
   
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
   const chunksRef = useRef<Blob[]>([]);
+  const idempotencyKeysRef = useRef(new WeakMap<Blob, string>());
   
   // Проверяем авторизацию при загрузке
   useEffect(() => {
@@ -79,6 +81,55 @@ const Index = () => {
     chunksRef.current = [];
   };
 
+  const saveLeadInOneRequest = async (leadFields: LeadFields) => {
+    // Конвертируем blob в base64 для отправки на сервер
+    const videoBase64 = await new Promise<string>((resolve) => {
+      const reader = new FileReader();
+      reader.onload = () => resolve(reader.result as string);
+      reader.readAsDataURL(videoState.recordedBlob!);
+    });
+
+    // Данные для отправки на сервер
+    const leadData = { ...leadFields, videoBase64 };
+
+    setUploadProgress(30);
+
+    // Отправляем данные на сервер
+    console.log('Отправляю данные:', {
+      userId: user?.id || 1,
+      leadDataSize: leadData.videoBase64.length
+    });
+
+    const response = await fetch('https://functions.poehali.dev/ad81c32f-6f6d-4eca-9841-da0f99740909', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-Auth-Token': token
+      },
+      body: JSON.stringify(leadData)
+    });
+
+    setUploadProgress(70);
+
+    if (!response.ok) {
+      const errorText = await response.text();
+      console.error('Ошибка от сервера:', {
+        status: response.status,
+        statusText: response.statusText,
+        body: errorText
+      });
+      let errorData;
+      try {
+        errorData = JSON.parse(errorText);
+      } catch {
+        errorData = { error: errorText };
+      }
+      throw new Error(errorData.error || `Ошибка сохранения: ${response.status}`);
+    }
+
+    return response.json();
+  };
+
   const saveLead = useCallback(async () => {
     if (!comments.trim() || !videoState.recordedBlob) {
       return;
@@ -88,60 +139,37 @@ const Index = () => {
     setUploadProgress(0);
 
     try {
-      // Конвертируем blob в base64 для отправки на сервер
-      const videoBase64 = await new Promise<string>((resolve) => {
-        const reader = new FileReader();
-        reader.onload = () => resolve(reader.result as string);
-        reader.readAsDataURL(videoState.recordedBlob!);
-      });
-
-      // Данные для отправки на сервер
-      const leadData = {
+      const blob = videoState.recordedBlob;
+      if (!idempotencyKeysRef.current.has(blob)) {
+        idempotencyKeysRef.current.set(blob, crypto.randomUUID());
+      }
+      const leadFields = {
+        idempotency_key: idempotencyKeysRef.current.get(blob),
         filename: `lead-video-${Date.now()}.mp4`,
         original_filename: `video-${new Date().toLocaleDateString('ru-RU')}.mp4`,
         comments: comments,
-        videoBase64: videoBase64,
         latitude: location?.latitude,
         longitude: location?.longitude
       };
 
-      setUploadProgress(30);
-
-      // Отправляем данные на сервер
-      console.log('Отправляю данные:', {
-        userId: user?.id || 1,
-        leadDataSize: leadData.videoBase64.length
-      });
-
-      const response = await fetch('https://functions.poehali.dev/ad81c32f-6f6d-4eca-9841-da0f99740909', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-User-Id': String(user?.id || 1)
-        },
-        body: JSON.stringify(leadData)
-      });
-
-      setUploadProgress(70);
-
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error('Ошибка от сервера:', {
-          status: response.status,
-          statusText: response.statusText,
-          body: errorText
-        });
-        let errorData;
-        try {
-          errorData = JSON.parse(errorText);
-        } catch {
-          errorData = { error: errorText };
-        }
-        throw new Error(errorData.error || `Ошибка сохранения: ${response.status}`);
+      let result;
+      try {
+        // Загрузка частями: при обрыве связи продолжается с последней принятой части
+        result = await uploadVideoInChunks(
+          videoState.recordedBlob,
+          token,
+          leadFields,
+          (fraction) => setUploadProgress(Math.round(fraction * 90))
+        );
+      } catch (chunkError) {
+        console.warn('Загрузка частями недоступна, отправляем одним запросом:', chunkError);
+        result = await saveLeadInOneRequest(leadFields);
       }
-
-      const result = await response.json();
       console.log('Лид сохранен на сервере:', result);
+      // Список лидов ближайшие секунды читается с основной базы, а не с реплики
+      if (result?.created_at) {
+        localStorage.setItem(`last_write_at_${user?.id || 1}`, result.created_at);
+      }
       
       setUploadProgress(100);
 
@@ -161,7 +189,7 @@ const Index = () => {
         setUploadProgress(0);
       }, 1500);
     }
-  }, [comments, videoState.recordedBlob, location, user]);
+  }, [comments, videoState.recordedBlob, location, user, token]);
 
   const createNewLead = useCallback(() => {
     handleBackToDashboard();